@@ -7,9 +7,9 @@ from .models import User, RecentlySearch, UserPreference
 from core.response import StandardResponse
 import json
 from operations.models import PurchaseOrder, Consignment
-from portal.utils import get_all_fields
 from portal.choices import Role
 from portal.mixins import SearchAndFilterMixin
+from portal import search as search_index
 from datetime import datetime, timedelta, timezone
 
 
@@ -173,9 +173,7 @@ class GlobalSearchView(SearchAndFilterMixin, APIView):
         if id == "purchase_order":
             search = request.GET.get("q", "")
             queryset = PurchaseOrder.objects.filter(is_active=True).order_by("-created_at")
-            fields = get_all_fields(PurchaseOrder, ignore_fields=[], include_relational_fields=False)
-            if search:
-                queryset = self.apply_search(fields, queryset, search)
+            queryset = search_index.ranked(queryset, search) if search else queryset[:settings.SEARCH_RESULT_LIMIT]
             return Response(data=queryset.values("id", "reference_number"), status=200) 
             # return StandardResponse(
             #     success=True,
@@ -184,10 +182,8 @@ class GlobalSearchView(SearchAndFilterMixin, APIView):
             # )         
         elif id == "consignment":
             search = request.GET.get("q", "")
-            queryset = Consignment.objects.all()
-            fields = get_all_fields(Consignment, ignore_fields=[], include_relational_fields=False)
-            if search:
-                queryset = self.apply_search(fields, queryset, search)
+            queryset = Consignment.objects.order_by("-created_at")
+            queryset = search_index.ranked(queryset, search) if search else queryset[:settings.SEARCH_RESULT_LIMIT]
             return StandardResponse(data=queryset.values("id", "consignment_id"), status=200) 
         
         return StandardResponse(status=400, success=False, errors=["Invalid ID"])
\ No newline at end of file
@@ -3,6 +3,9 @@ from django.contrib.auth.models import AbstractUser
 from portal.choices import Role
 from portal.base import BaseModel
 from core.fields import MSSQLJSONField
+from core.principal_cache import invalidate_principal
+from core.recipients import invalidate_recipients
+from django.db.models.signals import post_save, post_delete
 
 class User(AbstractUser, BaseModel):
     role = models.CharField(max_length=20, choices=Role.choices)
@@ -30,6 +33,12 @@ class User(AbstractUser, BaseModel):
             models.Index(fields=['username'], name='user_username_idx'),  # For login queries
             models.Index(fields=['email'], name='user_email_idx'),  # For email lookups
         ]
+
+post_save.connect(invalidate_principal, sender=User)
+post_delete.connect(invalidate_principal, sender=User)
+post_save.connect(invalidate_recipients, sender=User)
+post_delete.connect(invalidate_recipients, sender=User)
+
     
 class UserPreference(BaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="preference")
@@ -0,0 +1,38 @@
+"""
+Version keys for caches invalidated by moving on rather than deleting.
+
+Entries are cached under the current version of whatever they were built
+from, and a change bumps the version so old entries are never read again
+and expire on their own. Versions are random, not counters: a version key
+evicted and recreated can never match an entry cached under the old one.
+"""
+from uuid import uuid4
+
+from django.db import transaction
+
+
+def current(cache, keys):
+    """Current version of each of `keys`, creating the missing ones."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        # add(), two processes racing on a miss agree on the first one
+        cache.add(key, uuid4().hex, None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, "") for key in keys]
+
+
+def _set(cache, keys):
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def bump(cache, keys):
+    """
+    Move `keys` to new versions, now and again on commit, so a request that
+    re-cached the old rows while the transaction was open doesn't keep them.
+    """
+    keys = list(keys)
+    if keys:
+        _set(cache, keys)
+        transaction.on_commit(lambda: _set(cache, keys))
@@ -50,7 +50,7 @@ def role_required(*allowed_roles: Union[str, Role, OperationUserRole]) -> Any:
             user_role = getattr(user, "role", None)
 
             if user_role == Role.OPERATIONS:
-                user = user.profile()
+                user = getattr(request, "this_profile", None) or user.profile()
                 user_role = user.access_level
 
             if user is None or user_role is None:
@@ -0,0 +1,273 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+from django.conf import settings
+
+
+class OpenSearchSink:
+    """Sends a batch of documents to OpenSearch with a single _bulk call."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def send(self, docs):
+        from .opensearch_client import client
+
+        lines = []
+        for doc in docs:
+            lines.append(json.dumps({"index": {"_index": self.index}}))
+            lines.append(json.dumps(doc, default=str))
+        result = client.bulk(body="\n".join(lines) + "\n")
+        if result.get("errors"):
+            failed = [item for item in result.get("items", []) if item.get("index", {}).get("error")]
+            raise RuntimeError(f"{len(failed)} documents rejected by OpenSearch")
+
+
+class FileSink:
+    """Appends documents as JSON lines, stands in for OpenSearch in tests and benchmarks."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, docs):
+        _append_jsonl(self.path, docs)
+
+
+def _append_jsonl(path, docs):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str) + "\n")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class LogShipper:
+    """
+    Bounded in-process queue drained by a daemon thread.
+
+    Documents are sent in batches once `batch_size` is reached or
+    `flush_interval` seconds have passed. When the queue is full new documents
+    are dropped and counted, and batches the sink fails to accept are spooled
+    to a local JSONL file for replay_spool().
+    """
+
+    def __init__(self, sink, spool_path, max_queue=10000, batch_size=500, flush_interval=2.0):
+        self.sink = sink
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.counters = {"enqueued": 0, "sent": 0, "dropped": 0, "failed": 0, "spooled": 0}
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, queued=self.queue.qsize())
+
+    def start(self):
+        # A forked worker inherits the object but not the thread
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+        try:
+            self.requeue_replays()
+        except Exception as e:
+            print("OpenSearch log spool error:", e)
+
+    def submit(self, doc):
+        self.start()
+        try:
+            self.queue.put_nowait(doc)
+            self._count("enqueued")
+        except queue.Full:
+            self._count("dropped")
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            if batch:
+                self._ship(batch)
+
+    def _ship(self, batch):
+        try:
+            self.sink.send(batch)
+            self._count("sent", len(batch))
+        except Exception as e:
+            self._count("failed", len(batch))
+            print("OpenSearch log error:", e)
+            self._spool(batch)
+
+    def _spool(self, batch):
+        try:
+            _append_jsonl(self.spool_path, batch)
+            self._count("spooled", len(batch))
+        except Exception as e:
+            self._count("dropped", len(batch))
+            print("OpenSearch log spool error:", e)
+
+    def flush(self):
+        """Ship everything currently queued from the calling thread."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._ship(batch)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def requeue_replays(self):
+        """
+        Append the documents of replays that died half way, whose process is
+        gone, back to the spool for the next replay_spool(). Returns the
+        number of replay files requeued.
+        """
+        with self._replay_lock:
+            return self._requeue_replays()
+
+    def _requeue_replays(self):
+        requeued = 0
+        for path in glob.glob(f"{glob.escape(self.spool_path)}.*.replay"):
+            pid = path[len(self.spool_path) + 1:-len(".replay")].split(".")[0]
+            # This process's own replays are done while the replay lock is held
+            if not pid.isdigit() or (int(pid) != os.getpid() and _pid_alive(int(pid))):
+                continue
+
+            # Claimed first, another process starting up may have found it too.
+            # Still a replay file, a crash while copying leaves it to the next run.
+            claimed = f"{self.spool_path}.{os.getpid()}.requeue.replay"
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, "rb") as src, open(self.spool_path, "ab") as dst:
+                if dst.tell():
+                    # The spool's last line may be cut short by a crash too
+                    dst.write(b"\n")
+                shutil.copyfileobj(src, dst)
+            os.remove(claimed)
+            requeued += 1
+        return requeued
+
+    def replay_spool(self):
+        """
+        Re-send spooled documents. The spool is moved aside first so new
+        failures during the replay are spooled again instead of lost, and
+        the leftovers of a replay that died are picked up again first.
+        Returns the number of documents sent.
+        """
+        with self._replay_lock:
+            self._requeue_replays()
+            if not os.path.exists(self.spool_path):
+                return 0
+
+            replay_path = f"{self.spool_path}.{os.getpid()}.replay"
+            os.replace(self.spool_path, replay_path)
+
+            sent = 0
+            batch = []
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError:
+                        # Written half way when the process died
+                        self._count("dropped")
+                        continue
+                    if len(batch) >= self.batch_size:
+                        sent += self._replay_batch(batch)
+                        batch = []
+            if batch:
+                sent += self._replay_batch(batch)
+
+            os.remove(replay_path)
+            return sent
+
+    def _replay_batch(self, batch):
+        try:
+            self.sink.send(batch)
+            self._count("sent", len(batch))
+            return len(batch)
+        except Exception:
+            self._spool(batch)
+            return 0
+
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
+
+def build_sink():
+    backend = getattr(settings, "OPENSEARCH_LOG_BACKEND", "opensearch")
+    if backend == "file":
+        return FileSink(getattr(settings, "OPENSEARCH_LOG_FILE", os.path.join(settings.BASE_DIR, "logs", "api-logs.jsonl")))
+    return OpenSearchSink(getattr(settings, "OPENSEARCH_LOG_INDEX", "django-api-logs"))
+
+
+def get_shipper():
+    global _shipper
+    if _shipper is None:
+        with _shipper_lock:
+            if _shipper is None:
+                _shipper = LogShipper(
+                    sink=build_sink(),
+                    spool_path=getattr(settings, "OPENSEARCH_LOG_SPOOL", os.path.join(settings.BASE_DIR, "logs", "api-logs.spool.jsonl")),
+                    max_queue=getattr(settings, "OPENSEARCH_LOG_QUEUE_SIZE", 10000),
+                    batch_size=getattr(settings, "OPENSEARCH_LOG_BATCH_SIZE", 500),
+                    flush_interval=getattr(settings, "OPENSEARCH_LOG_FLUSH_INTERVAL", 2.0),
+                )
+                atexit.register(_shipper.stop)
+    return _shipper
@@ -1,14 +1,13 @@
 import jwt
 from django.conf import settings
 from accounts.models import User
+from .principal_cache import get_principal
+from .notification_state import has_notification
 from django.http import JsonResponse
 from portal.choices import Role
 import time
 from django.utils.deprecation import MiddlewareMixin
 # from .opensearch_client import client
-from rest_framework.response import Response as DRFResponse
-import json
-# from .opensearch_client import client
 
 class AuthMiddleware:
     MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB
@@ -41,15 +40,11 @@ class AuthMiddleware:
               
             
             try:
-                jwt_data = jwt.decode(
-                    token,
-                    settings.JWT_SECRET,
-                    algorithms=[settings.JWT_ALGORITHM]
-                )
-
-                user_obj = User.objects.get(id=jwt_data.get("user_id"),is_active=True)
+                jwt_data, user_obj, profile = get_principal(token)
                 request.this_user = user_obj
-                request.has_notif = user_obj.has_notif
+                request.this_profile = profile
+                request.has_notif = has_notification(user_obj.pk)
+                request.response_meta = {"has_notification": request.has_notif}
                 
                 # user_data = {"user_id": user_obj.id, "role": user_obj.role}
                 
@@ -73,58 +68,25 @@ class AuthMiddleware:
                 # request.this_user_data = user_data 
 
                 response = self.get_response(request)
-
-                # Append has_notification to JSON responses when available
-                try:
-                    has_notification = bool(getattr(request, "has_notif", False))
-                    if isinstance(response, DRFResponse):
-                        if isinstance(response.data, dict):
-                            response.data["has_notification"] = has_notification
-                            # If already rendered by DRF, re-render to persist changes
-                            if getattr(response, "is_rendered", False):
-                                response._is_rendered = False
-                                response.render()
-                    elif isinstance(response, JsonResponse):
-                        try:
-                            payload = json.loads(response.content)
-                            if isinstance(payload, dict):
-                                payload["has_notification"] = has_notification
-                                response.content = json.dumps(payload).encode("utf-8")
-                                if "Content-Length" in response:
-                                    response["Content-Length"] = str(len(response.content))
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
-
-                return response
+                return self.add_response_meta(request, response)
 
             except (jwt.exceptions.InvalidSignatureError, User.DoesNotExist):
                 return JsonResponse(data={"msg": "Invalid token"}, status=440)
             except jwt.exceptions.ExpiredSignatureError:
                 return JsonResponse(data={"msg": "Session Expired"}, status=440)
 
+        request.response_meta = {"has_notification": False}
         response = self.get_response(request)
-        try:
-            has_notification = bool(getattr(request, "has_notif", False))
-            if isinstance(response, DRFResponse):
-                if isinstance(response.data, dict):
-                    response.data["has_notification"] = has_notification
-                    if getattr(response, "is_rendered", False):
-                        response._is_rendered = False
-                        response.render()
-            elif isinstance(response, JsonResponse):
-                try:
-                    payload = json.loads(response.content)
-                    if isinstance(payload, dict):
-                        payload["has_notification"] = has_notification
-                        response.content = json.dumps(payload).encode("utf-8")
-                        if "Content-Length" in response:
-                            response["Content-Length"] = str(len(response.content))
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        return self.add_response_meta(request, response)
+
+    @staticmethod
+    def add_response_meta(request, response):
+        """
+        DRF responses get response_meta in their body from EnvelopeJSONRenderer
+        while they render; the flag is also sent as a header for every other response.
+        """
+        has_notification = request.response_meta["has_notification"]
+        response["X-Has-Notification"] = "true" if has_notification else "false"
         return response
 
 
@@ -136,16 +98,16 @@ class AuthMiddleware:
 import time
 import json
 from django.utils.deprecation import MiddlewareMixin
-from .opensearch_client import client
+from .log_shipper import get_shipper
 
 class OpenSearchLoggingMiddleware(MiddlewareMixin):
-    INDEX = "django-api-logs"
+    MAX_BODY_CHARS = 2000
 
     def process_request(self, request):
         request._start = time.time()
         try:
             raw = request.body               # this is still bytes
-            request._body_text = raw.decode("utf-8")
+            request._body_text = raw[:self.MAX_BODY_CHARS * 4].decode("utf-8", errors="ignore")[:self.MAX_BODY_CHARS]
         except Exception:
             request._body_text = ""
 
@@ -161,18 +123,15 @@ class OpenSearchLoggingMiddleware(MiddlewareMixin):
             "client_ip": request.META.get("REMOTE_ADDR"),
             "request": {
                 # use the text you saved, not request._body
-                "body": request._body_text,
+                "body": getattr(request, "_body_text", ""),
             },
             "response": {
-                "body": getattr(response, "content", b"")[:2000]
+                "body": getattr(response, "content", b"")[:self.MAX_BODY_CHARS]
                                    .decode("utf-8", errors="ignore")
             }
         }
-        try:
-            client.index(index=self.INDEX, body=doc)
-        except Exception as e:
-            # this will now only fire on genuine connection/indexing errors
-            print("OpenSearch log error:", e)
+        # Queued for the background shipper, never blocks the worker on OpenSearch
+        get_shipper().submit(doc)
         return response
     
 
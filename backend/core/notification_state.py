@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _cache():
+    return caches[getattr(settings, "PRINCIPAL_CACHE_ALIAS", "default")]
+
+
+def _unread_key(user_id):
+    return f"notif:user:{user_id}:unread"
+
+
+def unread_count(user_id):
+    """
+    Number of unread notifications of a user, served from the cache. A miss
+    counts the user's UserNotification rows once.
+    """
+    from portal.models import UserNotification
+
+    cache = _cache()
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = UserNotification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(key, count, getattr(settings, "NOTIFICATION_UNREAD_TTL", 60))
+    return count
+
+
+def has_notification(user_id):
+    """The bell flag, lit while the user has unread notifications."""
+    return unread_count(user_id) > 0
+
+
+def _drop_counts(user_ids):
+    _cache().delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def invalidate_unread(user_ids):
+    """
+    Drop the cached unread counts of the given users after their
+    notifications were added or marked read. Dropped again on commit so a
+    request that recounted while the transaction was open doesn't keep
+    the old count.
+    """
+    user_ids = list({user_id for user_id in user_ids if user_id})
+    if user_ids:
+        _drop_counts(user_ids)
+        transaction.on_commit(lambda: _drop_counts(user_ids))
@@ -7,6 +7,7 @@ OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOST", "127.0.0.1")
 OPENSEARCH_PORT = int(os.getenv("OPENSEARCH_PORT", 9200))
 OPENSEARCH_USER = os.getenv("OPENSEARCH_USER", "admin")
 OPENSEARCH_PASS = os.getenv("OPENSEARCH_PASS", "Bismillah@123")
+OPENSEARCH_TIMEOUT = int(os.getenv("OPENSEARCH_TIMEOUT", 10))
 
 print(OPENSEARCH_HOST)
 client = OpenSearch(
@@ -15,5 +16,5 @@ client = OpenSearch(
     use_ssl=False,
     verify_certs=False,                 # set True and point to CA if you have one
     connection_class=RequestsHttpConnection,
-    timeout=30
+    timeout=OPENSEARCH_TIMEOUT
 )
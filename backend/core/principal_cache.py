@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+
+from . import cache_versions
+
+
+PROFILE_RELATIONS = ("operations_profile", "supplier_profile", "client_profile")
+
+
+def _cache():
+    return caches[getattr(settings, "PRINCIPAL_CACHE_ALIAS", "default")]
+
+
+def _token_key(token):
+    return "principal:token:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _version_key(user_id):
+    return f"principal:user:{user_id}:version"
+
+
+def _user_version(cache, user_id):
+    return cache_versions.current(cache, [_version_key(user_id)])[0]
+
+
+def _load_principal(token):
+    from accounts.models import User
+
+    claims = jwt.decode(
+        token,
+        settings.JWT_SECRET,
+        algorithms=[settings.JWT_ALGORITHM]
+    )
+
+    # One query for the user and whichever profile the role points at
+    user = User.objects.select_related(*PROFILE_RELATIONS).get(id=claims.get("user_id"), is_active=True)
+    try:
+        profile = user.profile()
+    except ObjectDoesNotExist:
+        profile = None
+
+    return claims, user, profile
+
+
+def get_principal(token):
+    """
+    Resolve a bearer token to (claims, user, profile).
+
+    Hits are served from the cache keyed by the token digest; misses decode the
+    token and load the user with its profile in one query. Raises the same jwt
+    exceptions and User.DoesNotExist as the uncached path.
+    """
+    cache = _cache()
+    token_key = _token_key(token)
+    entry = cache.get(token_key)
+
+    if entry is not None:
+        exp = entry["claims"].get("exp")
+        if exp is not None and exp <= time.time():
+            cache.delete(token_key)
+            raise jwt.exceptions.ExpiredSignatureError("Signature has expired")
+
+        if entry["version"] == _user_version(cache, entry["user"].pk):
+            return entry["claims"], entry["user"], entry["profile"]
+
+    claims, user, profile = _load_principal(token)
+
+    timeout = getattr(settings, "PRINCIPAL_CACHE_TTL", 300)
+    exp = claims.get("exp")
+    if exp is not None:
+        timeout = min(timeout, int(exp - time.time()))
+
+    if timeout > 0:
+        cache.set(token_key, {
+            "claims": claims,
+            "user": user,
+            "profile": profile,
+            "version": _user_version(cache, user.pk),
+        }, timeout)
+
+    return claims, user, profile
+
+
+def invalidate_users(user_ids):
+    """Drop every cached principal belonging to the given users."""
+    cache_versions.bump(_cache(), [_version_key(user_id) for user_id in user_ids if user_id])
+
+
+def invalidate_principal(sender, instance, **kwargs):
+    """
+    post_save/post_delete receiver for User and the role profiles.
+    """
+    from accounts.models import User
+
+    user_id = instance.pk if isinstance(instance, User) else getattr(instance, "user_id", None)
+    invalidate_users([user_id])
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from . import cache_versions
+
+
+## User fields a save has to touch to change who receives what
+USER_FIELDS = {"role", "is_active"}
+
+
+def _cache():
+    return caches[getattr(settings, "PRINCIPAL_CACHE_ALIAS", "default")]
+
+
+_VERSION_KEY = "recipients:version"
+
+
+def _cached(cache, version, key, load):
+    key = f"recipients:{version}:{key}"
+    user_ids = cache.get(key)
+    if user_ids is None:
+        user_ids = load()
+        cache.set(key, user_ids, getattr(settings, "RECIPIENT_CACHE_TTL", 300))
+    return user_ids
+
+
+def _role_user_ids(roles, ops_roles):
+    from django.db.models import Q
+    from accounts.models import User
+
+    filters = Q()
+    if roles:
+        filters |= Q(role__in=roles)
+    if ops_roles:
+        filters |= Q(operations_profile__access_level__in=ops_roles)
+    if not filters:
+        return []
+    return sorted(str(pk) for pk in User.objects.filter(filters).values_list("id", flat=True).distinct())
+
+
+def _profile_user_ids(model, **lookup):
+    return sorted(str(pk) for pk in model.objects.filter(**lookup).values_list("user_id", flat=True))
+
+
+def resolve(roles=None, ops_roles=None, supplier_id=None, client_id=None):
+    """
+    Ids of the users with any of `roles` or operations access levels
+    `ops_roles`, plus the users of `supplier_id` and `client_id`. Each set is
+    cached on its own until a user's role or a role profile changes, so the
+    same sets are shared by every event that notifies them.
+    """
+    from entities.models import ClientUser, SupplierUser
+
+    cache = _cache()
+    version = cache_versions.current(cache, [_VERSION_KEY])[0]
+    roles, ops_roles = sorted(roles or []), sorted(ops_roles or [])
+
+    user_ids = list(_cached(
+        cache, version, f"roles:{','.join(roles)}:ops:{','.join(ops_roles)}",
+        lambda: _role_user_ids(roles, ops_roles),
+    ))
+    if supplier_id:
+        user_ids += _cached(cache, version, f"supplier:{supplier_id}", lambda: _profile_user_ids(SupplierUser, supplier_id=supplier_id))
+    if client_id:
+        user_ids += _cached(cache, version, f"client:{client_id}", lambda: _profile_user_ids(ClientUser, client_id=client_id))
+    return list(dict.fromkeys(user_ids))
+
+
+def invalidate_recipients(sender, instance, update_fields=None, **kwargs):
+    """
+    post_save/post_delete receiver for User and the role profiles, moves
+    every cached set to a new version.
+    """
+    from accounts.models import User
+
+    if isinstance(instance, User) and update_fields is not None and not USER_FIELDS & set(update_fields):
+        # e.g. last_login on every sign in
+        return
+    cache_versions.bump(_cache(), [_VERSION_KEY])
@@ -0,0 +1,16 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class EnvelopeJSONRenderer(JSONRenderer):
+    """
+    Adds the request-scoped metadata collected in `request.response_meta`
+    (e.g. has_notification, set by AuthMiddleware) to dict payloads as they
+    are rendered, so responses are serialized once and never re-parsed.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        request = (renderer_context or {}).get("request")
+        meta = getattr(request, "response_meta", None)
+        if meta and isinstance(data, dict):
+            data = {**data, **meta}
+        return super().render(data, accepted_media_type, renderer_context)
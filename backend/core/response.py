@@ -9,7 +9,8 @@ class StandardResponse(Response):
         'message': str,
         'data': any,
         'errors': list,
-        'has_notification': bool | None
+        'has_notification': bool | None,
+        'next_cursor': str   (cursor paginated lists only)
     }
     """
 
@@ -20,6 +21,7 @@ class StandardResponse(Response):
                  count=None,
                  errors=None,
                  has_notification=None,
+                 next_cursor=None,
                  status=None,
                  template_name=None,
                  headers=None,
@@ -36,6 +38,8 @@ class StandardResponse(Response):
             'errors': errors,
             'has_notification': has_notification
         }
+        if next_cursor is not None:
+            response_data['next_cursor'] = next_cursor
 
         super().__init__(data=response_data,
                          status=status,
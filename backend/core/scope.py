@@ -0,0 +1,62 @@
+from django.conf import settings
+
+from core.principal_cache import _cache, _user_version, invalidate_users
+from portal.choices import Role
+
+
+def _scope_key(user_id, version):
+    return f"scope:user:{user_id}:{version}"
+
+
+def _load_scope(user):
+    profile = user.profile()
+    return {
+        "storerkey_ids": sorted(str(pk) for pk in profile.storerkeys.values_list("id", flat=True)) if profile else [],
+        "supplier_id": profile.supplier_id if profile and user.role == Role.SUPPLIER_USER else None,
+        "client_id": profile.client_id if profile and user.role == Role.CLIENT_USER else None,
+    }
+
+
+def get_scope(user):
+    """
+    The ids a user's lists are scoped to, {"storerkey_ids", "supplier_id",
+    "client_id"}. Cached under the user's principal version, so anything
+    that invalidates the principal (profile edits, storerkey assignments)
+    drops it as well.
+    """
+    if user is None or not user.is_authenticated:
+        return {"storerkey_ids": [], "supplier_id": None, "client_id": None}
+
+    cache = _cache()
+    key = _scope_key(user.pk, _user_version(cache, user.pk))
+    scope = cache.get(key)
+    if scope is None:
+        scope = _load_scope(user)
+        cache.set(key, scope, getattr(settings, "PRINCIPAL_CACHE_TTL", 300))
+    return scope
+
+
+def _m2m_field(profile_model, through):
+    for field in profile_model._meta.many_to_many:
+        if field.remote_field.through is through:
+            return field.name
+
+
+def invalidate_scope(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    m2m_changed receiver for the storerkeys of the role profiles,
+    which don't send post_save. Works from either side of the relation.
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        invalidate_users([instance.user_id])
+        return
+
+    # instance is the storerkey/supplier, model the profile class
+    if action == "pre_clear":
+        profiles = model.objects.filter(**{_m2m_field(model, sender): instance})
+    else:
+        profiles = model.objects.filter(pk__in=pk_set or [])
+    invalidate_users(list(profiles.values_list("user_id", flat=True)))
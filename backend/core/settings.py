@@ -1,6 +1,7 @@
 from pathlib import Path
 from environ import environ
 import os
+import tempfile
 
 env = environ.Env()
 environ.Env.read_env()
@@ -180,6 +181,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_HEADERS = ["*",]
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ORIGINS_WHITELIST = []
+CORS_EXPOSE_HEADERS = ["X-Has-Notification"]
+
+## has_notification is added to DRF payloads while they render, see core.renderers
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.EnvelopeJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
 CSRF_TRUSTED_ORIGINS = []
 # LOGGING = {
 #     "version": 1,
@@ -230,6 +240,107 @@ if not DEBUG:
         # },
     }
 
+REDIS_URL = env("REDIS_URL", default="")
+
+## Shared cache, falls back to per-process local memory when Redis is not configured
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "portal-default",
+        }
+    }
+
+## LOV dropdown cache (portal.lov_cache). Without Redis it is a file cache in LOV_CACHE_DIR,
+## so the version bumps invalidating it are seen by every worker on the host, not just one.
+## Hosts don't share it, run Redis when the workers span several.
+LOV_CACHE_DIR = env("LOV_CACHE_DIR", default=os.path.join(tempfile.gettempdir(), "portal-lov-cache"))
+LOV_CACHE_ALIAS = "default"
+if not REDIS_URL:
+    CACHES["lov"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": LOV_CACHE_DIR,
+    }
+    LOV_CACHE_ALIAS = "lov"
+
+## Seconds an authenticated principal stays cached. Local memory is not shared
+## between workers, so keep it short there as it bounds cross-worker staleness.
+PRINCIPAL_CACHE_TTL = env.int("PRINCIPAL_CACHE_TTL", default=300 if REDIS_URL else 60)
+
+## Cached unread notification count per user (core.notification_state), same staleness bound as the principal
+NOTIFICATION_UNREAD_TTL = env.int("NOTIFICATION_UNREAD_TTL", default=PRINCIPAL_CACHE_TTL)
+
+## Cached notification recipient sets per role / supplier / client (core.recipients), dropped on any user or profile change
+RECIPIENT_CACHE_TTL = env.int("RECIPIENT_CACHE_TTL", default=PRINCIPAL_CACHE_TTL)
+
+## List grid totals are served from cache and recounted in the background once older than FRESH
+LIST_COUNT_FRESH = env.int("LIST_COUNT_FRESH", default=30)
+LIST_COUNT_TTL = env.int("LIST_COUNT_TTL", default=600)
+
+## Global search goes through portal.search documents. SEARCH_BACKEND=auto picks the database's
+## text index (pg_trgm, SQLite FTS5) and LIKE on SQL Server, "fulltext" opts into SQL Server
+## full-text (word prefix matches only) where the index exists, "like" skips the index
+SEARCH_BACKEND = env("SEARCH_BACKEND", default="auto")
+SEARCH_RESULT_LIMIT = env.int("SEARCH_RESULT_LIMIT", default=50)
+
+## API request logs, shipped to OpenSearch in batches by core.log_shipper
+## Set OPENSEARCH_LOG_BACKEND=file to write JSON lines locally instead
+OPENSEARCH_LOG_BACKEND = env("OPENSEARCH_LOG_BACKEND", default="opensearch")
+OPENSEARCH_LOG_INDEX = "django-api-logs"
+OPENSEARCH_LOG_FILE = env("OPENSEARCH_LOG_FILE", default=os.path.join(BASE_DIR, "logs", "api-logs.jsonl"))
+OPENSEARCH_LOG_SPOOL = env("OPENSEARCH_LOG_SPOOL", default=os.path.join(BASE_DIR, "logs", "api-logs.spool.jsonl"))
+OPENSEARCH_LOG_QUEUE_SIZE = env.int("OPENSEARCH_LOG_QUEUE_SIZE", default=10000)
+OPENSEARCH_LOG_BATCH_SIZE = env.int("OPENSEARCH_LOG_BATCH_SIZE", default=500)
+OPENSEARCH_LOG_FLUSH_INTERVAL = env.float("OPENSEARCH_LOG_FLUSH_INTERVAL", default=2.0)
+
+## Background job runner (operations.other_services.job_runner, background_task command)
+## JOB_RUNNER_BACKEND=celery hands claimed jobs to the Celery workers instead of local processes
+JOB_RUNNER_BACKEND = env("JOB_RUNNER_BACKEND", default="local")
+JOB_RUNNER_WORKERS = env.int("JOB_RUNNER_WORKERS", default=4)
+JOB_HEARTBEAT_INTERVAL = env.int("JOB_HEARTBEAT_INTERVAL", default=30)
+JOB_STALE_AFTER = env.int("JOB_STALE_AFTER", default=300)
+## Jobs handed to Celery have no heartbeat until a worker starts them, recovered after this long in the queue
+JOB_QUEUED_STALE_AFTER = env.int("JOB_QUEUED_STALE_AFTER", default=6 * 3600)
+JOB_RETRY_BACKOFF = env.int("JOB_RETRY_BACKOFF", default=60)
+JOB_CLEANUP_TIMEOUT = env.int("JOB_CLEANUP_TIMEOUT", default=600)
+JOB_PO_IMPORT_TIMEOUT = env.int("JOB_PO_IMPORT_TIMEOUT", default=3600)
+JOB_REPORT_TIMEOUT = env.int("JOB_REPORT_TIMEOUT", default=1800)
+JOB_ERP_EXPORT_TIMEOUT = env.int("JOB_ERP_EXPORT_TIMEOUT", default=600)
+JOB_REMINDER_TIMEOUT = env.int("JOB_REMINDER_TIMEOUT", default=900)
+JOB_AUDIT_ARCHIVE_TIMEOUT = env.int("JOB_AUDIT_ARCHIVE_TIMEOUT", default=3600)
+
+## Expediting reminders: a reminder still goes out if its threshold was crossed within this many days (missed runs)
+EXPEDITING_REMINDER_GRACE_DAYS = env.int("EXPEDITING_REMINDER_GRACE_DAYS", default=7)
+
+## Audit trail archive (operations.other_services.audit_archive), run by the audit_archive job:
+## trails of delivered / cancelled / closed objects untouched for this many days move to the archive tables
+AUDIT_ARCHIVE_RETENTION_DAYS = env.int("AUDIT_ARCHIVE_RETENTION_DAYS", default=180)
+AUDIT_ARCHIVE_BATCH_SIZE = env.int("AUDIT_ARCHIVE_BATCH_SIZE", default=1000)
+
+## Outbound ERP export (operations.other_services.erp_outbox), drained by the erp_export job
+## ERP_EXPORT_SINK is oracle, sqlite, file or the dotted path of a sink class
+ERP_EXPORT_ENABLED = env.bool("ERP_EXPORT_ENABLED", default=False)
+ERP_EXPORT_SINK = env("ERP_EXPORT_SINK", default="oracle")
+ERP_EXPORT_STATUSES = env.list("ERP_EXPORT_STATUSES", default=["Pickup Completed"])
+ERP_EXPORT_BATCH_SIZE = env.int("ERP_EXPORT_BATCH_SIZE", default=500)
+ERP_EXPORT_MAX_ATTEMPTS = env.int("ERP_EXPORT_MAX_ATTEMPTS", default=8)
+ERP_EXPORT_RETRY_BACKOFF = env.int("ERP_EXPORT_RETRY_BACKOFF", default=60)
+ERP_EXPORT_SQLITE_PATH = env("ERP_EXPORT_SQLITE_PATH", default=os.path.join(BASE_DIR, "erp_export.sqlite3"))
+ERP_EXPORT_FILE = env("ERP_EXPORT_FILE", default=os.path.join(BASE_DIR, "logs", "erp-export.jsonl"))
+ERP_SHIPPING_MAPPING_TABLE = env("ERP_SHIPPING_MAPPING_TABLE", default="ads_po_shipping_mapping_stg")
+ERP_ORACLE_USER = env("ERP_ORACLE_USER", default="")
+ERP_ORACLE_PASSWORD = env("ERP_ORACLE_PASSWORD", default="")
+ERP_ORACLE_DSN = env("ERP_ORACLE_DSN", default="")     ## e.g. 10.0.5.152:1521/ebs_TESTAPP
+ERP_ORACLE_LIB_DIR = env("ERP_ORACLE_LIB_DIR", default=None)
+ERP_ORACLE_POOL_MAX = env.int("ERP_ORACLE_POOL_MAX", default=4)
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
@@ -14,6 +14,8 @@ from accounts.models import User
 from portal.choices import Role, OperationUserRole
 from portal.mixins import SearchAndFilterMixin, PaginationMixin
 from core.decorators import role_required
+from portal.bulk_import import BulkImporter
+from .import_specs import MATERIAL_MASTER
 
 class HubView(SearchAndFilterMixin, PaginationMixin, APIView):
 
@@ -1038,51 +1040,13 @@ class MaterialMasterAPI(APIView,PaginationMixin,SearchAndFilterMixin):
 
 class MaterialMasterBulkImportAPI(APIView):
     @role_required(OperationUserRole.L1)
-    @transaction.atomic()
     def post(self, request, *args, **kwargs):
         data = request.data.get("data", [])
         if not isinstance(data, list) or not data:
             return StandardResponse(status=400, success=False, errors=["Invalid or empty data payload"])
 
-        storerkey_codes = {item.get("storerkey") for item in data}
-        hub_codes = {item.get("hub") for item in data}
-
-        storerkeys = {sk.storerkey_code: sk for sk in StorerKey.objects.filter(storerkey_code__in=storerkey_codes)}
-        hubs = {h.hub_code: h for h in Hub.objects.filter(hub_code__in=hub_codes)}
-
-        valid_items = []
-        errors = []
-
-        for idx, item in enumerate(data):
-            index = idx + 1
-            sk_code = item.get("storerkey")
-            hub_code = item.get("hub")
-
-            storerkey = storerkeys.get(sk_code)
-            hub = hubs.get(hub_code)
-
-            if not storerkey:
-                errors.append(f"Item {index}: Invalid storerkey '{sk_code}'")
-                continue
-
-            if not hub:
-                errors.append(f"Item {index}: Invalid hub '{hub_code}'")
-                continue
+        report = BulkImporter(MATERIAL_MASTER).run(data)
+        if report.errors:
+            return StandardResponse(status=400, success=False, errors=report.messages(), data=report.as_dict())
 
-            if storerkey.hub_id != hub.id:
-                errors.append(f"Item {index}: Storerkey '{sk_code}' does not belong to hub '{hub_code}'")
-                continue
-
-            item["storerkey"] = storerkey.id
-            item["hub"] = hub.id
-            valid_items.append(item)
-
-        if errors:
-            return StandardResponse(status=400, success=False, errors=errors)
-
-        serializer = MaterialSerializer(data=valid_items, many=True)
-        if not serializer.is_valid():
-            return StandardResponse(status=400, success=False, errors=serializer.errors)
-
-        serializer.save()
-        return StandardResponse(status=201, message="Materials created successfully")
\ No newline at end of file
+        return StandardResponse(status=201, message="Materials imported successfully", data=report.as_dict())
\ No newline at end of file
@@ -0,0 +1,22 @@
+from portal.bulk_import import ImportSpec, OnConflict, RelatedKey, model_fields
+
+from .models import Hub, MaterialMaster, StorerKey
+
+
+def _storerkey_in_hub(row):
+    if row["storerkey"].hub_id != row["hub"].id:
+        return f"Storerkey '{row['storerkey'].storerkey_code}' does not belong to hub '{row['hub'].hub_code}'"
+
+
+## Re-uploading a material updates it in place
+MATERIAL_MASTER = ImportSpec(
+    MaterialMaster,
+    fields=model_fields(MaterialMaster),
+    related={
+        "storerkey": RelatedKey(StorerKey, "storerkey_code"),
+        "hub": RelatedKey(Hub, "hub_code"),
+    },
+    natural_key=["product_code", "storerkey", "hub"],
+    on_conflict=OnConflict.UPDATE,
+    validate_row=_storerkey_in_hub,
+)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entities', '0025_client_client_code_idx_client_client_name_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='materialmaster',
+            name='mm_storerkey_product_idx',
+        ),
+        migrations.AddIndex(
+            model_name='materialmaster',
+            index=models.Index(condition=models.Q(('is_deleted__is', False)), fields=['product_code', 'storerkey'], name='mm_product_storer_live_idx'),
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.db import models
 from portal.base import BaseModel
+from portal.soft_delete import live_index
 from portal.choices import ServiceTypeChoices,MeasurementTypeChoices,OperationUserRole,OrderTypeChoices
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from core.principal_cache import invalidate_principal, invalidate_users
+from core.scope import invalidate_scope
+from core.recipients import invalidate_recipients
 
 
 class Hub(BaseModel):
@@ -99,7 +104,9 @@ class Supplier(BaseModel):
     def save(self, *args, **kwargs):
         if not self.is_active: 
             users = SupplierUser.objects.filter(supplier=self, is_active=True)
+            user_ids = list(users.values_list("user_id", flat=True))
             users.update(is_active=False) 
+            invalidate_users(user_ids)
         super().save(*args, **kwargs) 
     
     def __str__(self):
@@ -134,6 +141,12 @@ class ClientUser(BaseModel):
             models.Index(fields=['client', 'is_active'], name='cu_client_active_idx'),
         ]
 
+post_save.connect(invalidate_principal, sender=ClientUser)
+post_delete.connect(invalidate_principal, sender=ClientUser)
+post_save.connect(invalidate_recipients, sender=ClientUser)
+post_delete.connect(invalidate_recipients, sender=ClientUser)
+m2m_changed.connect(invalidate_scope, sender=ClientUser.storerkeys.through)
+
 
 
 class SupplierUser(BaseModel):
@@ -152,6 +165,12 @@ class SupplierUser(BaseModel):
             models.Index(fields=['supplier', 'is_active'], name='su_supplier_active_idx'),
         ]
 
+post_save.connect(invalidate_principal, sender=SupplierUser)
+post_delete.connect(invalidate_principal, sender=SupplierUser)
+post_save.connect(invalidate_recipients, sender=SupplierUser)
+post_delete.connect(invalidate_recipients, sender=SupplierUser)
+m2m_changed.connect(invalidate_scope, sender=SupplierUser.storerkeys.through)
+
 
 
 class Operations(BaseModel):
@@ -163,6 +182,11 @@ class Operations(BaseModel):
     def __str__(self):
         return f"{self.user.username}"
 
+post_save.connect(invalidate_principal, sender=Operations)
+post_delete.connect(invalidate_principal, sender=Operations)
+post_save.connect(invalidate_recipients, sender=Operations)
+post_delete.connect(invalidate_recipients, sender=Operations)
+m2m_changed.connect(invalidate_scope, sender=Operations.storerkeys.through)
 
 
 class DangerousGoodClass(BaseModel):
@@ -231,6 +255,6 @@ class MaterialMaster(BaseModel):
             models.Index(fields=['product_code'], name='mm_product_code_idx'),
             models.Index(fields=['is_dangerous_good'], name='mm_dg_idx'),
             models.Index(fields=['is_chemical'], name='mm_chemical_idx'),
-            models.Index(fields=['storerkey', 'product_code'], name='mm_storerkey_product_idx'),
+            live_index('product_code', 'storerkey', name='mm_product_storer_live_idx'),
             models.Index(fields=['is_stackable'], name='mm_stackable_idx'),
         ]
\ No newline at end of file
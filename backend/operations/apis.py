@@ -7,14 +7,15 @@ from core.response import StandardResponse, ServiceError
 from django.db import transaction, IntegrityError
 from .models import (
     PurchaseOrder, PurchaseOrderLine, Consignment, PurchaseOrderUpload, ConsignmentPackaging,
-    AWBFile, PackagingAllocation, ConsignmentPOLine
+    AWBFile, PackagingAllocation, ConsignmentPOLine, StatusRollup
     )
 from .serializers import PurchaseOrderLineSerializer, GetPurchaseOrderSerializer
 from entities.models import Supplier, StorerKey, Client
 from portal.utils import get_all_fields, convert_to_decimal, empty_directory
-from portal.choices import Role, PurchaseOrderStatusChoices, ConsignmentStatusChoices, PackageStatusChoices, Role, OperationUserRole, POImportFormatsChoices
+from portal.choices import Role, PurchaseOrderStatusChoices, ConsignmentStatusChoices, PackageStatusChoices, Role, OperationUserRole, POImportFormatsChoices, QuantityLedgerKindChoices
 from uuid import uuid4
 from datetime import timedelta
+from portal.pagination import InvalidCursor
 from portal.mixins import SearchAndFilterMixin, PaginationMixin
 from django.utils import timezone
 import calendar
@@ -28,8 +29,11 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from core.decorators import role_required
 from .services import POLineService, ConsignmentServices, PurchaseOrderService
 from operations.utils import validate_file_size, addresses_and_pickup
+from operations.rollups import rollup_counts, track_created
+from portal import search as search_index
 from .notifications import NotificationService
 from .other_services.po_import import POImportValidationService
+from .other_services import quantity_ledger
 
   
 from .signals import awb_file_added_audit_trail, awb_file_deleted_audit_trail
@@ -98,7 +102,7 @@ class PurchaseOrderCreateAPI(APIView):
             return StandardResponse(success=False, errors=[f"Purchase Order with reference number {reference_number} already exists"], status=400)
         
         customer_reference_number = po_data.get("customer_reference_number")
-        if PurchaseOrder.objects.filter(customer_reference_number=customer_reference_number).exists():
+        if PurchaseOrder.all_objects.filter(customer_reference_number=customer_reference_number).exists():
             return StandardResponse(success=False, errors=[f"Purchase Order with customer reference number {customer_reference_number} already exists"], status=400)
             
         po_line_ref_numbers = [i.get("reference_number") for i in po_lines]
@@ -357,11 +361,11 @@ class PurchaseOrderBulkUpdateAPI(APIView):
             return StandardResponse(success=False, errors=["Purchase Order lines required"], status=400)
         
         customer_reference_number = data.get("customer_reference_number")
-        if PurchaseOrder.objects.filter(customer_reference_number=customer_reference_number).exists():
+        if PurchaseOrder.all_objects.filter(customer_reference_number=customer_reference_number).exists():
             return StandardResponse(success=False, errors=[f"Purchase Order with customer reference number {customer_reference_number} already exists"], status=400)
         
         customer_reference_number = data.get("customer_reference_number")
-        if PurchaseOrder.objects.filter(customer_reference_number=customer_reference_number).exists():
+        if PurchaseOrder.all_objects.filter(customer_reference_number=customer_reference_number).exists():
             return StandardResponse(success=False, errors=[f"Purchase Order with customer reference number {customer_reference_number} already exists"], status=400)
             
         po_line_ref_numbers = [i.get("reference_number") for i in po_lines]
@@ -520,7 +524,9 @@ class PurchaseOrderBulkUpdateAPI(APIView):
                        
         try:                
             created_pos = PurchaseOrder.objects.bulk_create(po_to_create, batch_size=1000)
+            track_created("PO", created_pos)
             PurchaseOrder.objects.bulk_update(po_to_update, allow_fields_to_update(PurchaseOrder), batch_size=1000)
+            search_index.reindex(PurchaseOrder, [po.id for po in created_pos + po_to_update])
             created_po_lines = PurchaseOrderLine.objects.bulk_create(po_lines_to_create, batch_size=1000)
             PurchaseOrderLine.objects.bulk_update(po_lines_to_update, allow_fields_to_update(PurchaseOrderLine), batch_size=1000)
 
@@ -558,7 +564,7 @@ class PurchaseOrderUploadHistoryAPI(PaginationMixin,APIView):
             limit = request.GET.get("limit") or 25
             my_uploads = str(request.GET.get("show_my_uploads")).lower() == "true"
             
-            fields = ["status","uploaded_file","error_file","created_at","name","document_type"]
+            fields = ["status","uploaded_file","error_file","created_at","name","document_type","total_rows","processed_rows"]
 
             queryset = PurchaseOrderUpload.objects.select_related("uploaded_by").annotate(name=F("uploaded_by__name"),document_type = Value("Bulk PO Upload"))
             
@@ -811,8 +817,15 @@ class PurchaseOrderHeaderView(FilterMixin, SearchAndFilterMixin, PaginationMixin
             apply_filters = self.appy_dynamic_filter(filters)  
             queryset = queryset.filter(apply_filters)
             
-        count = queryset.count()
-        paginate_result = self.paginate_results(queryset, pg, limit)
+        count = self.get_count(queryset, request)
+        next_cursor = None
+        if "cursor" in request.GET:
+            try:
+                paginate_result, next_cursor = self.paginate_keyset(queryset, request, ["-created_at", "-id"], limit)
+            except InvalidCursor as e:
+                return StandardResponse(status=400, success=False, errors=[str(e)])
+        else:
+            paginate_result = self.paginate_results(queryset, pg, limit)
 
         data = []
         for result in paginate_result:
@@ -826,6 +839,7 @@ class PurchaseOrderHeaderView(FilterMixin, SearchAndFilterMixin, PaginationMixin
             # data=GetPurchaseOrderSerializer(paginate_result, many=True).data,
             data=data,
             count=count,
+            next_cursor=next_cursor,
             status=200
         )  
 
@@ -1522,8 +1536,11 @@ class PurchaseOrderBulkUploadAPI(APIView,PurchaseOrderMixin):
 
                 POImportValidationService.file_validations(file,format=POImportFormatsChoices.PO)
                 
-                wb = load_workbook(file, data_only=True)
-                po_entries = self.parse_excel_to_pos(wb)
+                wb = load_workbook(file, read_only=True, data_only=True)
+                try:
+                    po_entries = self.parse_excel_to_pos(wb)
+                finally:
+                    wb.close()
 
                 if not po_entries:
                     return StandardResponse(success=False, status=400, errors=["File is empty"])
@@ -1829,6 +1846,7 @@ class ReceivePackages(APIView):
             con_packaging.received_date_time = date_and_time
             con_packaging.time_zone = time_zone
             con_packaging.save(update_fields=["status","received_date_time","time_zone"]) 
+            quantity_ledger.post([con_packaging.consignment_id], kind=QuantityLedgerKindChoices.RECEIPT)
 
             consignment = con_packaging.consignment
             consignment.consignment_status = new_status
@@ -1933,12 +1951,12 @@ class ConsignmentStatusMonthlyCountAPI(APIView):
         try:
             year = int(year) 
          
-            monthly_data = (
-                Consignment.objects
-                .filter(is_completed=True,created_at__year=year)
-                .annotate(month=TruncMonth('created_at'))  
+            monthly_data = list(
+                StatusRollup.objects
+                .filter(model="Consignment", is_completed=True, day__year=year)
+                .annotate(month=TruncMonth('day'))
                 .values('month')
-                .annotate(count=Count('id'))
+                .annotate(count=Sum('count'))
                 .order_by('month')
             )
 
@@ -2026,31 +2044,12 @@ class ConsignmentStatusDonutChartAPI(APIView):
         else:
             previous_month = current_date.replace(month=current_date.month - 1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
-        # Fetch consignment status counts for the current month
-        current_consignment_status = (
-            Consignment.objects
-            .filter(is_completed=True,created_at__gte=current_month)
-            .annotate(month=TruncMonth('created_at'))
-            .values('consignment_status')
-            .annotate(count=Count('id'))
+        # Current month, previous month and all time counts per status from the rollups
+        current_data_map = rollup_counts("Consignment", is_completed=True, day__gte=current_month.date())
+        previous_data_map = rollup_counts(
+            "Consignment", is_completed=True, day__gte=previous_month.date(), day__lt=current_month.date()
         )
-
-        # Fetch consignment status counts for the previous month
-        previous_consignment_status = (
-            Consignment.objects
-            .filter(is_completed=True,created_at__gte=previous_month, created_at__lt=current_month)
-            .annotate(month=TruncMonth('created_at'))
-            .values('consignment_status')
-            .annotate(count=Count('id'))
-        )
-
-        # Create dictionaries for current and previous counts
-        current_data_map = {
-            item['consignment_status']: item['count'] for item in current_consignment_status
-        }
-        previous_data_map = {
-            item['consignment_status']: item['count'] for item in previous_consignment_status
-        }
+        total_data_map = rollup_counts("Consignment")
 
         # Get all possible statuses from ConsignmentStatusChoices
         all_statuses = [status[0] for status in ConsignmentStatusChoices.choices]
@@ -2062,8 +2061,7 @@ class ConsignmentStatusDonutChartAPI(APIView):
             current_count = current_data_map.get(status, 0)  # Default to 0 if status not found
             previous_count = previous_data_map.get(status, 0)  # Default to 0 if status not found
             
-            # Get the total count of consignments
-            total_consignment_count  = Consignment.objects.filter(consignment_status = status).count()
+            total_consignment_count = total_data_map.get(status, 0)
 
             if previous_count == 0:
                 change = current_count
@@ -2095,38 +2093,14 @@ class ConsignmentStatusDonutChartAPI(APIView):
 
 class ConsignmentStatusSummaryCountAPI(ConsignmentStatusSummary,APIView):
 
-    def get_queryset_for_range(self, min_days=None, max_days=None):
-        now = timezone.now()
-
-        if min_days is not None and max_days is not None:
-            start_date = now - timedelta(days=max_days)  
-            end_date = now - timedelta(days=min_days)
-            return Consignment.objects.filter(
-                created_at__gte=start_date, 
-                created_at__lt=end_date
-            )
-
-        elif max_days is not None:
-            start_date = now - timedelta(days=max_days)
-            return Consignment.objects.filter(created_at__gte=start_date)
-
-        elif min_days is not None:
-            end_date = now - timedelta(days=min_days)
-            return Consignment.objects.filter(created_at__lt=end_date)
-
-        return Consignment.objects.none()
-
-    def get_status_summary_dict(self, queryset):
-        all_statuses = dict(ConsignmentStatusChoices.choices)
-        summary = {label: 0 for label in all_statuses.values()}
-
-        results = queryset.values('consignment_status').annotate(count=Count('id'))
-
-        for entry in results:
-            label = all_statuses.get(entry['consignment_status'], entry['consignment_status'])
-            summary[label] = entry['count']
-
-        return summary
+    def range_filter(self, today, min_days=None, max_days=None):
+        """Rollup days whose age in days is in [min_days, max_days)."""
+        q = Q()
+        if max_days is not None:
+            q &= Q(day__gt=today - timedelta(days=max_days))
+        if min_days is not None:
+            q &= Q(day__lte=today - timedelta(days=min_days))
+        return q
 
     def get(self, request, *args, **kwargs):
         ranges = [
@@ -2142,15 +2116,32 @@ class ConsignmentStatusSummaryCountAPI(ConsignmentStatusSummary,APIView):
             {"label": ">180", "max_days": None, "min_days": 180},
         ]
 
-        summary = []
+        today = timezone.localdate()
+        all_statuses = dict(ConsignmentStatusChoices.choices)
 
+        ## Every range in one pass over the rollups, one column per range
+        rows = (
+            StatusRollup.objects
+            .filter(model="Consignment")
+            .values("status")
+            .annotate(**{
+                f"range_{i}": Sum("count", filter=self.range_filter(today, r.get("min_days"), r.get("max_days")))
+                for i, r in enumerate(ranges)
+            })
+            .order_by()
+        )
+
+        summary = []
         for r in ranges:
-            queryset = self.get_queryset_for_range(min_days=r.get("min_days"), max_days=r.get("max_days"))
-            status_counts = self.get_status_summary_dict(queryset)
             data = {"day": r["label"]}
-            data.update(status_counts)
+            data.update({label: 0 for label in all_statuses.values()})
             summary.append(data)
 
+        for row in rows:
+            label = all_statuses.get(row["status"], row["status"])
+            for i, data in enumerate(summary):
+                data[label] = row[f"range_{i}"] or 0
+
         return StandardResponse(status=200, data=summary, count=len(summary))
 
  
@@ -2160,10 +2151,9 @@ class PurchaseOrderStatusCountAPI(FilterMixin,APIView):
 
         filters = self.build_filter(request.this_user,"PO",{})
         
-        status_counts = PurchaseOrder.objects.filter(**filters).values('status').annotate(count=Count('status'))
+        ## The rollups carry the same storerkey/supplier/client columns the PO filters use
         status_dict = {status: 0 for status in all_statuses}
-        for status in status_counts:
-            status_dict[status['status']] = status['count']
+        status_dict.update(rollup_counts("PO", **(filters or {})))
         
         return StandardResponse(status=200, data=status_dict, count=len(status_dict))
        
@@ -2173,10 +2163,8 @@ class ConsignmentDashboardThisMonth(APIView):
         
         start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-        results = Consignment.objects.filter(created_at__gte=start_of_month).values('consignment_status').annotate(count=Count('consignment_status'))
         status_dict = {status[0]: 0 for status in ConsignmentStatusChoices.choices}
-        for status in results:
-            status_dict[status['consignment_status']] = status['count']
+        status_dict.update(rollup_counts("Consignment", day__gte=start_of_month.date()))
         
         return StandardResponse(status=200, data=status_dict, count=len(status_dict))
     
@@ -0,0 +1,191 @@
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+_local = threading.local()
+
+
+class AuditSnapshotMixin:
+    """
+    Keeps the field values an instance was loaded with, so audit receivers can
+    diff against them instead of re-reading the row before every save.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._audit_snapshot = instance._audit_values()
+        return instance
+
+    def _audit_values(self):
+        # Deferred fields are not in __dict__ and are left out rather than loaded
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        values = self._audit_values()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and getattr(self, "_audit_snapshot", None) is not None:
+            # Fields left out of update_fields still differ from the stored row
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            values = {**self._audit_snapshot, **{k: v for k, v in values.items() if k in saved}}
+        self._audit_snapshot = values
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._audit_snapshot = self._audit_values()
+
+
+def get_snapshot(instance):
+    """
+    Values the instance was loaded with. Instances built by hand fall back to
+    a single read of the stored row.
+    """
+    snapshot = getattr(instance, "_audit_snapshot", None)
+    if snapshot is None:
+        old_instance = type(instance)._base_manager.filter(pk=instance.pk).first()
+        snapshot = old_instance._audit_values() if old_instance else {}
+        # Every receiver of this save diffs against the same read
+        instance._audit_snapshot = snapshot
+    return snapshot
+
+
+class AuditBuffer:
+    """
+    Audit entries waiting to be written. Each entry is
+    (model, instance, updated_by, field_changes) as passed to create_logs.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, model, instance, updated_by, field_changes):
+        self.entries.append((model, instance, updated_by, field_changes))
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        if entries:
+            write_entries(entries)
+
+
+def write_entries(entries):
+    """
+    Writes the trail headers and their field rows with one bulk_create each
+    per trail table.
+    """
+    from .models import AuditTrail, AuditTrailField, ConsignmentAuditTrail, ConsignmentAuditTrailField
+
+    consignment_trails, consignment_fields = [], []
+    trails, fields = [], []
+
+    for model, instance, updated_by, field_changes in entries:
+        if model == "Consignment":
+            trail = ConsignmentAuditTrail(consignment_id=instance.pk, updated_by=updated_by)
+            consignment_trails.append(trail)
+            field_model, rows = ConsignmentAuditTrailField, consignment_fields
+        else:
+            if model == "PO-Line":
+                trail = AuditTrail(po_line_audit_trail_id=instance.purchase_order_id, updated_by=updated_by)
+            else:
+                trail = AuditTrail(po_audit_trail_id=instance.pk, updated_by=updated_by)
+            trails.append(trail)
+            field_model, rows = AuditTrailField, fields
+
+        for change in field_changes:
+            rows.append(field_model(
+                audit_trail=trail,
+                title=change['title'],
+                description=change['description'],
+                field_name=change['field_name'],
+                old_value=change['old_value'],
+                new_value=change['new_value'],
+            ))
+
+    for model, objs in (
+        (ConsignmentAuditTrail, consignment_trails),
+        (ConsignmentAuditTrailField, consignment_fields),
+        (AuditTrail, trails),
+        (AuditTrailField, fields),
+    ):
+        if objs:
+            model.objects.bulk_create(objs, batch_size=500)
+
+
+def _is_registered(connection, callback):
+    return any(item[1] is callback for item in connection.run_on_commit)
+
+
+def _buffer(using, entry):
+    """
+    Queue `entry` on the open audit_batch() or transaction, False in
+    autocommit mode outside a batch. Entries recorded inside a savepoint
+    are dropped when it rolls back.
+    """
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        # Joins the batch once the atomic block around it commits, right away outside one
+        transaction.on_commit(partial(batch.add, *entry), using=using)
+        return True
+
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return False
+
+    # One buffer per transaction and savepoint. A rollback drops the
+    # buffer's on_commit callback, in which case its entries go too.
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    savepoints = tuple(connection.savepoint_ids)
+    key = (using, len(savepoints))
+    pending = buffers.get(key)
+    if pending is None or pending[0] != savepoints or not _is_registered(connection, pending[2]):
+        buffer = AuditBuffer()
+        callback = buffer.flush
+        transaction.on_commit(callback, using=using)
+        buffers[key] = pending = (savepoints, buffer, callback)
+    pending[1].add(*entry)
+    return True
+
+
+def record(model, instance, updated_by, field_changes, using=DEFAULT_DB_ALIAS):
+    """
+    Queue audit entries for `instance`. They are written when the current
+    transaction commits, or straight away in autocommit mode.
+    """
+    if not field_changes:
+        return
+
+    entry = (model, instance, updated_by, field_changes)
+    if not _buffer(using, entry):
+        write_entries([entry])
+
+
+@contextmanager
+def audit_batch(using=DEFAULT_DB_ALIAS):
+    """
+    Collect every audit entry recorded inside the block and write them in
+    one go on exit (on commit when a transaction is open). Use it around
+    bulk updates and imports that save many instances outside a transaction.
+    Nothing is written when the block raises, and entries of atomic blocks
+    inside it that rolled back are left out.
+    """
+    if getattr(_local, "batch", None) is not None:
+        # Nested: the outer batch writes everything
+        yield
+        return
+
+    batch = _local.batch = AuditBuffer()
+    try:
+        yield
+    finally:
+        _local.batch = None
+    # Dropped with the transaction if it rolls back, runs now in autocommit
+    transaction.on_commit(batch.flush, using=using)
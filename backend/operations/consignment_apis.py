@@ -6,7 +6,7 @@ from django.db import transaction
 from .mixins import PurchaseOrderLineQuantityMixin, ConsignmentMixin, AdhocPurchaseOrderLineMixin
 from django.db.models.functions import JSONObject
 from django.contrib.postgres.aggregates import JSONBAgg
-from django.db.models import OuterRef, Subquery, F, JSONField, Count, Sum, Max, Q
+from django.db.models import OuterRef, Subquery, Exists, F, JSONField, Count, Sum, Max, Q
 from decimal import Decimal
 from rest_framework.parsers import MultiPartParser, FormParser
 from .models import (
@@ -23,8 +23,8 @@ from .models import (
     ConsignmentPackaging,
     PackagingAllocation,
     ConsignmentDocument,
-    ConsignmentAuditTrail,
     ConsignmentFFDocument,
+    AWBFile,
     UserGridPreferences
 )
 from .serializers import (
@@ -40,7 +40,8 @@ from .serializers import (
 from portal.serializers import PackagingTypeSerializer
 from entities.models import Client, Supplier
 from portal.mixins import SearchAndFilterMixin, PaginationMixin
-from portal.choices import MeasurementTypeChoices, ConsignmentStatusChoices, Role, ConsignmentTypeChoices, ConsignmentDocumentTypeChoices, PackagingTypeChoices, NotificationChoices, OperationUserRole, PackageStatusChoices
+from portal.pagination import InvalidCursor
+from portal.choices import MeasurementTypeChoices, ConsignmentStatusChoices, Role, ConsignmentTypeChoices, ConsignmentDocumentTypeChoices, PackagingTypeChoices, NotificationChoices, OperationUserRole, PackageStatusChoices, AuditTrailKindChoices
 from django.core.files.storage import default_storage
 from django.utils import timezone
 import pytz
@@ -60,6 +61,7 @@ import os
 from django.conf import settings
 from core.decorators import role_required
 from .services import ConsignmentWorkflowServices, ConsignmentStatusService, ConsignmentServices
+from .other_services import audit_archive, quantity_ledger
 
 def get_consignments_by_timezone(request, timezone_name):
     # Get the user's timezone
@@ -904,24 +906,29 @@ class ConsignmentListAPI(FilterMixin, PurchaseOrderMixin,ConsignmentStatusSummar
             .select_related(
                 "supplier", "client","console__console","created_by"
             )
-            .prefetch_related("consignment_awb")
             .annotate(
                 created_by_name=F("created_by__name"),
-                has_awb_files=Count("consignment_awb", distinct=True),
+                has_awb_files=Exists(AWBFile.objects.filter(consignment=OuterRef("pk"))),
             )
             .values(*ConsignmentListAPI.fields)
-            .distinct()
-            .order_by("-consignment_id")
+            .order_by("-consignment_id", "-id")
         )
         
         queryset = ConsignmentListAPI.make_filters(self,request, queryset)
 
-        count = queryset.count()
-        paginate_result = self.paginate_results(queryset, pg, limit)
+        count = self.get_count(queryset, request)
+        next_cursor = None
+        if "cursor" in request.GET:
+            try:
+                paginate_result, next_cursor = self.paginate_keyset(queryset, request, ["-consignment_id", "-id"], limit)
+            except InvalidCursor as e:
+                return StandardResponse(status=400, success=False, errors=[str(e)])
+        else:
+            paginate_result = self.paginate_results(queryset, pg, limit)
         for data in paginate_result:
             self._tranform_object(data)
         
-        return StandardResponse(success=True, data=paginate_result, count=count, status=200)
+        return StandardResponse(success=True, data=paginate_result, count=count, next_cursor=next_cursor, status=200)
     
 
     def check_supplier(self,con,user):
@@ -1179,7 +1186,7 @@ class ConsignmentStatusUpdateAPI(PurchaseOrderLineQuantityMixin, APIView):
 
             for con in consignments:
                 con.update_console_status()
-                ConsignmentServices.notify_consignment_update(request.this_user, instance=con)
+            ConsignmentServices.notify_consignments_update(request.this_user, consignments)
 
             return StandardResponse(status=200, message="Status updated successfully.")
           
@@ -1225,23 +1232,24 @@ class ConsignmentAuditTrailGetAPI(APIView):
         except:
             return StandardResponse(status=400, success=False, errors=["Consignment not found"])
         
-        audit_trails = ConsignmentAuditTrail.objects.prefetch_related("fields").filter(consignment=obj).order_by("-updated_at")
+        # Older trails of closed consignments live in the archive tables
+        audit_trails = audit_archive.trails(AuditTrailKindChoices.CONSIGNMENT, obj.id)
         
         data = [
             {
-                "audit_trail_id": trail.id,
-                "updated_by": trail.updated_by.name,
-                "created_at": trail.created_at,
+                "audit_trail_id": trail["id"],
+                "updated_by": trail["updated_by"],
+                "created_at": trail["created_at"],
                 
                 "fields": [
                     {
-                        "field_name": field.field_name,
-                        "title" : field.title,
-                        "description": field.description,
-                        "old_value": field.old_value,
-                        "new_value": field.new_value,
+                        "field_name": field["field_name"],
+                        "title" : field["title"],
+                        "description": field["description"],
+                        "old_value": field["old_value"],
+                        "new_value": field["new_value"],
                     }
-                    for field in trail.fields.all()
+                    for field in trail["fields"]
                 ],
             }
             for trail in audit_trails
@@ -1612,6 +1620,7 @@ class AdhocConsignmentPackageView(AdhocPurchaseOrderLineMixin,APIView):
         return StandardResponse(status=201, success=True, message="Consignment Packages created successfully", data={})
     
      
+    @transaction.atomic
     def delete(self, request, id=None, *args, **kwargs):
         try:
             package = ConsignmentPackaging.objects.get(id=id)
@@ -1619,6 +1628,8 @@ class AdhocConsignmentPackageView(AdhocPurchaseOrderLineMixin,APIView):
             if error:
                 return StandardResponse(status=400, success=False, errors=[error])
             package.delete()
+            # The package's allocations go with it, give their quantities back to the lines
+            quantity_ledger.post([package.consignment_id])
         except (ConsignmentPackaging.DoesNotExist, ValidationError):
             return StandardResponse(status=400, success=False, errors=["Object not found"])
         
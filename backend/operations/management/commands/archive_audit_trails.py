@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from operations.other_services import audit_archive
+
+
+class Command(BaseCommand):
+    help = 'Move the audit trails of closed consignments, POs and consoles past the retention window to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int, help="Archive trails older than this, defaults to AUDIT_ARCHIVE_RETENTION_DAYS")
+        parser.add_argument("--batch-size", type=int, help="Trails moved per transaction, defaults to AUDIT_ARCHIVE_BATCH_SIZE")
+        parser.add_argument("--kind", action="append", choices=list(audit_archive.SOURCES), help="Only these kinds of trails (repeatable)")
+        parser.add_argument("--dry-run", action="store_true", help="Report how many trails would be archived without moving them")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            for kind, count in audit_archive.pending(options["retention_days"], options["kind"]).items():
+                self.stdout.write(f"{count} {kind} audit trails to archive")
+            return
+
+        archived = audit_archive.archive(options["retention_days"], options["batch_size"], options["kind"])
+        for kind, count in archived.items():
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} {kind} audit trails"))
@@ -0,0 +1,40 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from portal import search as search_index
+from portal.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the global search documents (backfill, or after related names changed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=list(search_index.SEARCH_MODELS), help="Only rebuild this model, e.g. operations.purchaseorder")
+        parser.add_argument("--batch-size", type=int, default=search_index.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        labels = [options["model"]] if options["model"] else list(search_index.SEARCH_MODELS)
+
+        for label in labels:
+            model = apps.get_model(label)
+            ids = model._base_manager.order_by("pk").values_list("pk", flat=True)
+
+            batch, indexed = [], 0
+            for pk in ids.iterator(chunk_size=options["batch_size"]):
+                batch.append(pk)
+                if len(batch) == options["batch_size"]:
+                    search_index.index(model, batch)
+                    indexed += len(batch)
+                    batch = []
+            if batch:
+                search_index.index(model, batch)
+                indexed += len(batch)
+
+            # Documents of rows deleted without signals
+            orphans, _ = (
+                SearchDocument.objects.filter(model=label)
+                .exclude(object_id__in=model._base_manager.values("pk"))
+                .delete()
+            )
+
+            self.stdout.write(self.style.SUCCESS(f"{label}: indexed {indexed} rows, removed {orphans} stale documents"))
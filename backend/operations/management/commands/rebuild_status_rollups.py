@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from operations.models import Consignment, PurchaseOrder, StatusRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard status rollups from consignments and purchase orders (backfill / drift repair)'
+
+    SOURCES = {
+        "Consignment": lambda: Consignment.objects.values(
+            "storerkey_id", "supplier_id", "client_id", "is_completed", status=F("consignment_status"), day=TruncDate("created_at"),
+        ),
+        "PO": lambda: PurchaseOrder.objects.values(
+            "storerkey_id", "supplier_id", "client_id", "status", day=TruncDate("created_at"),
+        ),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=list(self.SOURCES), help="Only rebuild this rollup")
+        parser.add_argument("--dry-run", action="store_true", help="Report the drift without writing")
+
+    def handle(self, *args, **options):
+        models = [options["model"]] if options["model"] else list(self.SOURCES)
+
+        for model in models:
+            rows = [
+                StatusRollup(model=model, count=row.pop("count"), **row)
+                for row in self.SOURCES[model]().annotate(count=Count("id")).order_by()
+            ]
+            expected = sum(row.count for row in rows)
+            current = StatusRollup.objects.filter(model=model).aggregate(total=Sum("count"))["total"] or 0
+
+            if options["dry_run"]:
+                self.stdout.write(f"{model}: {current} counted in rollups, {expected} in the table")
+                continue
+
+            with transaction.atomic():
+                StatusRollup.objects.filter(model=model).delete()
+                StatusRollup.objects.bulk_create(rows, batch_size=1000)
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{model}: rebuilt {len(rows)} rollup rows ({expected} records, rollups had {current})"
+            ))
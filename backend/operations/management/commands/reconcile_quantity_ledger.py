@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from operations.other_services import quantity_ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute the PO line and PO processed / fulfilled / open totals from the quantity ledger (drift repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repost", action="store_true", help="First post every consignment's allocations that the ledger is missing")
+        parser.add_argument("--dry-run", action="store_true", help="Report the drift without writing")
+
+    def handle(self, *args, **options):
+        if options["repost"] and not options["dry_run"]:
+            written = quantity_ledger.repost_all()
+            self.stdout.write(f"Posted {written} ledger entries missing for the allocations")
+
+        lines, purchase_orders = quantity_ledger.reconcile(dry_run=options["dry_run"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"{lines} lines and {purchase_orders} purchase orders differ from the ledger")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Fixed {lines} lines and {purchase_orders} purchase orders that had drifted from the ledger"
+        ))
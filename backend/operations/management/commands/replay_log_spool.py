@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core.log_shipper import get_shipper
+
+
+class Command(BaseCommand):
+    help = 'Re-send API logs spooled while OpenSearch was unreachable'
+
+    def handle(self, *args, **kwargs):
+        shipper = get_shipper()
+        sent = shipper.replay_spool()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {sent} spooled log documents"))
+
+        stats = shipper.stats()
+        if stats["spooled"]:
+            self.stdout.write(self.style.ERROR(f"{stats['spooled']} documents could not be sent and were spooled again"))
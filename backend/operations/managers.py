@@ -1,36 +1,102 @@
 from crequest.middleware import CrequestMiddleware
 from django.db import models
-from .signals import track_field_changes, create_logs, notify_consignment_update, notify_po
-import copy
+from .signals import field_change, create_logs, notify_consignment_update, notify_po
+from .audit import audit_batch
+from .rollups import track_changes
+from portal import search as search_index
+from portal.soft_delete import LiveManager, SoftDeleteQuerySet
+from .other_services import erp_outbox
 
-class ConsignmentQuerySet(models.QuerySet):
-    def update(self, **kwargs):
-        from .models import Consignment
-
-        request = CrequestMiddleware.get_request()
-        updated_by = getattr(request, "this_user", None)
+## Fields the status rollups are keyed on, read along with the update when it touches any
+ROLLUP_FIELDS = ("consignment_status", "storerkey_id", "supplier_id", "client_id", "is_completed", "created_at")
 
-        # Fetch old instances (only needed fields to reduce memory)
-        old_instances = list(self)
-        old_map = {obj.pk: copy.deepcopy(obj) for obj in old_instances}
+## Rows per re-read of columns updated with an expression, under the MSSQL parameter limit
+READ_BATCH_SIZE = 1000
 
-        # Perform the actual bulk update
-        updated_count = super().update(**kwargs)
 
-        # Fetch updated instances in one query
-        updated_instances = Consignment.objects.filter(pk__in=old_map.keys())
+class ConsignmentQuerySet(SoftDeleteQuerySet):
+    def update(self, **kwargs):
+        return self._tracked_update(kwargs, audit=True)
+
+    def update_without_audit(self, **kwargs):
+        """
+        update() for system driven writes (generated files, internal flags)
+        that have no place in the audit trail. Rollups, ERP export and the
+        search index are still kept in step.
+        """
+        return self._tracked_update(kwargs, audit=False)
+
+    def _update_values(self, kwargs):
+        """
+        {attname: new value} of the update, None for values only the
+        database knows (F(), Case, ...), which are read back after it.
+        """
+        values = {}
+        for name, value in kwargs.items():
+            field = self.model._meta.get_field(name)
+            if hasattr(value, "resolve_expression"):
+                values[field.attname] = None
+                continue
+            if field.is_relation:
+                if isinstance(value, models.Model):
+                    value = value.pk
+                elif value == "":
+                    # Saved as NULL, as ForeignKey.get_db_prep_save does
+                    value = None
+            values[field.attname] = (value,)
+        return values
+
+    def _tracked_update(self, kwargs, audit):
+        from .models import Consignment
 
-        for new_instance in updated_instances:
-            old_instance = old_map.get(new_instance.pk)
+        values = self._update_values(kwargs)
+        columns = set(values)
+        if columns & set(ROLLUP_FIELDS):
+            columns |= set(ROLLUP_FIELDS)
 
-            # Track changes
-            field_changes = track_field_changes(new_instance, old_instance, "Consignment", **kwargs)
+        # Only the columns this update can change, in one read
+        old_rows = list(self.order_by().values("id", *sorted(columns)))
 
-            # Create logs
-            create_logs(field_changes, new_instance, "Consignment", updated_by)
+        updated_count = super().update(**kwargs)
+        if not old_rows:
+            return updated_count
+
+        computed = [attname for attname, value in values.items() if value is None]
+        read_back = {}
+        if computed:
+            pks = [row["id"] for row in old_rows]
+            for start in range(0, len(pks), READ_BATCH_SIZE):
+                for row in Consignment._base_manager.filter(pk__in=pks[start:start + READ_BATCH_SIZE]).values("id", *computed):
+                    read_back[row["id"]] = row
+
+        assigned = {attname: value[0] for attname, value in values.items() if value is not None}
+        changes = [
+            (old, {**old, **read_back.get(old["id"], {}), **assigned})
+            for old in old_rows
+        ]
+
+        # Status transitions go through here, keep the dashboard rollups in step
+        if columns & set(ROLLUP_FIELDS):
+            track_changes("Consignment", changes)
+        if "consignment_status" in values:
+            erp_outbox.track_status_changes(changes)
+        search_index.reindex(Consignment, [old["id"] for old, _ in changes])
 
-            # Send notifications
-            # notify_consignment_update(self.model, new_instance, created=False)
+        request = CrequestMiddleware.get_request()
+        updated_by = getattr(request, "this_user", None)
+        if not audit or not updated_by:
+            # Trails need a user, as with the save receivers
+            return updated_count
+
+        # One bulk write for the whole update instead of inserts per field
+        with audit_batch():
+            for old, new in changes:
+                field_changes = [
+                    field_change("Consignment", attname, old[attname], new[attname])
+                    for attname in values
+                    if old[attname] != new[attname]
+                ]
+                create_logs(field_changes, Consignment(pk=old["id"]), "Consignment", updated_by)
 
         return updated_count
     
@@ -68,9 +134,9 @@ class ConsignmentQuerySet(models.QuerySet):
         return super().update(**kwargs)
     
 
-class ConsignmentManager(models.Manager):
+class ConsignmentManager(LiveManager):
     def get_queryset(self):
-        return ConsignmentQuerySet(self.model, using=self._db) 
+        return ConsignmentQuerySet(self.model, using=self._db).live()
     
 
 # class PurchaseOrderManager(models.Manager):
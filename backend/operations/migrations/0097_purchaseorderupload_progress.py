@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0096_remove_purchaseorder_po_open_quantity_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorderupload',
+            name='processed_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='purchaseorderupload',
+            name='total_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:14
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entities', '0025_client_client_code_idx_client_client_name_idx_and_more'),
+        ('operations', '0097_purchaseorderupload_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('model', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('is_completed', models.BooleanField(default=True)),
+                ('count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='entities.client')),
+                ('storerkey', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='entities.storerkey')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='entities.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'day', 'status'], name='rollup_model_day_status_idx'), models.Index(fields=['model', 'storerkey', 'day'], name='rollup_model_sk_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import TruncDate
+
+
+def backfill_storerkey(apps, schema_editor):
+    """
+    Copy the storerkey of each consignment's PO lines onto the consignment,
+    then rebuild the consignment rollups, which are keyed on it. New
+    allocations must stay within one storerkey; consignments allocated
+    across several before that keep the one of their first allocated line.
+    """
+    Consignment = apps.get_model("operations", "Consignment")
+    ConsignmentPOLine = apps.get_model("operations", "ConsignmentPOLine")
+    StatusRollup = apps.get_model("operations", "StatusRollup")
+
+    line_storerkey = (
+        ConsignmentPOLine.objects
+        .filter(consignment=OuterRef("pk"))
+        .order_by("created_at")
+        .values("purchase_order_line__purchase_order__storerkey")[:1]
+    )
+    Consignment.objects.filter(storerkey__isnull=True).update(storerkey=Subquery(line_storerkey))
+
+    rows = (
+        Consignment.objects
+        .values("storerkey_id", "supplier_id", "client_id", "is_completed", status=F("consignment_status"), day=TruncDate("created_at"))
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    StatusRollup.objects.filter(model="Consignment").delete()
+    StatusRollup.objects.bulk_create(
+        [StatusRollup(model="Consignment", count=row.pop("count"), **row) for row in rows], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adhoc', '0004_alter_adhocpurchaseorder_options_and_more'),
+        ('entities', '0025_client_client_code_idx_client_client_name_idx_and_more'),
+        ('operations', '0098_statusrollup'),
+        ('portal', '0042_usernotification_inbox_indexes'),
+        ('workflows', '0015_console_console_id_idx_console_console_status_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consignment',
+            name='storerkey',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consignments', to='entities.storerkey'),
+        ),
+        migrations.AddIndex(
+            model_name='consignment',
+            index=models.Index(fields=['storerkey', 'consignment_status'], name='cons_storerkey_status_idx'),
+        ),
+        migrations.RunPython(backfill_storerkey, migrations.RunPython.noop),
+    ]
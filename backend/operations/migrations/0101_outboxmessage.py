@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:39
+
+import core.fields
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0100_background_job_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('target', models.CharField(max_length=50)),
+                ('idempotency_key', models.CharField(max_length=100, unique=True)),
+                ('payload', core.fields.MSSQLJSONField(default=dict)),
+                ('status', models.CharField(choices=[('Queue', 'Queue'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Queue', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('consignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbox_messages', to='operations.consignment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['target', 'status', 'next_attempt_at'], name='outbox_target_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:48
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def open_ledger(apps, schema_editor):
+    """
+    One opening entry per consignment line from the allocations as they are,
+    then set the line and PO totals to the ledger's, as POLineService did
+    whenever it recomputed a line.
+    """
+    PackagingAllocation = apps.get_model("operations", "PackagingAllocation")
+    QuantityLedgerEntry = apps.get_model("operations", "QuantityLedgerEntry")
+    PurchaseOrderLine = apps.get_model("operations", "PurchaseOrderLine")
+    PurchaseOrder = apps.get_model("operations", "PurchaseOrder")
+
+    rows = (
+        PackagingAllocation.objects
+        .filter(purchase_order_line__isnull=False)
+        .values("consignment_packaging__consignment_id", "purchase_order_line_id", "purchase_order_line__purchase_order_id")
+        .annotate(
+            processed=Sum("allocated_qty", filter=Q(consignment_packaging__status="Not Received")),
+            fulfilled=Sum("allocated_qty", filter=Q(consignment_packaging__status__in=["Delivered", "Received"])),
+        )
+        .order_by()
+    )
+    QuantityLedgerEntry.objects.bulk_create(
+        (
+            QuantityLedgerEntry(
+                consignment_id=row["consignment_packaging__consignment_id"],
+                purchase_order_line_id=row["purchase_order_line_id"],
+                purchase_order_id=row["purchase_order_line__purchase_order_id"],
+                kind="Opening",
+                processed_delta=row["processed"] or 0,
+                fulfilled_delta=row["fulfilled"] or 0,
+            )
+            for row in rows if row["processed"] or row["fulfilled"]
+        ),
+        batch_size=1000,
+    )
+
+    def ledger_sum(field, delta):
+        return Coalesce(Subquery(
+            QuantityLedgerEntry.objects
+            .filter(**{field: OuterRef("pk")})
+            .values(field)
+            .annotate(total=Sum(delta))
+            .values("total")
+        ), Value(Decimal("0")))
+
+    PurchaseOrderLine.objects.update(
+        processed_quantity=ledger_sum("purchase_order_line", "processed_delta"),
+        fulfilled_quantity=ledger_sum("purchase_order_line", "fulfilled_delta"),
+    )
+    PurchaseOrderLine.objects.update(open_quantity=F("quantity") - F("processed_quantity") - F("fulfilled_quantity"))
+    PurchaseOrder.objects.update(
+        processed_quantity=ledger_sum("purchase_order", "processed_delta"),
+        fulfilled_quantity=ledger_sum("purchase_order", "fulfilled_delta"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0101_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='fulfilled_quantity',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='processed_quantity',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.CreateModel(
+            name='QuantityLedgerEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('Allocation', 'Allocation'), ('Receipt', 'Receipt'), ('Cancellation', 'Cancellation'), ('Opening', 'Opening')], max_length=20)),
+                ('processed_delta', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('fulfilled_delta', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('consignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='operations.consignment')),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='operations.purchaseorder')),
+                ('purchase_order_line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='operations.purchaseorderline')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['consignment', 'purchase_order_line'], name='ledger_consignment_line_idx'), models.Index(fields=['purchase_order_line', 'created_at'], name='ledger_line_created_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
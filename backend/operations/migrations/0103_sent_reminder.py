@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:53
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entities', '0025_client_client_code_idx_client_client_name_idx_and_more'),
+        ('operations', '0102_quantity_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentReminder',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('due_date', models.DateField()),
+                ('consignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='operations.consignment')),
+                ('purchase_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='operations.purchaseorder')),
+                ('reminder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='entities.storerkeyreminder')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('purchase_order__isnull', False)), fields=('reminder', 'purchase_order', 'due_date'), name='sent_reminder_po_uniq'), models.UniqueConstraint(condition=models.Q(('consignment__isnull', False)), fields=('reminder', 'consignment', 'due_date'), name='sent_reminder_consignment_uniq')],
+            },
+        ),
+    ]
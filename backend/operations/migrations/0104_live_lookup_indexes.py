@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0103_sent_reminder'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='consignment',
+            name='consignment_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='purchaseorder',
+            name='po_crn_idx',
+        ),
+        migrations.AddIndex(
+            model_name='consignment',
+            index=models.Index(condition=models.Q(('is_deleted__is', False)), fields=['consignment_id'], name='cons_id_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(condition=models.Q(('is_deleted__is', False)), fields=['customer_reference_number'], name='po_crn_live_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:05
+
+import core.fields
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0104_live_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAuditTrail',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('Consignment', 'Consignment'), ('Purchase Order', 'Purchase Order'), ('Purchase Order Line', 'Purchase Order Line'), ('Console', 'Console')], max_length=30)),
+                ('object_id', models.UUIDField()),
+                ('trail_created_at', models.DateTimeField()),
+                ('trail_updated_at', models.DateTimeField()),
+                ('updated_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAuditTrailField',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, max_length=150, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('attachments', core.fields.MSSQLJSONField(default=list)),
+                ('field_name', models.CharField(max_length=100)),
+                ('old_value', models.TextField(blank=True, null=True)),
+                ('new_value', models.TextField(blank=True, null=True)),
+                ('audit_trail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fields', to='operations.archivedaudittrail')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedaudittrail',
+            index=models.Index(fields=['kind', 'object_id', 'trail_updated_at'], name='archived_trail_object_idx'),
+        ),
+    ]
@@ -15,6 +15,7 @@ from portal.choices import PurchaseOrderStatusChoices, Role, POUploadStatusChoic
 from django.utils import timezone
 from datetime import timedelta
 from core.response import StandardResponse
+from core.scope import get_scope
 from portal.mixins import PaginationMixin
 from django.db.models import Prefetch, Sum
 from collections import defaultdict
@@ -29,6 +30,8 @@ import os
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 from .services import PurchaseOrderService
+from .rollups import track_created
+from portal import search as search_index
 
 # class ConsignmentStagingMixin:
 
@@ -670,6 +673,38 @@ class PurchaseOrderMixin:
 
 
 
+        ## Everything the file refers to, one query per table
+        storer_codes = {po_data.get("storer_key") for po_data in data}
+        storerkeys = {s.storerkey_code: s for s in StorerKey.objects.filter(storerkey_code__in=storer_codes).select_related("client", "hub")}
+        suppliers = {
+            s.supplier_code: s
+            for s in Supplier.objects.filter(
+                supplier_code__in={po_data.get("seller_details", {}).get("seller_code") for po_data in data}
+            ).select_related("client")
+        }
+        clients = {
+            c.client_code: c
+            for c in Client.objects.filter(client_code__in={po_data.get("buyer_details", {}).get("buyer_code") for po_data in data})
+        }
+        supplier_storerkeys = set(
+            Supplier.storerkeys.through.objects
+            .filter(storerkey__storerkey_code__in=storer_codes)
+            .values_list("supplier_id", "storerkey_id")
+        )
+        existing_po_crns = set(
+            PurchaseOrder.objects
+            .filter(customer_reference_number__in={po_data.get("customer_reference_number") for po_data in data})
+            .values_list("customer_reference_number", flat=True)
+        )
+        materials = set(
+            MaterialMaster.objects
+            .filter(
+                product_code__in={line.get("product_code") for po_data in data for line in po_data.get("pieces_detail", [])},
+                storerkey__storerkey_code__in=storer_codes,
+            )
+            .values_list("product_code", "storerkey__storerkey_code", "hub__hub_code")
+        )
+
         for po_data in data:
             supplier_data = po_data.get("seller_details", {})
             client_data = po_data.get("buyer_details", {})
@@ -677,33 +712,32 @@ class PurchaseOrderMixin:
             buyer_code = client_data.get("buyer_code")
             po_crn = po_data.get("customer_reference_number")
 
-            try:
-                storerkey_object = StorerKey.objects.get(storerkey_code=po_data.get("storer_key"))
-                supplier_object = Supplier.objects.select_related("client").get(supplier_code=supplier_data.get("seller_code"))
-                provided_client = Client.objects.get(client_code = buyer_code)
-                client_object = supplier_object.client
-                # supplier_object, client_object = self.enrich_party_details(supplier_data, buyer_code)
-
-            except ValueError as e:
-                add_error(po_crn, str(e))
-                continue
-            except StorerKey.DoesNotExist as e:
+            storerkey_object = storerkeys.get(po_data.get("storer_key"))
+            if not storerkey_object:
                 add_error(po_crn,"Storerkey not found.")
                 continue
-            except Supplier.DoesNotExist:
+
+            supplier_object = suppliers.get(supplier_data.get("seller_code"))
+            if not supplier_object:
                 add_error(po_crn, "Supplier not found.")
                 continue
-            
+
+            provided_client = clients.get(buyer_code)
+            if not provided_client:
+                add_error(po_crn, "Client not found.")
+                continue
+            client_object = supplier_object.client
+
             if client_object != provided_client:
-                add_error(po_crn, "Seller code and buyer code are not linked.")
+                add_error(po_crn,"Seller code and buyer code are not linked.")
 
-            if storerkey_object.client.id != provided_client.id:
+            if storerkey_object.client_id != provided_client.id:
                 add_error(po_crn,"Storer Key is not linked to the client.")
 
-            if not supplier_object.storerkeys.filter(id=storerkey_object.id).exists():
+            if (supplier_object.id, storerkey_object.id) not in supplier_storerkeys:
                 add_error(po_crn,"Storer Key is not linked to the supplier.")
 
-            if PurchaseOrder.objects.filter(customer_reference_number=po_crn).exists():
+            if po_crn in existing_po_crns:
                 add_error(po_crn,f"Purchase Order already exists.")
 
             po_line_cust_ref_numbers = [i.get("customer_reference_number") for i in po_lines]
@@ -741,7 +775,7 @@ class PurchaseOrderMixin:
             
             for po_line in po_lines:
                 
-                if not self.check_material_exists(po_line.get("product_code"), storerkey_object.storerkey_code, po_data.get("group_code")):
+                if (po_line.get("product_code"), storerkey_object.storerkey_code, po_data.get("group_code")) not in materials:
                     error_message = f"Material {po_line.get('product_code')} does not exist for PO : {po_crn} | PO-Line : {po_line['customer_reference_number']}"
                     add_error(po_crn, error_message, is_line=True)
 
@@ -770,6 +804,8 @@ class PurchaseOrderMixin:
 
         try:
             pos = PurchaseOrder.objects.bulk_create(po_to_create)
+            track_created("PO", pos)
+            search_index.reindex(PurchaseOrder, [po.id for po in pos])
         except Exception as e:
             add_error(None, str(e))
             return None, error_for_sheet
@@ -789,9 +825,20 @@ class PurchaseOrderMixin:
     def process_excel_file(self,fileupload_obj):
         try:
             file = fileupload_obj.uploaded_file
-            wb = load_workbook(file, data_only=True)
-            po_entries = self.parse_excel_to_pos(wb)
+            wb = load_workbook(file, read_only=True, data_only=True)
+            try:
+                po_entries = self.parse_excel_to_pos(wb)
+            finally:
+                wb.close()
 
+            # Parsed read-only, the editable workbook is only loaded when there are errors to mark
+            pos, errors = self.create_purchase_orders(po_entries,True)
+            if not errors:
+                fileupload_obj.status = POUploadStatusChoices.SUCCESS
+                fileupload_obj.save()
+                return True
+
+            wb = load_workbook(file, data_only=True)
             po_header_sheet = wb["PO Header"]
             poh_headers = [str(cell.value).strip().lower().replace(" ", "_") for cell in next(po_header_sheet.iter_rows(min_row=1, max_row=1))]
             
@@ -828,24 +875,19 @@ class PurchaseOrderMixin:
                 self.save_error_file(fileupload_obj,wb)
                 return False
             
-            pos, errors = self.create_purchase_orders(po_entries,True)
-
-            if errors:
-                
-                if errors["PO"] :
-                    update_error_in_file(errors["PO"],po_header_sheet,error_col_index)
-                
-                if errors["PO-Line"]:
-                    update_error_in_file(errors["PO-Line"],po_lines_sheet,error_col_index_pol_headers)
-
-                return False
+            if errors["PO"] :
+                update_error_in_file(errors["PO"],po_header_sheet,error_col_index)
             
-            fileupload_obj.status = POUploadStatusChoices.SUCCESS
-            fileupload_obj.save()
-                
-            return True
+            if errors["PO-Line"]:
+                update_error_in_file(errors["PO-Line"],po_lines_sheet,error_col_index_pol_headers)
+
+            return False
         
         except Exception as e:
+            wb = load_workbook(fileupload_obj.uploaded_file, data_only=True)
+            po_header_sheet = wb["PO Header"]
+            poh_headers = [str(cell.value).strip().lower().replace(" ", "_") for cell in next(po_header_sheet.iter_rows(min_row=1, max_row=1))]
+            error_col_index = len(poh_headers) + 1
             unexpected_error_cell = po_header_sheet.cell(row=1, column=error_col_index+1, value="UNEXPECTED ERROR")
             unexpected_error_cell.font = Font(bold=True)
             po_header_sheet.cell(row = 2, column=error_col_index+1, value=str(e))
@@ -874,16 +916,15 @@ class PurchaseOrderMixin:
         return data_to_sent
 
     def check_material_exists(self, product_code, storerkey, hub):
-        return MaterialMaster.objects.filter(product_code=product_code, storerkey__storerkey_code=storerkey, hub__hub_code=hub).exists()
+        return MaterialMaster.all_objects.filter(product_code=product_code, storerkey__storerkey_code=storerkey, hub__hub_code=hub).exists()
 
 class FilterMixin:
 
     def build_filter(self,user,model,filters=None):
 
-        data = {}
         role = user.role
-        profile = user.profile()
-        storerkey_ids = self.get_storerkeys(profile) if profile else []
+        scope = get_scope(user)
+        storerkey_ids = scope["storerkey_ids"]
 
         # Base data for logging or future use
         # data = self.get_base_data(user, profile)
@@ -896,37 +937,37 @@ class FilterMixin:
 
             ## Also add the same filters below for dict filters
             if role == Role.SUPPLIER_USER and model == "PO":
-                filters &= Q(supplier = profile.supplier)
+                filters &= Q(supplier_id = scope["supplier_id"])
 
             if role == Role.SUPPLIER_USER and model == "Consignment":
-                filters &= Q(supplier = profile.supplier)
+                filters &= Q(supplier_id = scope["supplier_id"])
 
             if role == Role.SUPPLIER_USER and model == "PO-Line":
-                filters &= Q(purchase_order__supplier = profile.supplier)
+                filters &= Q(purchase_order__supplier_id = scope["supplier_id"])
 
             if role == Role.CLIENT_USER and model == "PO":
-                filters &= Q(client = profile.client)
+                filters &= Q(client_id = scope["client_id"])
 
             if role == Role.CLIENT_USER and model == "Consignment":
-                filters &= Q(client = profile.client)
+                filters &= Q(client_id = scope["client_id"])
 
         elif isinstance(filters, dict):
             filters.update(self.get_model_dict_filters(model, storerkey_ids))
 
             if role == Role.SUPPLIER_USER and model == "PO":
-                filters["supplier"] = profile.supplier
+                filters["supplier_id"] = scope["supplier_id"]
 
             if role == Role.SUPPLIER_USER and model == "Consignment":
-                filters["supplier"] = profile.supplier
+                filters["supplier_id"] = scope["supplier_id"]
 
             if role == Role.SUPPLIER_USER and model == "PO-Line":
-                filters["purchase_order__supplier"] = profile.supplier
+                filters["purchase_order__supplier_id"] = scope["supplier_id"]
 
             if role == Role.CLIENT_USER and model == "PO":
-                filters["client"] = profile.client
+                filters["client_id"] = scope["client_id"]
 
             if role == Role.CLIENT_USER and model == "Consignment":
-                filters["client"] = profile.client
+                filters["client_id"] = scope["client_id"]
             
             
         return filters
@@ -946,8 +987,8 @@ class FilterMixin:
         if model == "PO":
             return Q(storerkey__in=storerkey_ids)
         elif model == "Consignment":
-            # return Q(purchase_order_lines__purchase_order__storerkey__in=storerkey_ids) | Q(adhoc__storerkey__in=storerkey_ids)
-            return Q(purchase_order_lines__purchase_order__storerkey__in=storerkey_ids)
+            # Denormalized from the allocated PO lines, see Consignment.storerkey
+            return Q(storerkey__in=storerkey_ids)
 
         # Add more model conditions here
         return Q()
@@ -958,8 +999,7 @@ class FilterMixin:
         if model == "PO":
             filter_dict["storerkey__in"] = storerkey_ids
         elif model == "Consignment":
-            filter_dict["purchase_order__storerkey__in"] = storerkey_ids
-            # filter_dict["adhoc__storerkey__in"] = storerkey_ids
+            filter_dict["storerkey__in"] = storerkey_ids
         # Add more model conditions here
         return filter_dict
     
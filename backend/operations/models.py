@@ -2,6 +2,7 @@ from django.db import models
 from django.forms import ValidationError
 # from django.contrib.postgres.fields import ArrayField
 from portal.base import BaseModel
+from portal.soft_delete import live_index
 from portal.choices import (
     POUploadStatusChoices,
     ConsignmentTypeChoices,
@@ -15,22 +16,27 @@ from portal.choices import (
     GLCodeChoices,
     ConsignmentCreationSteps,
     OrderTypeChoices,
-    POImportFormatsChoices
+    POImportFormatsChoices,
+    OutboxStatusChoices,
+    QuantityLedgerKindChoices,
+    AuditTrailKindChoices
 )
 from django.db.models import Sum, Q
-from django.db.models.signals import pre_save, post_delete, post_save
+from django.db.models.signals import pre_save, pre_delete, post_delete, post_save
 from .signals import (
     create_audit_trail, po_audit_trail, poline_audit_trail, delete_file_from_storage, notify_consignment_update, notify_po, notify_po_line
 )
 from core.fields import MSSQLJSONField
-from django.db.models import Max
-from django.db.models.functions import Cast, Substr
-from django.db.models import IntegerField
-from .managers import ConsignmentManager
+from .managers import ConsignmentManager, ConsignmentQuerySet
+from .audit import AuditSnapshotMixin
+from .rollups import rollup_pre_save, rollup_post_save, rollup_post_delete
+from portal import search as search_index
+from .other_services import erp_outbox, quantity_ledger
+from portal.sequences import max_numeric_suffix, next_value
 from decimal import Decimal
 
 
-class PurchaseOrder(BaseModel):
+class PurchaseOrder(AuditSnapshotMixin, BaseModel):
     reference_number = models.CharField(max_length=100, null=True)  # e.g. "TEST001" or EXTERNALPOKEY2 from Aramex request
     customer_reference_number = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -40,6 +46,8 @@ class PurchaseOrder(BaseModel):
     expected_delivery_date = models.DateField(blank=True, null=True)
     order_due_date = models.DateField(blank=True, null=True)
     open_quantity = models.DecimalField(max_digits=20, decimal_places=2) 
+    processed_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0)  # Sum of the lines', kept by the quantity ledger
+    fulfilled_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0)  # Sum of the lines', kept by the quantity ledger
     notes = models.TextField(blank=True, null=True)
     inco_terms = models.CharField(max_length=50, blank=True, null=True)     # e.g. "EXW"
     payment_terms = models.CharField(max_length=100, blank=True, null=True)
@@ -72,25 +80,26 @@ class PurchaseOrder(BaseModel):
     def __str__(self):
         return self.customer_reference_number
     
+    @staticmethod
+    def status_from_lines(line_statuses, current=None):
+        """The PO status implied by the set of its lines' statuses."""
+        if PurchaseOrderStatusChoices.PARTIALLY_FULFILLED in line_statuses:
+            return PurchaseOrderStatusChoices.PARTIALLY_FULFILLED
+        elif PurchaseOrderStatusChoices.OPEN in line_statuses:
+            return PurchaseOrderStatusChoices.OPEN
+        elif PurchaseOrderStatusChoices.CLOSED in line_statuses:
+            return PurchaseOrderStatusChoices.CLOSED
+        elif line_statuses == {PurchaseOrderStatusChoices.CANCELLED}:
+            return PurchaseOrderStatusChoices.CANCELLED
+        return current
+
     def update_status(self):
         po_line_status = PurchaseOrderLine.objects.filter(purchase_order_id=self.id).values_list("status", flat=True)
         
         if not po_line_status:
             return 
 
-        unique_statuses = set(po_line_status)
-
-        if PurchaseOrderStatusChoices.PARTIALLY_FULFILLED in unique_statuses:
-            self.status = PurchaseOrderStatusChoices.PARTIALLY_FULFILLED
-            
-        elif PurchaseOrderStatusChoices.OPEN in unique_statuses:
-            self.status = PurchaseOrderStatusChoices.OPEN
-            
-        elif PurchaseOrderStatusChoices.CLOSED in unique_statuses:
-            self.status = PurchaseOrderStatusChoices.CLOSED
-
-        elif unique_statuses == {PurchaseOrderStatusChoices.CANCELLED}:
-            self.status = PurchaseOrderStatusChoices.CANCELLED
+        self.status = self.status_from_lines(set(po_line_status), self.status)
 
         # print(self.status)
 
@@ -110,7 +119,7 @@ class PurchaseOrder(BaseModel):
     
     class Meta:
         indexes = [
-            models.Index(fields=['customer_reference_number'], name='po_crn_idx'),
+            live_index('customer_reference_number', name='po_crn_live_idx'),
             models.Index(fields=['reference_number'], name='po_reference_idx'),
             models.Index(fields=['supplier'], name='po_supplier_idx'),
             models.Index(fields=['client'], name='po_client_idx'),
@@ -124,10 +133,16 @@ class PurchaseOrder(BaseModel):
         ]
 
 pre_save.connect(po_audit_trail, sender=PurchaseOrder) 
+pre_save.connect(rollup_pre_save, sender=PurchaseOrder)
+post_save.connect(rollup_post_save, sender=PurchaseOrder)
+post_delete.connect(rollup_post_delete, sender=PurchaseOrder)
+search_index.register(PurchaseOrder, title="reference_number", related=["supplier__name"])
+post_save.connect(search_index.search_post_save, sender=PurchaseOrder)
+post_delete.connect(search_index.search_post_delete, sender=PurchaseOrder)
 # post_save.connect(notify_po, sender=PurchaseOrder)
 
 
-class PurchaseOrderLine(BaseModel):
+class PurchaseOrderLine(AuditSnapshotMixin, BaseModel):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name="lines")
     reference_number = models.CharField(max_length=128, null=True)  # e.g. "TEST001" or EXTERNALPOKEY2 from Aramex request
     customer_reference_number = models.CharField(max_length=128)
@@ -251,7 +266,7 @@ pre_save.connect(poline_audit_trail, sender=PurchaseOrderLine)
 # post_save.connect(notify_po_line, sender=PurchaseOrderLine)
 
 
-class Consignment(BaseModel):
+class Consignment(AuditSnapshotMixin, BaseModel):
     consignment_id = models.CharField(max_length=20, unique=True)
     # purchase_order = models.ManyToManyField(PurchaseOrder,through="ConsignmentPurchaseOrder", related_name="consignments",blank=True)
     purchase_order_lines = models.ManyToManyField(PurchaseOrderLine,through="ConsignmentPOLine", related_name="consignments",blank=True)
@@ -259,6 +274,7 @@ class Consignment(BaseModel):
     type = models.CharField(max_length=10, choices=ConsignmentTypeChoices.choices, default=ConsignmentTypeChoices.PO_BASED)
     supplier = models.ForeignKey("entities.Supplier", on_delete=models.CASCADE, related_name="consignments", null=True, blank=True)
     client = models.ForeignKey("entities.Client", on_delete=models.CASCADE, related_name="consignments", null=True, blank=True)
+    storerkey = models.ForeignKey("entities.StorerKey", on_delete=models.SET_NULL, related_name="consignments", null=True, blank=True)  ## storerkey of the allocated PO lines, for list scoping
     consignor_address = models.ForeignKey("portal.AddressBook", on_delete=models.SET_NULL, null=True, blank=True, related_name="consignment_consignor_addresses")
     delivery_address = models.ForeignKey("portal.AddressBook", on_delete=models.SET_NULL, null=True, blank=True, related_name="consignment_delivery_addresses")
     consignment_status = models.CharField(max_length=50, choices=ConsignmentStatusChoices.choices, default=ConsignmentStatusChoices.PENDING_FOR_APPROVAL)
@@ -282,6 +298,7 @@ class Consignment(BaseModel):
     last_bol_gen_by = models.ForeignKey("accounts.User", on_delete=models.SET_NULL, null=True, blank=True, related_name="bol_generated_by")
     step = models.CharField(max_length=10, choices=ConsignmentCreationSteps.choices, default=ConsignmentCreationSteps.STEP_1)
     objects = ConsignmentManager()
+    all_objects = ConsignmentQuerySet.as_manager()
     def __str__(self):
         return f"Consignment {self.consignment_id}"
 
@@ -289,27 +306,15 @@ class Consignment(BaseModel):
         if not self.consignment_id:
 
             if self.consignment_status == ConsignmentStatusChoices.DRAFT:
-                max_num = (
-                    Consignment.objects
-                    .filter(consignment_status=ConsignmentStatusChoices.DRAFT)
-                    .annotate(num_part=Cast(Substr('consignment_id', 6), IntegerField()))
-                    .aggregate(max_num=Max('num_part'))
-                    .get('max_num')
-                ) or 0  # Handle None
-
-                self.consignment_id = f"DRAFT{max_num + 1}"
+                self.consignment_id = "DRAFT{0}".format(
+                    next_value('consignment_draft', seed=lambda: max_numeric_suffix(Consignment.all_objects, 'consignment_id', 'DRAFT'))
+                )
 
         elif self.consignment_id and self.consignment_id.startswith("DRAFT") and self.consignment_status == ConsignmentStatusChoices.PENDING_FOR_APPROVAL:
 
-            max_num = (
-                Consignment.objects
-                .filter(~Q(consignment_status=ConsignmentStatusChoices.DRAFT))
-                .annotate(num_part=Cast(Substr('consignment_id', 4), IntegerField()))
-                .aggregate(max_num=Max('num_part'))
-                .get('max_num')
-            ) or 0  # Handle None
-
-            self.consignment_id = "PKU{0:0=5d}".format(max_num + 1)
+            self.consignment_id = "PKU{0:0=5d}".format(
+                next_value('consignment', seed=lambda: max_numeric_suffix(Consignment.all_objects, 'consignment_id', 'PKU'))
+            )
 
         super().save(*args, **kwargs)
                 
@@ -418,13 +423,14 @@ class Consignment(BaseModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=['consignment_id'], name='consignment_id_idx'),
+            live_index('consignment_id', name='cons_id_live_idx'),
             models.Index(fields=['supplier'], name='consignment_supplier_idx'),
             models.Index(fields=['client'], name='consignment_client_idx'),
             models.Index(fields=['console'], name='consignment_console_idx'),
             models.Index(fields=['consignment_status'], name='consignment_status_idx'),
             models.Index(fields=['consignment_status', 'is_deleted'], name='consignment_status_deleted_idx'),
             models.Index(fields=['supplier', 'consignment_status', 'is_deleted'], name='cons_supplier_status_idx'),
+            models.Index(fields=['storerkey', 'consignment_status'], name='cons_storerkey_status_idx'),
             models.Index(fields=['console', 'consignment_status'], name='consignment_console_status_idx'),
             models.Index(fields=['created_by'], name='consignment_created_by_idx'),
             models.Index(fields=['created_at', 'is_deleted'], name='cons_created_deleted_idx'),
@@ -434,6 +440,14 @@ class Consignment(BaseModel):
         ]
 
 pre_save.connect(create_audit_trail, sender=Consignment)
+pre_save.connect(rollup_pre_save, sender=Consignment)
+post_save.connect(rollup_post_save, sender=Consignment)
+post_delete.connect(rollup_post_delete, sender=Consignment)
+search_index.register(Consignment, title="consignment_id", related=["supplier__name", "client__name", "console__console_id"])
+post_save.connect(search_index.search_post_save, sender=Consignment)
+post_delete.connect(search_index.search_post_delete, sender=Consignment)
+post_save.connect(erp_outbox.outbox_post_save, sender=Consignment)
+pre_delete.connect(quantity_ledger.ledger_pre_delete, sender=Consignment)
 # post_save.connect(notify_consignment_update, sender=Consignment) 
 
 
@@ -518,7 +532,22 @@ class ConsignmentPackaging(BaseModel):
 
 
 
-class ComprehensiveReport(BaseModel):
+class JobStateMixin(models.Model):
+    """
+    Claim bookkeeping for rows processed by the background job runner
+    (operations.other_services.job_runner).
+    """
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)   ## touched by the worker while the job runs
+    next_attempt_at = models.DateTimeField(null=True, blank=True)   ## retry backoff, not claimed before this
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class ComprehensiveReport(JobStateMixin, BaseModel):
     user = models.ForeignKey("accounts.User", on_delete=models.SET_NULL, null=True)
     from_date = models.DateTimeField()
     to_date = models.DateTimeField()
@@ -820,12 +849,14 @@ class PurchaseOrderLineDetail(BaseModel):
     
     
 
-class PurchaseOrderUpload(BaseModel):
+class PurchaseOrderUpload(JobStateMixin, BaseModel):
     status = models.CharField(max_length=15, choices=POUploadStatusChoices.choices, default=POUploadStatusChoices.IN_PROGRESS)
     uploaded_file = models.FileField(upload_to="po/upload/")
     error_file = models.FileField(upload_to="po/upload/errors/", null=True, blank=True)
     uploaded_by = models.ForeignKey("accounts.User", on_delete=models.SET_NULL, null=True, blank=True)
     file_format = models.CharField(max_length=15, choices=POImportFormatsChoices.choices, default=POImportFormatsChoices.PO)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
 
 
 
@@ -859,4 +890,127 @@ class AuditTrailField(BaseModel):
     attachments = MSSQLJSONField(default=list)
     field_name = models.CharField(max_length=100)
     old_value = models.TextField(null=True, blank=True)
-    new_value = models.TextField(null=True, blank=True)
\ No newline at end of file
+    new_value = models.TextField(null=True, blank=True)
+
+
+class ArchivedAuditTrail(BaseModel):
+    """
+    Cold tier of the consignment, PO and console audit trails: trails of
+    closed objects past the retention window, moved here in batches by
+    operations.other_services.audit_archive with the ids they had. The
+    object is referenced by id only, the hot tables cascade on it.
+    """
+    kind = models.CharField(max_length=30, choices=AuditTrailKindChoices.choices)
+    object_id = models.UUIDField()
+    updated_by = models.ForeignKey("accounts.User", on_delete=models.CASCADE, related_name="+")
+    ## created_at / updated_at of the trail, created_at here is when it was archived
+    trail_created_at = models.DateTimeField()
+    trail_updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id', 'trail_updated_at'], name='archived_trail_object_idx'),
+        ]
+
+
+class ArchivedAuditTrailField(BaseModel):
+    audit_trail = models.ForeignKey(ArchivedAuditTrail, on_delete=models.CASCADE, related_name="fields")
+    title = models.CharField(max_length=150, null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    attachments = MSSQLJSONField(default=list)
+    field_name = models.CharField(max_length=100)
+    old_value = models.TextField(null=True, blank=True)
+    new_value = models.TextField(null=True, blank=True)
+
+
+
+class StatusRollup(BaseModel):
+    """
+    Number of consignments / POs per (storerkey, supplier, client, status,
+    creation day), kept up to date from status changes (see operations.rollups)
+    so the dashboards don't aggregate the base tables. Rebuild with the
+    rebuild_status_rollups command.
+    """
+    model = models.CharField(max_length=20)     ## "Consignment" or "PO"
+    storerkey = models.ForeignKey("entities.StorerKey", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    supplier = models.ForeignKey("entities.Supplier", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    client = models.ForeignKey("entities.Client", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=50)
+    day = models.DateField()
+    is_completed = models.BooleanField(default=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'day', 'status'], name='rollup_model_day_status_idx'),
+            models.Index(fields=['model', 'storerkey', 'day'], name='rollup_model_sk_day_idx'),
+        ]
+
+
+class QuantityLedgerEntry(BaseModel):
+    """
+    A change to a PO line's processed (allocated, in transit) or fulfilled
+    (delivered, received) quantity, posted per consignment by
+    operations.other_services.quantity_ledger. The line and PO totals are
+    the running sums of these rows.
+    """
+    purchase_order_line = models.ForeignKey(PurchaseOrderLine, on_delete=models.CASCADE, related_name="ledger_entries")
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name="ledger_entries")
+    consignment = models.ForeignKey(Consignment, on_delete=models.SET_NULL, null=True, blank=True, related_name="ledger_entries")
+    kind = models.CharField(max_length=20, choices=QuantityLedgerKindChoices.choices)
+    processed_delta = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    fulfilled_delta = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['consignment', 'purchase_order_line'], name='ledger_consignment_line_idx'),
+            models.Index(fields=['purchase_order_line', 'created_at'], name='ledger_line_created_idx'),
+        ]
+
+
+class OutboxMessage(BaseModel):
+    """
+    A row waiting to be exported to the ERP, written in the same transaction
+    as the change that produced it and sent in batches by
+    operations.other_services.erp_outbox.
+    """
+    target = models.CharField(max_length=50)      ## e.g. "shipping_mapping"
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    consignment = models.ForeignKey(Consignment, on_delete=models.SET_NULL, null=True, blank=True, related_name="outbox_messages")
+    payload = MSSQLJSONField(default=dict)
+    status = models.CharField(max_length=20, choices=OutboxStatusChoices.choices, default=OutboxStatusChoices.QUEUE)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['target', 'status', 'next_attempt_at'], name='outbox_target_status_idx'),
+        ]
+
+
+class SentReminder(BaseModel):
+    """
+    An expediting reminder already sent for a PO or consignment, keyed on the
+    date it was counted from so a rescheduled date is reminded again
+    (see operations.other_services.expediting_reminders).
+    """
+    reminder = models.ForeignKey('entities.StorerKeyReminder', on_delete=models.CASCADE, related_name="sent_reminders")
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, null=True, blank=True, related_name="sent_reminders")
+    consignment = models.ForeignKey(Consignment, on_delete=models.CASCADE, null=True, blank=True, related_name="sent_reminders")
+    due_date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['reminder', 'purchase_order', 'due_date'],
+                condition=models.Q(purchase_order__isnull=False),
+                name='sent_reminder_po_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['reminder', 'consignment', 'due_date'],
+                condition=models.Q(consignment__isnull=False),
+                name='sent_reminder_consignment_uniq',
+            ),
+        ]
@@ -1,9 +1,122 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
+
 from core.response import StandardResponse, ServiceError
-from django.db import transaction
-from django.db.models import Q
+from django.db import DEFAULT_DB_ALIAS, transaction
 from portal.choices import ConsignmentStatusChoices, NotificationChoices, Role, OperationUserRole
 from portal.models import Notification, UserNotification
-from accounts.models import User
+from core import recipients as recipient_directory
+from core.notification_state import invalidate_unread
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class NotificationBuffer:
+    """
+    Notifications sent inside a transaction or notification_batch(), fanned
+    out with one bulk insert for the Notification rows and one for their
+    UserNotification rows.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, user_ids, fields):
+        self.entries.append((user_ids, fields))
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        if not entries:
+            return
+
+        # A burst can repeat the same event for the same recipient set (a status
+        # set twice in one request), each goes out once
+        events = {}
+        for user_ids, fields in entries:
+            key = (tuple(sorted(user_ids)), json.dumps(fields, sort_keys=True, default=str))
+            events.setdefault(key, (user_ids, fields))
+
+        notifications, links, user_ids_notified = [], [], set()
+        for user_ids, fields in events.values():
+            notification = Notification(**fields)
+            notifications.append(notification)
+            links.extend(UserNotification(user_id=user_id, notification=notification) for user_id in user_ids)
+            user_ids_notified.update(user_ids)
+
+        with transaction.atomic():
+            Notification.objects.bulk_create(notifications, batch_size=500)
+            UserNotification.objects.bulk_create(links, batch_size=1000)
+        invalidate_unread(user_ids_notified)
+
+    def flush_committed(self):
+        # Runs after the caller's commit, a failure can't undo their work anymore
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Notification fan-out failed")
+
+
+def _is_registered(connection, callback):
+    return any(item[1] is callback for item in connection.run_on_commit)
+
+
+def _buffer(user_ids, fields, using=DEFAULT_DB_ALIAS):
+    """
+    Queue a notification on the open notification_batch() or transaction,
+    False in autocommit mode outside a batch. Notifications sent inside a
+    savepoint are dropped when it rolls back.
+    """
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        # Joins the batch once the atomic block around it commits, right away outside one
+        transaction.on_commit(partial(batch.add, user_ids, fields), using=using)
+        return True
+
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return False
+
+    # One buffer per transaction and savepoint, fanned out once the
+    # transaction commits and discarded with the savepoint on rollback
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    savepoints = tuple(connection.savepoint_ids)
+    key = (using, len(savepoints))
+    pending = buffers.get(key)
+    if pending is None or pending[0] != savepoints or not _is_registered(connection, pending[2]):
+        buffer = NotificationBuffer()
+        callback = buffer.flush_committed
+        transaction.on_commit(callback, using=using)
+        buffers[key] = pending = (savepoints, buffer, callback)
+    pending[1].add(user_ids, fields)
+    return True
+
+
+@contextmanager
+def notification_batch(using=DEFAULT_DB_ALIAS):
+    """
+    Collect every notification sent inside the block and fan them out in
+    one go on exit (on commit when a transaction is open). Use it around
+    loops that notify per consignment or PO. Nothing is sent when the block
+    raises, nor what atomic blocks inside it sent before rolling back.
+    """
+    if getattr(_local, "batch", None) is not None:
+        # Nested: the outer batch writes everything
+        yield
+        return
+
+    batch = _local.batch = NotificationBuffer()
+    try:
+        yield
+    finally:
+        _local.batch = None
+    transaction.on_commit(batch.flush_committed, using=using)
 
 
 class NotificationService:
@@ -20,61 +133,46 @@ class NotificationService:
     @staticmethod
     def get_users_by_roles(instance=None, roles=None, ops_roles=None, notify_supplier=False, notify_client=False):
         """
-        Returns a list of users filtered by roles, operation roles, and optionally supplier/client relationships.
+        Returns the ids of the users filtered by roles, operation roles, and optionally
+        supplier/client relationships, from the cached recipient sets (core.recipients).
         """
-        filters = Q()
-
-        if roles:
-            filters |= Q(role__in=roles)
-        if ops_roles:
-            filters |= Q(operations_profile__access_level__in=ops_roles)
-
-        # Base user queryset
-        users_qs = User.objects.filter(filters).distinct()
-
-        # Include supplier/client users if applicable
-        if instance:
-            extra_q = Q()
-            if notify_supplier and getattr(instance, "supplier", None):
-                extra_q |= Q(supplier_profile__supplier=instance.supplier)
-            if notify_client and getattr(instance, "client", None):
-                extra_q |= Q(client_profile__client=instance.client)
-
-            if extra_q:
-                users_qs = users_qs.union(User.objects.filter(extra_q).distinct())
-                # combined_qs = users_qs | User.objects.filter(extra_q).distinct()
-                # combined_qs = combined_qs.distinct()
-            
-        return list(users_qs)
+        return recipient_directory.resolve(
+            roles=roles,
+            ops_roles=ops_roles,
+            supplier_id=getattr(instance, "supplier_id", None) if notify_supplier else None,
+            client_id=getattr(instance, "client_id", None) if notify_client else None,
+        )
 
 
     @classmethod
-    @transaction.atomic
     def send_notification(cls, users, header, message, type, hyperlink_value=None,attachment=None):
         """
-        Sends a notification to a list of users and links them through UserNotification.
+        Sends a notification to a list of users (or user ids) and links them through
+        UserNotification. Inside a transaction the rows are written once it commits,
+        together with everything else sent in it.
         """
         try:
             if not users:
                 return
 
-            user_ids = [u.id for u in users]
-            User.objects.filter(id__in=user_ids).update(has_notif=True)
-
-            notification = Notification.objects.create(
-                header=header,
-                type=type,
-                message=message,
-                hyperlink_value=hyperlink_value,
-                attachment=attachment,
-            )
+            # Role and supplier/client lookups can overlap
+            user_ids = list(dict.fromkeys(str(getattr(u, "id", u)) for u in users))
+            fields = {
+                "header": header,
+                "type": type,
+                "message": message,
+                "hyperlink_value": hyperlink_value,
+                "attachment": attachment,
+            }
+
+            if _buffer(user_ids, fields):
+                return
 
-            UserNotification.objects.bulk_create(
-                [UserNotification(user=u, notification=notification) for u in users]
-            )
+            buffer = NotificationBuffer()
+            buffer.add(user_ids, fields)
+            buffer.flush()
 
         except Exception as e:
-            transaction.set_rollback(True)
             raise ServiceError(error=f"Notification error: {str(e)}", success=False, status=500)
             # return StandardResponse(success=False, status=500, errors=[f"Notification error: {str(e)}"])
 
@@ -106,7 +204,11 @@ class NotificationService:
 
 
     @classmethod
-    def consignment_update(cls, instance, user, header=None, message=None, hyperlink_value={}):
+    def consignment_update(cls, instance, user, header=None, message=None, hyperlink_value={}, recipients=None):
+        """
+        `recipients` is an optional dict shared across calls for many
+        consignments, so users are looked up once per supplier/client.
+        """
         try:
             consignment_status = instance.consignment_status
 
@@ -119,13 +221,21 @@ class NotificationService:
             ]
             client_status = [ConsignmentStatusChoices.DELIVERED,ConsignmentStatusChoices.RECEIVED_AT_DESTINATION]
 
-            users = cls.get_users_by_roles(
-                instance=instance,
-                roles=[Role.ADMIN],
-                ops_roles=[OperationUserRole.L1, OperationUserRole.L2],
-                notify_supplier=True if consignment_status in supplier_status else False,
-                notify_client=True if consignment_status in client_status else False,
-            )
+            notify_supplier = consignment_status in supplier_status
+            notify_client = consignment_status in client_status
+            key = (notify_supplier and instance.supplier_id, notify_client and instance.client_id)
+
+            users = recipients.get(key) if recipients is not None else None
+            if users is None:
+                users = cls.get_users_by_roles(
+                    instance=instance,
+                    roles=[Role.ADMIN],
+                    ops_roles=[OperationUserRole.L1, OperationUserRole.L2],
+                    notify_supplier=notify_supplier,
+                    notify_client=notify_client,
+                )
+                if recipients is not None:
+                    recipients[key] = users
 
             if not header:
                 header = "Pickup Request {consignment_id} " + consignment_status
@@ -229,8 +339,8 @@ class NotificationService:
                 # notify_supplier=True,
                 # notify_client=True,
             )
-            if user not in users:
-                users.append(user)
+            if str(user.id) not in users:
+                users.append(str(user.id))
 
             attachment = None
             if po_upload:
@@ -265,8 +375,8 @@ class NotificationService:
                 # notify_supplier=True,
                 # notify_client=True,
             )
-            if user not in users:
-                users.append(user)
+            if str(user.id) not in users:
+                users.append(str(user.id))
 
             return cls.send_notification(
                 users=users,
@@ -0,0 +1,224 @@
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from portal.choices import (
+    AuditTrailKindChoices,
+    ConsignmentStatusChoices,
+    ConsoleStatusChoices,
+    PurchaseOrderStatusChoices,
+)
+
+
+logger = logging.getLogger(__name__)
+
+## Rows per INSERT, under the MSSQL limit of 2100 parameters
+WRITE_BATCH_SIZE = 100
+
+## Change columns carried over to ArchivedAuditTrailField, where the source has them
+FIELD_NAMES = ("title", "description", "attachments", "field_name", "old_value", "new_value")
+
+
+class TrailSource:
+    """
+    The hot audit tables of one kind of object: `object_field` is the trail's
+    foreign key to the object, which is closed once its `status_field` is
+    in `closed`.
+    """
+
+    def __init__(self, kind, trail_model, field_model, object_field, status_field, closed):
+        self.kind = kind
+        self.trail_model_name = trail_model
+        self.field_model_name = field_model
+        self.object_field = object_field
+        self.status_field = status_field
+        self.closed = list(closed)
+
+    @property
+    def trail_model(self):
+        return apps.get_model(self.trail_model_name)
+
+    @property
+    def field_model(self):
+        return apps.get_model(self.field_model_name)
+
+    @property
+    def field_names(self):
+        names = {field.name for field in self.field_model._meta.concrete_fields}
+        return [name for name in FIELD_NAMES if name in names]
+
+    def archivable(self, cutoff):
+        """Trails older than `cutoff` of objects closed and left untouched since."""
+        return self.trail_model.all_objects.filter(
+            created_at__lt=cutoff,
+            **{
+                f"{self.object_field}__{self.status_field}__in": self.closed,
+                f"{self.object_field}__updated_at__lt": cutoff,
+            },
+        )
+
+
+SOURCES = {
+    source.kind: source for source in [
+        TrailSource(
+            AuditTrailKindChoices.CONSIGNMENT, "operations.ConsignmentAuditTrail", "operations.ConsignmentAuditTrailField",
+            "consignment", "consignment_status", [ConsignmentStatusChoices.DELIVERED, ConsignmentStatusChoices.CANCELLED],
+        ),
+        TrailSource(
+            AuditTrailKindChoices.PURCHASE_ORDER, "operations.AuditTrail", "operations.AuditTrailField",
+            "po_audit_trail", "status", [PurchaseOrderStatusChoices.CLOSED, PurchaseOrderStatusChoices.CANCELLED],
+        ),
+        TrailSource(
+            AuditTrailKindChoices.PURCHASE_ORDER_LINE, "operations.AuditTrail", "operations.AuditTrailField",
+            "po_line_audit_trail", "status", [PurchaseOrderStatusChoices.CLOSED, PurchaseOrderStatusChoices.CANCELLED],
+        ),
+        TrailSource(
+            AuditTrailKindChoices.CONSOLE, "workflows.ConsoleAuditTrail", "workflows.ConsoleAuditTrailField",
+            "console", "console_status", [ConsoleStatusChoices.DELIVERED, ConsoleStatusChoices.CANCELLED],
+        ),
+    ]
+}
+
+
+def _cutoff(retention_days=None):
+    if retention_days is None:
+        retention_days = getattr(settings, "AUDIT_ARCHIVE_RETENTION_DAYS", 180)
+    return timezone.now() - timedelta(days=retention_days)
+
+
+## -------- Archiving --------
+
+def _archive_batch(source, cutoff, batch_size):
+    from operations.models import ArchivedAuditTrail, ArchivedAuditTrailField
+
+    trail_model, field_model = source.trail_model, source.field_model
+    candidates = list(source.archivable(cutoff).order_by("created_at").values_list("id", flat=True)[:batch_size])
+    if not candidates:
+        return 0
+
+    with transaction.atomic():
+        # Rows another run is moving are skipped, and gone once it commits
+        ids = list(
+            trail_model.all_objects.select_for_update(skip_locked=True)
+            .filter(id__in=candidates)
+            .values_list("id", flat=True)
+        )
+        if not ids:
+            return 0
+
+        ArchivedAuditTrail.objects.bulk_create(
+            [
+                ArchivedAuditTrail(
+                    id=row["id"],
+                    kind=source.kind,
+                    object_id=row["object_id"],
+                    updated_by_id=row["updated_by_id"],
+                    trail_created_at=row["created_at"],
+                    trail_updated_at=row["updated_at"],
+                )
+                for row in trail_model.all_objects.filter(id__in=ids).values(
+                    "id", "updated_by_id", "created_at", "updated_at", object_id=F(f"{source.object_field}_id"),
+                )
+            ],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        fields = field_model.all_objects.filter(audit_trail_id__in=ids)
+        ArchivedAuditTrailField.objects.bulk_create(
+            [ArchivedAuditTrailField(**row) for row in fields.values("id", "audit_trail_id", *source.field_names)],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        fields.delete()
+        trail_model.all_objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive(retention_days=None, batch_size=None, kinds=None):
+    """
+    Move the trails of closed objects older than the retention window (and
+    their field changes) to the archive tables, a transaction per batch.
+    Returns {kind: trails archived}.
+    """
+    cutoff = _cutoff(retention_days)
+    batch_size = batch_size or getattr(settings, "AUDIT_ARCHIVE_BATCH_SIZE", 1000)
+    archived = {}
+    for kind in kinds or SOURCES:
+        source = SOURCES[kind]
+        archived[kind] = 0
+        while True:
+            moved = _archive_batch(source, cutoff, batch_size)
+            if not moved:
+                break
+            archived[kind] += moved
+        if archived[kind]:
+            logger.info("Archived %s %s audit trails", archived[kind], kind)
+    return archived
+
+
+def pending(retention_days=None, kinds=None):
+    """{kind: trails archive() would move}."""
+    cutoff = _cutoff(retention_days)
+    return {kind: SOURCES[kind].archivable(cutoff).count() for kind in kinds or SOURCES}
+
+
+## -------- Reading --------
+
+def _trails(trails, fields, field_names, created_at, updated_at):
+    rows = {
+        row["id"]: {
+            "id": row["id"],
+            "updated_by": row["updated_by_name"],
+            "created_at": row[created_at],
+            "updated_at": row[updated_at],
+            "fields": [],
+        }
+        for row in trails.values("id", created_at, updated_at, updated_by_name=F("updated_by__name"))
+    }
+    if rows:
+        # A subquery rather than the ids, objects can have more trails than MSSQL takes parameters
+        for field in fields.filter(audit_trail__in=trails.values("id")).values("audit_trail_id", *field_names):
+            rows[field.pop("audit_trail_id")]["fields"].append(field)
+    return list(rows.values())
+
+
+def trails(kind, object_id):
+    """
+    Audit trails of an object across the hot and archive tables, newest
+    first, as {"id", "updated_by", "created_at", "updated_at", "fields"}
+    dicts with the trail's own timestamps.
+    """
+    from operations.models import ArchivedAuditTrail, ArchivedAuditTrailField
+
+    source = SOURCES[kind]
+    hot = _trails(
+        source.trail_model.objects.filter(**{f"{source.object_field}_id": object_id}),
+        source.field_model.objects, source.field_names, "created_at", "updated_at",
+    )
+    archived = _trails(
+        ArchivedAuditTrail.objects.filter(kind=kind, object_id=object_id),
+        ArchivedAuditTrailField.objects, source.field_names, "trail_created_at", "trail_updated_at",
+    )
+    return sorted(hot + archived, key=lambda row: row["updated_at"], reverse=True)
+
+
+def has_archived(kind, object_id):
+    from operations.models import ArchivedAuditTrail
+
+    return ArchivedAuditTrail.objects.filter(kind=kind, object_id=object_id).exists()
+
+
+def archived_fields(kind, object_ids, **filters):
+    """
+    ArchivedAuditTrailField queryset of the objects `object_ids` (ids or a
+    subquery), for aggregations that also have to cover the archive.
+    The trail's time is audit_trail__trail_created_at.
+    """
+    from operations.models import ArchivedAuditTrailField
+
+    return ArchivedAuditTrailField.objects.filter(
+        Q(audit_trail__kind=kind, audit_trail__object_id__in=object_ids), **filters
+    )
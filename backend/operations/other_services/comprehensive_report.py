@@ -0,0 +1,313 @@
+import csv
+import os
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from uuid import uuid4
+
+from django.core.files import File
+from django.db.models import F, Max, Min, Q
+from django.utils.timezone import is_aware, make_naive
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from operations.models import (
+    ConsignmentAuditTrailField, ConsignmentDocument, ConsignmentDocumentAttachment, ConsignmentPOLine, PackagingAllocation
+)
+from operations.unit_conversion import convert_dimension, weight_expression
+from operations.utils import parse_any_date
+from operations.other_services import audit_archive
+from portal.choices import AuditTrailKindChoices, ConsignmentDocumentTypeChoices, ConsignmentStatusChoices, PackageStatusChoices
+
+
+def _local(value):
+    # Stored in UTC, a date is the day in the current time zone
+    if value is not None and is_aware(value):
+        return make_naive(value)
+    return value
+
+
+@lru_cache(maxsize=1024)
+def _dimensions_in_inches(length, width, height, unit):
+    # Packaging types repeat across packages, so each combination is converted once
+    return " * ".join(str(convert_dimension(value, unit, "Inch")) for value in (length, width, height))
+
+
+class ComprehensiveReportEngine:
+    """
+    Builds the pickup comprehensive report with a fixed number of queries:
+    one pivot over the audit trail for the status milestones, one for the
+    line compliance and one streamed join over allocations, packages, lines
+    and consignments. Rows are written straight into a write-only xlsx or a
+    csv file, so memory stays flat however many packages are in the report.
+    """
+
+    CHUNK_SIZE = 2000
+    KEEP_REPORTS = 5
+
+    ## Report column -> (status reached, first or last time it was reached)
+    MILESTONES = {
+        "collection_approval_date": (ConsignmentStatusChoices.PENDING_CONSOLE_ASSIGNMENT, "first"),
+        "actual_delivery_date": (ConsignmentStatusChoices.DELIVERED, "first"),
+        "pick_up_required_date": (ConsignmentStatusChoices.FREIGHT_FORWARDER_ASSIGNED, "first"),
+        "actual_pickup_date": (ConsignmentStatusChoices.PICKUP_COMPLETED, "first"),
+        "quote_requested_date": (ConsignmentStatusChoices.PENDING_BID, "first"),
+        "quote_approval_date": (ConsignmentStatusChoices.CONSOLE_ASSIGNED, "last"),
+        "shipped_date": (ConsignmentStatusChoices.RECEIVED_AT_DESTINATION, "first"),
+        "atd": (ConsignmentStatusChoices.RECEIVED_AT_DESTINATION, "first"),
+    }
+
+    ## Columns the portal does not track yet
+    PLACEHOLDERS = {
+        "is_kit": "-",
+        "transaction_type": "PO",
+        "green_light_release_date": "-",
+        "ncr_reference": "-",
+        "ncr_created_date": "-",
+        "ncr_closed_date": "-",
+        "customs_cleared_date": "-",
+        "age_range": "-",
+        "classification": "-",
+        "urgent_priority_order": "-",
+        "remarks": "-",
+        "hawb": "-",
+        "mawb": "-",
+        "bol": "-",
+        "nvision_sync_status": "NO",
+        "asn_aa_applicable": "-",
+        "asn_reference": "-",
+        "aa_reference": "-",
+        "approved_by": "-",
+        "dangerous_good_un_class": "-",
+        "dangerous_good_name": "-",
+        "dangerous_good_class": "-",
+        "eccn": "-",
+        "hscode": "-",
+        "receiption_date": "-",
+        "receiption_status": "-",
+        "etd": "-",
+        "eta": "-",
+        "ata": "-",
+        "tracking_url": "-",
+    }
+
+    PACKAGE_FIELDS = {
+        "consignment_pk": "consignment_packaging__consignment_id",
+        "line_pk": "purchase_order_line_id",
+        "is_dangerous_good": "is_dangerous_good",
+        "package_id": "consignment_packaging__package_id",
+        "pickup_id": "consignment_packaging__consignment__consignment_id",
+        "console_id": "consignment_packaging__consignment__console__console_id",
+        "weight_unit": "consignment_packaging__weight_unit",
+        "length": "consignment_packaging__packaging_type__length",
+        "width": "consignment_packaging__packaging_type__width",
+        "height": "consignment_packaging__packaging_type__height",
+        "dimension_unit": "consignment_packaging__packaging_type__dimension_unit",
+        "package_type": "consignment_packaging__packaging_type__package_type",
+        "is_stackable": "consignment_packaging__packaging_type__is_stackable",
+        "supplier_customer_code": "consignment_packaging__consignment__supplier__supplier_code",
+        "supplier_customer_name": "consignment_packaging__consignment__supplier__name",
+        "transection_number": "purchase_order_line__purchase_order__customer_reference_number",
+        "transaction_line": "purchase_order_line__customer_reference_number",
+        "product_code": "purchase_order_line__product_code",
+        "quantity": "allocated_qty",
+        "uom": "purchase_order_line__sku",
+        "pickup_creation_date": "consignment_packaging__consignment__created_at",
+        "collection_status": "consignment_packaging__status",
+        "sloc": "purchase_order_line__purchase_order__center_code",
+        "plant_code": "purchase_order_line__purchase_order__plant_id",
+        "pickup_status": "consignment_packaging__consignment__consignment_status",
+        "carrier": "consignment_packaging__consignment__console__freight_forwarder__name",
+        "sender_name": "consignment_packaging__consignment__consignor_address__address_name",
+        "sender_address": "consignment_packaging__consignment__consignor_address__address_name",
+        "sender_pincode": "consignment_packaging__consignment__consignor_address__zipcode",
+        "sender_city": "consignment_packaging__consignment__consignor_address__city",
+        "sender_state": "consignment_packaging__consignment__consignor_address__state",
+        "sender_country": "consignment_packaging__consignment__consignor_address__country",
+        "destination_name": "consignment_packaging__consignment__delivery_address__address_name",
+        "destination_address": "consignment_packaging__consignment__delivery_address__address_name",
+        "destination_pincode": "consignment_packaging__consignment__delivery_address__zipcode",
+        "destination_city": "consignment_packaging__consignment__delivery_address__city",
+        "destination_state": "consignment_packaging__consignment__delivery_address__state",
+        "destination_country": "consignment_packaging__consignment__delivery_address__country",
+        "created_by": "consignment_packaging__consignment__created_by__name",
+    }
+
+    def __init__(self, consignments_qs, file_format="xlsx"):
+        self.consignments_qs = consignments_qs
+        self.file_format = file_format
+        # Keeps the consignment filter inside each query instead of shipping the ids around
+        self.consignment_ids = consignments_qs.values("id")
+
+    def milestones(self):
+        """
+        First/last time each consignment reached the milestone statuses,
+        pivoted to one row per consignment in a grouped query per audit tier.
+        """
+        def aggregates(created_at):
+            return {
+                key: (Min if position == "first" else Max)(created_at, filter=Q(title=f"Consignment {status}"))
+                for key, (status, position) in self.MILESTONES.items()
+            }
+        titles = {f"Consignment {status}" for status, _ in self.MILESTONES.values()}
+
+        rows = (
+            ConsignmentAuditTrailField.objects
+            .filter(audit_trail__consignment_id__in=self.consignment_ids, title__in=titles)
+            .values("audit_trail__consignment_id")
+            .annotate(**aggregates("created_at"))
+            .order_by()
+        )
+        milestones = {row.pop("audit_trail__consignment_id"): row for row in rows}
+
+        archived = (
+            audit_archive.archived_fields(AuditTrailKindChoices.CONSIGNMENT, self.consignment_ids, title__in=titles)
+            .values("audit_trail__object_id")
+            .annotate(**aggregates("audit_trail__trail_created_at"))
+            .order_by()
+        )
+        for row in archived:
+            dates = milestones.setdefault(row.pop("audit_trail__object_id"), {})
+            for key, (_, position) in self.MILESTONES.items():
+                values = [value for value in (dates.get(key), row[key]) if value is not None]
+                dates[key] = (min if position == "first" else max)(values) if values else None
+        return milestones
+
+    def compliances(self):
+        rows = (
+            ConsignmentPOLine.objects
+            .filter(consignment_id__in=self.consignment_ids)
+            .values(
+                "consignment_id", "purchase_order_line_id", "compliance_dg", "eccn", "hs_code",
+                dg_class_name=F("dg_class__name"), dg_category_name=F("dg_category__name"),
+            )
+        )
+        return {(row["consignment_id"], row["purchase_order_line_id"]): row for row in rows}
+
+    def packages(self):
+        return (
+            PackagingAllocation.objects
+            .filter(consignment_packaging__consignment_id__in=self.consignment_ids)
+            .exclude(consignment_packaging__status__in=[PackageStatusChoices.DRAFT])
+            .values(
+                *[key for key, path in self.PACKAGE_FIELDS.items() if key == path],
+                **{key: F(path) for key, path in self.PACKAGE_FIELDS.items() if key != path},
+                weight=weight_expression("consignment_packaging__weight", "consignment_packaging__weight_unit", "Pound"),
+            )
+            .order_by("consignment_packaging__consignment__consignment_id", "consignment_packaging__package_id")
+            .iterator(chunk_size=self.CHUNK_SIZE)
+        )
+
+    def rows(self):
+        milestones = self.milestones()
+        compliances = self.compliances()
+
+        for p in self.packages():
+            p.update(self.PLACEHOLDERS)
+
+            p["dimensions"] = _dimensions_in_inches(p["length"], p["width"], p["height"], p["dimension_unit"])
+
+            comp = compliances.get((p["consignment_pk"], p["line_pk"]))
+            if comp:
+                p["is_dangerous_good"] = comp["compliance_dg"]
+                p["dangerous_good_un_class"] = comp["dg_class_name"] or ""
+                p["dangerous_good_name"] = comp["dg_category_name"] or ""
+                p["dangerous_good_class"] = comp["dg_class_name"] or ""
+                p["eccn"] = comp["eccn"] or ""
+                p["hscode"] = comp["hs_code"] or ""
+
+            dates = {key: _local(value) for key, value in milestones.get(p["consignment_pk"], {}).items()}
+            for key in self.MILESTONES:
+                p[key] = parse_any_date(dates.get(key))
+
+            creation_date = parse_any_date(_local(p["pickup_creation_date"]), return_type="date")
+            approval_date = parse_any_date(dates.get("collection_approval_date"), return_type="date")
+            delivery_date = parse_any_date(dates.get("actual_delivery_date"), return_type="date")
+
+            p["pickup_creation_date"] = parse_any_date(creation_date)
+            p["approval_kpi"] = (approval_date - creation_date).days if approval_date and creation_date else ""
+            p["age_till_date"] = (delivery_date - creation_date).days if delivery_date and creation_date else ""
+
+            yield p
+
+    def write(self, path):
+        """Stream every row into `path`, returns the number of rows written."""
+        header_map = self.get_headers()
+        keys = list(header_map.keys())
+        count = 0
+
+        if self.file_format == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(header_map.values())
+                for row in self.rows():
+                    writer.writerow([row.get(key) for key in keys])
+                    count += 1
+            return count
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet("Report")
+        header = []
+        for title in header_map.values():
+            cell = WriteOnlyCell(worksheet, value=title)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        worksheet.append(header)
+
+        for row in self.rows():
+            worksheet.append([row.get(key) for key in keys])
+            count += 1
+
+        workbook.save(path)
+        return count
+
+    def generate(self):
+        """
+        Writes the report to a uniquely named attachment.
+        Returns: (file_url, error)
+        """
+        temp_path = None
+        try:
+            filename = f"pickup_comprehensive_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid4().hex[:8]}.{self.file_format}"
+
+            with tempfile.NamedTemporaryFile(suffix=f".{self.file_format}", delete=False) as temp:
+                temp_path = temp.name
+
+            if not self.write(temp_path):
+                return None, "Not data found for the given date range and status. Please try again."
+
+            document = ConsignmentDocument.objects.create(
+                document_type=ConsignmentDocumentTypeChoices.COMPREHENSIVE_REPORT
+            )
+            attachment = ConsignmentDocumentAttachment(document=document)
+            with open(temp_path, "rb") as f:
+                attachment.file.save(filename, File(f), save=True)
+
+            self.remove_old_reports()
+            return attachment.file.url, None
+
+        except Exception as e:
+            return None, str(e)
+
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def remove_old_reports(cls):
+        old_reports = (
+            ConsignmentDocumentAttachment.objects
+            .filter(document__document_type=ConsignmentDocumentTypeChoices.COMPREHENSIVE_REPORT)
+            .select_related("document")
+            .order_by("-created_at")[cls.KEEP_REPORTS:]
+        )
+        for att in old_reports:
+            # Attachment post_delete removes the file from storage
+            att.document.delete()
+
+    @classmethod
+    def get_headers(cls):
+        from operations.services import ComprehensiveReportService
+
+        return ComprehensiveReportService.get_headers()
@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from portal.choices import OutboxStatusChoices
+
+
+logger = logging.getLogger(__name__)
+
+
+SHIPPING_MAPPING = "shipping_mapping"
+
+## target -> where its rows land in the ERP. key_column carries the idempotency
+## key so a batch resent after a lost acknowledgement doesn't insert twice.
+TARGETS = {
+    SHIPPING_MAPPING: {
+        "table": lambda: getattr(settings, "ERP_SHIPPING_MAPPING_TABLE", "ads_po_shipping_mapping_stg"),
+        "key_column": "ARAMEX_ORDER_LINE_REF",
+        "date_columns": ("ESTIMATED_DELIVERY_DATE", "CREATION_DATE", "LAST_UPDATE_DATE"),
+    },
+}
+
+
+def enabled():
+    return getattr(settings, "ERP_EXPORT_ENABLED", False)
+
+
+## -------- Enqueue --------
+
+def _text(value):
+    return str(value) if value is not None else None
+
+
+def shipping_mapping_payload(consignment_line, now):
+    """One ads_po_shipping_mapping_stg row per allocated PO line of a consignment."""
+    consignment = consignment_line.consignment
+    line = consignment_line.purchase_order_line
+    purchase_order = line.purchase_order
+    console = consignment.console
+    freight_forwarder = (console and console.freight_forwarder) or consignment.freight_forwarder
+
+    return {
+        "CLIENT_PO_REF": purchase_order.customer_reference_number,
+        "ADES_PO_REFERENCE": purchase_order.reference_number,
+        "CLIENT_PO_LINE_REF": line.customer_reference_number,
+        "ADES_PO_LINE_REF": line.reference_number,
+        "SKU": line.sku or line.product_code,
+        "QTY_SHIPPED": _text(consignment_line.allocated_qty),
+        "ARAMEX_CONSOLE_SHIPMENT": console.console_id if console else None,
+        "SHIPPING_REFERENCE": consignment.consignment_id,
+        "FREIGHT_FORWARDER": freight_forwarder.name if freight_forwarder else None,
+        "ESTIMATED_DELIVERY_DATE": _text(line.expected_delivery_date),
+        "ARAMEX_ORDER_REF": consignment.consignment_id,
+        "ARAMEX_ORDER_LINE_REF": consignment_line.pk.hex,
+        "CREATION_DATE": now.isoformat(),
+        "LAST_UPDATE_DATE": now.isoformat(),
+    }
+
+
+def enqueue_shipping_mapping(consignment_ids):
+    """
+    Queue the shipping mapping rows of the given consignments. Runs in the
+    caller's transaction, so the rows exist exactly when the status change
+    that produced them commits. Lines already queued are skipped.
+    """
+    from operations.models import ConsignmentPOLine, OutboxMessage
+
+    consignment_ids = list(consignment_ids)
+    if not consignment_ids:
+        return 0
+
+    # Oracle DATE columns hold naive local times
+    now = timezone.localtime().replace(tzinfo=None)
+    lines = (
+        ConsignmentPOLine.objects
+        .filter(consignment_id__in=consignment_ids)
+        .select_related(
+            "consignment__console__freight_forwarder",
+            "consignment__freight_forwarder",
+            "purchase_order_line__purchase_order",
+        )
+    )
+    messages = {
+        f"{SHIPPING_MAPPING}:{line.pk.hex}": OutboxMessage(
+            target=SHIPPING_MAPPING,
+            idempotency_key=f"{SHIPPING_MAPPING}:{line.pk.hex}",
+            consignment_id=line.consignment_id,
+            payload=shipping_mapping_payload(line, now),
+        )
+        for line in lines
+    }
+
+    for _ in range(2):
+        queued = set(OutboxMessage.objects.filter(idempotency_key__in=list(messages)).values_list("idempotency_key", flat=True))
+        pending = [message for key, message in messages.items() if key not in queued]
+        try:
+            with transaction.atomic():
+                OutboxMessage.objects.bulk_create(pending, batch_size=500)
+            return len(pending)
+        except IntegrityError:
+            # A concurrent change queued some of the same lines, skip those
+            continue
+    return 0
+
+
+def _export_statuses():
+    return set(getattr(settings, "ERP_EXPORT_STATUSES", []))
+
+
+def track_status_changes(changes):
+    """`changes` is a list of (old, new) consignment instances or snapshots / value rows."""
+    if not enabled():
+        return
+    statuses = _export_statuses()
+    reached = [
+        new["id"] if isinstance(new, dict) else new.pk for old, new in changes
+        if _status(new) in statuses and _status(old) != _status(new)
+    ]
+    enqueue_shipping_mapping(reached)
+
+
+def _status(source):
+    if isinstance(source, dict):
+        return source.get("consignment_status")
+    return getattr(source, "consignment_status", None)
+
+
+def outbox_post_save(sender, instance, created, raw=False, **kwargs):
+    """
+    post_save receiver for Consignment. The audit snapshot still holds the
+    values the row had before this save.
+    """
+    if raw:
+        return
+    old = None if created else getattr(instance, "_audit_snapshot", None)
+    track_status_changes([(old or {}, instance)])
+
+
+## -------- Sinks --------
+
+class OracleSink:
+    """
+    Array-binds a batch into the ERP staging table over a pooled session.
+    Rows whose key is already in the table are skipped by the insert itself.
+    """
+
+    _pool = None
+
+    @classmethod
+    def pool(cls):
+        if cls._pool is None:
+            import cx_Oracle
+
+            if getattr(settings, "ERP_ORACLE_LIB_DIR", None):
+                cx_Oracle.init_oracle_client(lib_dir=settings.ERP_ORACLE_LIB_DIR)
+            cls._pool = cx_Oracle.SessionPool(
+                user=settings.ERP_ORACLE_USER,
+                password=settings.ERP_ORACLE_PASSWORD,
+                dsn=settings.ERP_ORACLE_DSN,
+                min=1,
+                max=getattr(settings, "ERP_ORACLE_POOL_MAX", 4),
+                increment=1,
+                threaded=True,
+            )
+        return cls._pool
+
+    def _bind(self, spec, payload):
+        row = dict(payload)
+        for column in spec["date_columns"]:
+            if row.get(column):
+                row[column] = datetime.fromisoformat(row[column])
+        return row
+
+    def send(self, spec, payloads):
+        columns = list(payloads[0])
+        table, key = spec["table"](), spec["key_column"]
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(':' + column for column in columns)} FROM dual "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {key} = :{key})"
+        )
+
+        connection = self.pool().acquire()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(sql, [self._bind(spec, payload) for payload in payloads], batcherrors=True)
+            errors = {error.offset: error.message for error in cursor.getbatcherrors()}
+            connection.commit()
+            return errors
+        finally:
+            self.pool().release(connection)
+
+
+class SQLiteSink:
+    """Stands in for the ERP in development, a local table keyed on the same column."""
+
+    def send(self, spec, payloads):
+        columns = list(payloads[0])
+        table, key = spec["table"](), spec["key_column"]
+
+        with sqlite3.connect(getattr(settings, "ERP_EXPORT_SQLITE_PATH", "erp_export.sqlite3")) as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, UNIQUE ({key}))"
+            )
+            connection.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [[payload.get(column) for column in columns] for payload in payloads],
+            )
+        return {}
+
+
+class FileSink:
+    """Appends the batch as JSON lines, for tests and dry runs."""
+
+    def send(self, spec, payloads):
+        path = getattr(settings, "ERP_EXPORT_FILE", "erp_export.jsonl")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps({"table": spec["table"](), **payload}, default=str) + "\n")
+        return {}
+
+
+SINKS = {
+    "oracle": OracleSink,
+    "sqlite": SQLiteSink,
+    "file": FileSink,
+}
+
+
+def get_sink(name=None):
+    """ERP_EXPORT_SINK is one of SINKS or the dotted path of a class with send(spec, payloads)."""
+    name = name or getattr(settings, "ERP_EXPORT_SINK", "oracle")
+    return (SINKS.get(name) or import_string(name))()
+
+
+## -------- Drain --------
+
+def _fail(message, error):
+    attempts = message.attempts + 1
+    values = {"attempts": attempts, "last_error": str(error)[:4000]}
+    if attempts >= getattr(settings, "ERP_EXPORT_MAX_ATTEMPTS", 8):
+        values["status"] = OutboxStatusChoices.FAILED
+    else:
+        backoff = getattr(settings, "ERP_EXPORT_RETRY_BACKOFF", 60) * 2 ** (attempts - 1)
+        values["next_attempt_at"] = timezone.now() + timedelta(seconds=backoff)
+    type(message).objects.filter(pk=message.pk).update(**values)
+
+
+def drain(target=SHIPPING_MAPPING, sink=None, batch_size=None):
+    """
+    Send the due messages of `target` a batch at a time. Batches are claimed
+    with select_for_update(skip_locked=True), so drainers running side by
+    side split the queue. Failed rows stay queued with a backoff until they
+    run out of attempts. Returns (sent, failed).
+    """
+    from operations.models import OutboxMessage
+
+    spec = TARGETS[target]
+    sink = sink or get_sink()
+    batch_size = batch_size or getattr(settings, "ERP_EXPORT_BATCH_SIZE", 500)
+    sent = failed = 0
+    # Rows failing during this drain are due again only after it
+    started = timezone.now()
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                OutboxMessage.objects
+                .select_for_update(skip_locked=True)
+                .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lt=started), target=target, status=OutboxStatusChoices.QUEUE)
+                .order_by("created_at")[:batch_size]
+            )
+            if not batch:
+                return sent, failed
+
+            try:
+                errors = sink.send(spec, [message.payload for message in batch])
+            except Exception as e:
+                logger.exception("ERP export of %s rows to %s failed", len(batch), target)
+                errors = {offset: e for offset in range(len(batch))}
+
+            delivered = [message.pk for offset, message in enumerate(batch) if offset not in errors]
+            OutboxMessage.objects.filter(pk__in=delivered).update(
+                status=OutboxStatusChoices.SENT, sent_at=timezone.now(), last_error=None
+            )
+            for offset, error in errors.items():
+                _fail(batch[offset], error)
+
+            sent += len(delivered)
+            failed += len(errors)
@@ -0,0 +1,209 @@
+import logging
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateField, Exists, F, OuterRef, Q, UUIDField, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from portal.choices import (
+    ConsignmentStatusChoices,
+    NotificationChoices,
+    OperationUserRole,
+    PurchaseOrderStatusChoices,
+    Role,
+)
+
+
+logger = logging.getLogger(__name__)
+
+## POs and consignments still worth chasing
+OPEN_PO_STATUSES = [PurchaseOrderStatusChoices.OPEN, PurchaseOrderStatusChoices.PARTIALLY_FULFILLED]
+PENDING_PICKUP_STATUSES = [
+    ConsignmentStatusChoices.PENDING_FOR_APPROVAL,
+    ConsignmentStatusChoices.PENDING_CONSOLE_ASSIGNMENT,
+    ConsignmentStatusChoices.PENDING_BID,
+    ConsignmentStatusChoices.CONSOLE_ASSIGNED,
+    ConsignmentStatusChoices.FREIGHT_FORWARDER_ASSIGNED,
+]
+
+## Rows reminded per transaction
+BATCH_SIZE = 1000
+
+
+def _timezone(storerkey):
+    """The storerkey's timezone, the one its days are counted in."""
+    try:
+        return ZoneInfo(storerkey.timezone)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return timezone.get_current_timezone()
+
+
+def due_reminder(reminders, today, target):
+    """
+    Case expression picking, per row, the first reminder whose threshold
+    (due date - trigger_days) was crossed within the last
+    EXPEDITING_REMINDER_GRACE_DAYS and that wasn't sent for this due date yet.
+    A row crossing several thresholds at once gets the next one on the next run.
+    """
+    from operations.models import SentReminder
+
+    grace = getattr(settings, "EXPEDITING_REMINDER_GRACE_DAYS", 7)
+    whens = []
+    for reminder in sorted(reminders, key=lambda reminder: -reminder.trigger_days):
+        latest = today + timedelta(days=reminder.trigger_days)
+        sent = SentReminder.objects.filter(reminder_id=reminder.id, due_date=OuterRef("due_date"), **{target: OuterRef("pk")})
+        whens.append(When(
+            Q(due_date__lte=latest, due_date__gt=latest - timedelta(days=grace)) & ~Exists(sent),
+            then=Value(reminder.id),
+        ))
+    return Case(*whens, default=None, output_field=UUIDField())
+
+
+def due_purchase_orders(storerkey, reminders, today):
+    from operations.models import PurchaseOrder
+
+    return (
+        PurchaseOrder.objects
+        .filter(storerkey_id=storerkey.id, status__in=OPEN_PO_STATUSES)
+        .annotate(due_date=Coalesce("expected_delivery_date", "order_due_date", output_field=DateField()))
+        .filter(due_date__isnull=False)
+        .annotate(reminder_id=due_reminder(reminders, today, "purchase_order"))
+        .filter(reminder_id__isnull=False)
+        .values("id", "customer_reference_number", "supplier_id", "due_date", "reminder_id")
+        .order_by("due_date")
+    )
+
+
+def due_consignments(storerkey, reminders, today, tz):
+    from operations.models import Consignment
+
+    return (
+        Consignment.objects
+        .filter(storerkey_id=storerkey.id, consignment_status__in=PENDING_PICKUP_STATUSES, requested_pickup_datetime__isnull=False)
+        .annotate(due_date=TruncDate("requested_pickup_datetime", tzinfo=tz))
+        .annotate(reminder_id=due_reminder(reminders, today, "consignment"))
+        .filter(reminder_id__isnull=False)
+        .values("id", "consignment_id", "supplier_id", "due_date", "reminder_id")
+        .order_by("due_date")
+    )
+
+
+## -------- Recipients --------
+
+class Recipients:
+    """Admins and L1/L2 operations users plus the supplier's users on the storerkey, looked up once per run."""
+
+    def __init__(self):
+        from accounts.models import User
+
+        self.operations = list(
+            User.objects
+            .filter(Q(role=Role.ADMIN) | Q(operations_profile__access_level__in=[OperationUserRole.L1, OperationUserRole.L2]), is_active=True)
+            .distinct()
+        )
+        self.suppliers = {}     ## (storerkey_id, supplier_id) -> [User]
+
+    def load(self, storerkey_id, supplier_ids):
+        from accounts.models import User
+
+        missing = {supplier_id for supplier_id in supplier_ids if (storerkey_id, supplier_id) not in self.suppliers}
+        if not missing:
+            return
+        for supplier_id in missing:
+            self.suppliers[(storerkey_id, supplier_id)] = []
+        for user in (
+            User.objects
+            .filter(supplier_profile__supplier_id__in=missing, supplier_profile__storerkeys=storerkey_id, is_active=True)
+            .annotate(profile_supplier_id=F("supplier_profile__supplier_id"))
+            .distinct()
+        ):
+            self.suppliers[(storerkey_id, user.profile_supplier_id)].append(user)
+
+    def get(self, storerkey_id, supplier_id):
+        return self.operations + self.suppliers.get((storerkey_id, supplier_id), [])
+
+
+## -------- Sending --------
+
+def _send(storerkey, rows, names, recipients, target, header, message, hyperlink_key):
+    """
+    Record a batch in the ledger and notify it, in one transaction so a
+    reminder is either logged and sent or neither.
+    """
+    from operations.models import SentReminder
+    from operations.notifications import NotificationService, notification_batch
+
+    recipients.load(storerkey.id, {row["supplier_id"] for row in rows})
+    try:
+        with transaction.atomic(), notification_batch():
+            SentReminder.objects.bulk_create(
+                [
+                    SentReminder(reminder_id=row["reminder_id"], due_date=row["due_date"], **{f"{target}_id": row["id"]})
+                    for row in rows
+                ],
+                batch_size=500,
+            )
+            for row in rows:
+                NotificationService.send_notification(
+                    users=recipients.get(storerkey.id, row["supplier_id"]),
+                    header=header,
+                    message=message.format(name=names[row["reminder_id"]], due_date=row["due_date"]),
+                    type=NotificationChoices.EXPEDITING,
+                    hyperlink_value={hyperlink_key: row[hyperlink_key]},
+                )
+    except IntegrityError:
+        # A concurrent run sent (some of) them, they are picked up again next run if not
+        logger.warning("Expediting reminders for %s skipped, already being sent", storerkey)
+        return 0
+    return len(rows)
+
+
+def _send_all(storerkey, queryset, names, recipients, target, header, message, hyperlink_key):
+    # Read up front, the batches below insert into the ledger the query checks
+    rows = list(queryset)
+    sent = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        sent += _send(storerkey, rows[start:start + BATCH_SIZE], names, recipients, target, header, message, hyperlink_key)
+    return sent
+
+
+def send_due_reminders():
+    """
+    Send every expediting reminder due today across the storerkeys with
+    expediting enabled: one query per storerkey for its POs and one for its
+    consignments. Returns (POs reminded, consignments reminded).
+    """
+    from entities.models import StorerKey
+
+    storerkeys = StorerKey.objects.filter(expediting_applicable=True, is_active=True).prefetch_related("reminders")
+    recipients = None
+    po_count = consignment_count = 0
+
+    for storerkey in storerkeys:
+        reminders = [reminder for reminder in storerkey.reminders.all() if reminder.is_active]
+        if not reminders:
+            continue
+        if recipients is None:
+            recipients = Recipients()
+
+        names = {reminder.id: reminder.name for reminder in reminders}
+        tz = _timezone(storerkey)
+        today = timezone.localtime(timezone.now(), tz).date()
+
+        po_count += _send_all(
+            storerkey, due_purchase_orders(storerkey, reminders, today), names, recipients, "purchase_order",
+            header="Expediting Reminder: PO {customer_reference_number}",
+            message="{name}: PO {{customer_reference_number}} is due on {due_date}. Please update the Promised Dates or create the Pickups, as applicable.",
+            hyperlink_key="customer_reference_number",
+        )
+        consignment_count += _send_all(
+            storerkey, due_consignments(storerkey, reminders, today, tz), names, recipients, "consignment",
+            header="Expediting Reminder: Pickup Request {consignment_id}",
+            message="{name}: Pickup Request {{consignment_id}} is due for pickup on {due_date}.",
+            hyperlink_key="consignment_id",
+        )
+
+    return po_count, consignment_count
@@ -0,0 +1,384 @@
+import logging
+import multiprocessing
+import threading
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.response import ServiceError
+from portal.choices import ConsignmentStatusChoices, POImportFormatsChoices, POUploadStatusChoices
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobType:
+    """
+    A kind of background work. Jobs with a `model` ("app_label.Model") are
+    claimed a row at a time: `pending` rows are moved to `running` under
+    select_for_update(skip_locked=True), so concurrent runners never pick
+    the same row. Jobs without a model run once per runner invocation.
+    """
+
+    def __init__(self, name, handler, model=None, status_field=None, pending=None, running=None,
+                 failed=POUploadStatusChoices.FAILED, max_attempts=1, timeout=None, order_by=("created_at",)):
+        self.name = name
+        self.handler = handler
+        self.model = model
+        self.status_field = status_field
+        self.pending = pending
+        self.running = running
+        self.failed = failed
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.order_by = order_by
+
+    def get_timeout(self):
+        return self.timeout() if callable(self.timeout) else self.timeout
+
+    def rows(self):
+        return apps.get_model(self.model)._base_manager.all()
+
+    def claimable(self, now):
+        return self.rows().filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+            **{self.status_field: self.pending},
+        )
+
+    def claim(self, limit):
+        """Move up to `limit` due rows to running, returns their ids."""
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                self.claimable(now)
+                .select_for_update(skip_locked=True)
+                .order_by(*self.order_by)
+                .values_list("id", flat=True)[:limit]
+            )
+            self.rows().filter(pk__in=ids).update(
+                **{self.status_field: self.running},
+                attempts=F("attempts") + 1,
+                claimed_at=now,
+                heartbeat_at=now,
+                next_attempt_at=None,
+            )
+        return ids
+
+    def release(self, pk, error, retry=True):
+        """Put a failed job back with exponential backoff, or mark it failed once out of attempts."""
+        row = self.rows().filter(pk=pk, **{self.status_field: self.running}).values("attempts").first()
+        if row is None:
+            # Already finished (or recovered) elsewhere
+            return
+
+        error = str(error)[:4000]
+        if retry and row["attempts"] < self.max_attempts:
+            backoff = getattr(settings, "JOB_RETRY_BACKOFF", 60) * 2 ** (row["attempts"] - 1)
+            self.rows().filter(pk=pk).update(**{
+                self.status_field: self.pending,
+                "next_attempt_at": timezone.now() + timedelta(seconds=backoff),
+                "last_error": error,
+            })
+        else:
+            self.rows().filter(pk=pk).update(**{self.status_field: self.failed, "last_error": error})
+
+    def hand_off(self, pk):
+        """
+        Mark a claimed row as queued on Celery: no heartbeat until a worker
+        starts it, so the time spent in the broker's queue isn't taken for a
+        dead worker.
+        """
+        self.rows().filter(pk=pk, **{self.status_field: self.running}).update(heartbeat_at=None)
+
+    def start(self, pk):
+        """Stamp the first heartbeat, False when the row is no longer running (recovered meanwhile)."""
+        return bool(self.rows().filter(pk=pk, **{self.status_field: self.running}).update(heartbeat_at=timezone.now()))
+
+    def recover_stale(self):
+        """
+        Release running rows whose worker stopped sending heartbeats (killed
+        runner, lost worker), and rows handed to Celery that no worker
+        started within JOB_QUEUED_STALE_AFTER (lost message).
+        """
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=getattr(settings, "JOB_STALE_AFTER", 300))
+        queued_cutoff = now - timedelta(seconds=getattr(settings, "JOB_QUEUED_STALE_AFTER", 6 * 3600))
+        stale = self.rows().filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, claimed_at__lt=queued_cutoff),
+            **{self.status_field: self.running},
+        ).values_list("id", flat=True)
+        stale = list(stale)
+        for pk in stale:
+            self.release(pk, "Worker stopped responding")
+        return stale
+
+
+## name -> JobType, see register()
+JOB_TYPES = {}
+
+
+def register(job_type):
+    JOB_TYPES[job_type.name] = job_type
+    return job_type
+
+
+## -------- Handlers --------
+
+def cleanup_drafts(pk=None):
+    """Delete draft consignments untouched for 45 minutes with their attachments."""
+    from operations.models import Consignment, ConsignmentDocumentAttachment
+    from operations.utils import update_files
+
+    consignments = list(Consignment.objects.filter(
+        consignment_status=ConsignmentStatusChoices.DRAFT,
+        updated_at__lt=timezone.now() - timedelta(minutes=45),
+    ).values_list("id", flat=True))
+    attachments = list(ConsignmentDocumentAttachment.objects.filter(
+        document__consignment_id__in=consignments
+    ).values_list("id", flat=True))
+
+    update_files(deleted_doc_ids=attachments)
+    if attachments:
+        ConsignmentDocumentAttachment.objects.filter(id__in=attachments).delete()
+    if consignments:
+        Consignment.objects.filter(id__in=consignments).delete()
+    return f"Deleted {len(consignments)} drafts and {len(attachments)} attachments"
+
+
+def import_purchase_orders(pk):
+    from operations.models import PurchaseOrderUpload
+    from operations.other_services.po_import import SLBPOImportService
+    from operations.task import process_purchase_orders_v2
+
+    upload = PurchaseOrderUpload.objects.get(pk=pk)
+    if upload.file_format == POImportFormatsChoices.SLB:
+        SLBPOImportService.process_slb_po_file(upload)
+    else:
+        process_purchase_orders_v2(upload.id)
+    return f"Processed purchase order file {pk}"
+
+
+def generate_report(pk):
+    from operations.models import ComprehensiveReport, Consignment
+    from operations.notifications import NotificationService
+    from operations.task import generate_comperhensive_report
+
+    instance = ComprehensiveReport.objects.get(pk=pk)
+
+    filters = Q(created_at__gte=instance.from_date, created_at__lte=instance.to_date)
+    if instance.status and instance.status != "all":
+        filters &= Q(consignment_status__in=instance.status)
+    if instance.consignment_ids:
+        filters &= Q(consignment_id__in=instance.consignment_ids)
+
+    consignments_qs = Consignment.objects.filter(filters).exclude(consignment_status=ConsignmentStatusChoices.DRAFT)
+
+    file_url, error = generate_comperhensive_report(consignments_qs)
+    if error:
+        raise ServiceError(error=error)
+
+    instance.report_generation_status = POUploadStatusChoices.SUCCESS
+    instance.save(update_fields=["report_generation_status"])
+
+    NotificationService.notify_comprehensive_report(
+        user=instance.user,
+        header="Comprehensive Report",
+        message="Comprehensive Report generation is completed.",
+        attachment=file_url
+    )
+    return f"Generated comprehensive report {pk}"
+
+
+def export_erp_outbox(pk=None):
+    from operations.other_services.erp_outbox import drain, enabled
+
+    if not enabled():
+        return "ERP export disabled"
+    sent, failed = drain()
+    return f"Exported {sent} rows to the ERP, {failed} failed"
+
+
+def send_expediting_reminders(pk=None):
+    from operations.other_services.expediting_reminders import send_due_reminders
+
+    purchase_orders, consignments = send_due_reminders()
+    return f"Sent expediting reminders for {purchase_orders} POs and {consignments} pickup requests"
+
+
+def archive_audit_trails(pk=None):
+    from operations.other_services.audit_archive import archive
+
+    archived = archive()
+    return "Archived " + ", ".join(f"{count} {kind} audit trails" for kind, count in archived.items())
+
+
+register(JobType("cleanup_drafts", cleanup_drafts, timeout=lambda: getattr(settings, "JOB_CLEANUP_TIMEOUT", 600)))
+register(JobType("erp_export", export_erp_outbox, timeout=lambda: getattr(settings, "JOB_ERP_EXPORT_TIMEOUT", 600)))
+register(JobType("expediting_reminders", send_expediting_reminders, timeout=lambda: getattr(settings, "JOB_REMINDER_TIMEOUT", 900)))
+register(JobType("audit_archive", archive_audit_trails, timeout=lambda: getattr(settings, "JOB_AUDIT_ARCHIVE_TIMEOUT", 3600)))
+
+## Uploads are queued as IN_PROGRESS and marked QUEUE while processing. Imports
+## commit a chunk at a time, so a failed file is not retried into duplicates.
+register(JobType(
+    "po_import", import_purchase_orders, model="operations.PurchaseOrderUpload",
+    status_field="status",
+    pending=POUploadStatusChoices.IN_PROGRESS,
+    running=POUploadStatusChoices.QUEUE,
+    timeout=lambda: getattr(settings, "JOB_PO_IMPORT_TIMEOUT", 3600),
+))
+
+register(JobType(
+    "report", generate_report, model="operations.ComprehensiveReport",
+    status_field="report_generation_status",
+    pending=POUploadStatusChoices.QUEUE,
+    running=POUploadStatusChoices.IN_PROGRESS,
+    max_attempts=3,
+    timeout=lambda: getattr(settings, "JOB_REPORT_TIMEOUT", 1800),
+))
+
+
+## -------- Execution --------
+
+def _heartbeat(job_type, pk, stop):
+    interval = getattr(settings, "JOB_HEARTBEAT_INTERVAL", 30)
+    try:
+        while not stop.wait(interval):
+            job_type.rows().filter(pk=pk, **{job_type.status_field: job_type.running}).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def execute(name, pk=None):
+    """
+    Run one claimed job in the current process, heartbeating its row while it
+    runs. Failures are recorded on the row (retried with backoff when the job
+    allows it), ServiceErrors are final.
+    """
+    job_type = JOB_TYPES[name]
+    if pk is not None and not job_type.start(pk):
+        logger.warning("Job %s %s is no longer running, skipped", name, pk)
+        return None
+
+    stop = threading.Event()
+    if pk is not None:
+        threading.Thread(target=_heartbeat, args=(job_type, pk, stop), daemon=True).start()
+
+    try:
+        return job_type.handler(pk)
+    except ServiceError as e:
+        logger.error("Job %s %s failed: %s", name, pk, e)
+        if pk is not None:
+            job_type.release(pk, e, retry=False)
+    except Exception as e:
+        logger.exception("Job %s %s failed", name, pk)
+        if pk is not None:
+            job_type.release(pk, e)
+    finally:
+        stop.set()
+
+
+def _child(name, pk):
+    import django
+    django.setup()
+    execute(name, pk)
+    connections.close_all()
+
+
+class JobRunner:
+    """
+    Claims due jobs and runs them in a pool of worker processes, each job in
+    its own process so a timeout can terminate it. With
+    JOB_RUNNER_BACKEND = "celery" claimed jobs are handed to the
+    run_background_job task instead.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, names=None, workers=None, backend=None, log=None):
+        self.job_types = [JOB_TYPES[name] for name in (names or JOB_TYPES)]
+        self.workers = workers or getattr(settings, "JOB_RUNNER_WORKERS", 4)
+        self.backend = backend or getattr(settings, "JOB_RUNNER_BACKEND", "local")
+        self.log = log or logger.info
+        self.context = multiprocessing.get_context("spawn")
+        self.running = {}   ## process -> (job_type, pk, deadline)
+
+    def run(self):
+        """Drain everything due now, returns the number of jobs started."""
+        for job_type in self.job_types:
+            if job_type.model is not None:
+                recovered = job_type.recover_stale()
+                if recovered:
+                    self.log(f"{job_type.name}: released {len(recovered)} stuck jobs")
+
+        # Model-less jobs run once per invocation
+        queue = [(job_type, None) for job_type in self.job_types if job_type.model is None]
+        started = 0
+
+        while True:
+            self._reap()
+
+            free = self.workers - len(self.running)
+            if free > 0 and len(queue) < free:
+                queue.extend(self._claim(free - len(queue)))
+
+            while queue and len(self.running) < self.workers:
+                self._start(*queue.pop(0))
+                started += 1
+
+            if not self.running and not queue:
+                return started
+            time.sleep(self.POLL_INTERVAL)
+
+    def _claim(self, limit):
+        claimed = []
+        for job_type in self.job_types:
+            if job_type.model is None or len(claimed) >= limit:
+                continue
+            claimed.extend((job_type, pk) for pk in job_type.claim(limit - len(claimed)))
+        return claimed
+
+    def _start(self, job_type, pk):
+        self.log(f"{job_type.name}: starting {pk or ''}".rstrip())
+
+        if self.backend == "celery":
+            from operations.task import run_background_job
+            if pk is not None:
+                job_type.hand_off(pk)
+            try:
+                run_background_job.apply_async(args=[job_type.name, pk and str(pk)], time_limit=job_type.get_timeout())
+            except Exception as e:
+                # Not queued, don't leave the row waiting for a worker that never comes
+                logger.exception("Job %s %s could not be queued", job_type.name, pk)
+                if pk is not None:
+                    job_type.release(pk, e)
+            return
+
+        # Children open their own connections, don't hand them ours
+        connections.close_all()
+        process = self.context.Process(target=_child, args=(job_type.name, pk), daemon=True)
+        process.start()
+        timeout = job_type.get_timeout()
+        self.running[process] = (job_type, pk, time.monotonic() + timeout if timeout else None)
+
+    def _reap(self):
+        now = time.monotonic()
+        for process, (job_type, pk, deadline) in list(self.running.items()):
+            if process.is_alive():
+                if deadline is None or now < deadline:
+                    continue
+                process.terminate()
+                process.join()
+                self.log(f"{job_type.name}: {pk or ''} timed out")
+                if pk is not None:
+                    job_type.release(pk, "Timed out")
+            else:
+                process.join()
+                if process.exitcode and pk is not None:
+                    job_type.release(pk, f"Worker exited with code {process.exitcode}")
+                self.log(f"{job_type.name}: finished {pk or ''}".rstrip())
+            del self.running[process]
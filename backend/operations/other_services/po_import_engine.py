@@ -0,0 +1,366 @@
+from collections import Counter, defaultdict
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from entities.models import MaterialMaster, StorerKey, Supplier
+from operations.models import ConsignmentPOLine, PurchaseOrder, PurchaseOrderLine, PurchaseOrderUpload
+from operations.rollups import track_created
+from portal import search as search_index
+from operations.other_services.po_import import SLBPOImportService
+from operations.services import POLineService, PurchaseOrderService
+from operations.signals import bulk_update_audit_trail
+from portal.choices import OrderTypeChoices, PurchaseOrderStatusChoices
+from portal.models import CostCenterCode
+
+
+class SLBPOImportEngine:
+    """
+    Imports an SLB purchase order file in chunks so memory and transaction
+    size stay flat however many lines the file has.
+
+    The file is streamed twice. The first pass only keeps the PO/line numbers,
+    which is enough to reject incomplete or duplicated POs up front and to know
+    which existing lines are missing from the file. The second pass imports
+    CHUNK_SIZE lines at a time with one IN query per lookup table and bulk
+    writes, each chunk in its own transaction. Lines of the same PO are kept in
+    one chunk when they are next to each other in the file.
+
+    Errors use the SLBPOImportService format, a list of {(po_crn, pol_crn): message}.
+    """
+
+    CHUNK_SIZE = 1000
+
+    REQUIRED_PO_FIELDS = ["customer_reference_number", "storerkey", "supplier_code", "plant_id", "center_code", "sloc"]
+    REQUIRED_LINE_FIELDS = ["customer_reference_number", "quantity"]
+
+    def __init__(self, upload=None, chunk_size=None):
+        self.upload = upload
+        self.chunk_size = chunk_size or getattr(settings, "PO_IMPORT_CHUNK_SIZE", self.CHUNK_SIZE)
+
+        self.errors = []
+        self.error_pos = set()
+        self.file_lines = {}            # {po_crn: [line crns in the whole file]}
+        self.checked_pos = set()        # existing POs whose missing lines were already cancelled
+        self.created_po_ids = set()
+        self.total_rows = 0
+        self.processed_rows = 0
+
+    def add_error(self, po_crn, pol_crn, message):
+        self.errors.append({(po_crn or "UNKNOWN", pol_crn or "UNKNOWN"): message})
+        self.error_pos.add(po_crn)
+
+    ## -------- File passes --------
+
+    def run(self, file):
+        """Imports `file`, returns the errors (empty when every line went in)."""
+        self.index(file)
+        self.report_progress()
+
+        chunk, last_po = [], None
+        for row_number, record in SLBPOImportService.iter_records(file):
+            self.processed_rows += 1
+            line = SLBPOImportService.record_to_line(record)
+            po_crn = line["po"]["customer_reference_number"]
+            if not po_crn or po_crn in self.error_pos:
+                continue
+
+            # Only cut between two POs so a PO stays in a single transaction
+            if len(chunk) >= self.chunk_size and po_crn != last_po:
+                self.import_chunk(chunk)
+                chunk = []
+            chunk.append(line)
+            last_po = po_crn
+
+        if chunk:
+            self.import_chunk(chunk)
+        return self.errors
+
+    def import_lines(self, lines):
+        """Imports lines that are already parsed, as a single chunk."""
+        self.file_lines = self.validate_lines(lines)
+        lines = [line for line in lines if line["po"].get("customer_reference_number") not in self.error_pos]
+        if lines:
+            self.import_chunk(lines)
+        return self.errors
+
+    def index(self, file):
+        """
+        First pass: counts the rows and validates what can be checked from
+        the file alone, so a bad line rejects its whole PO before any chunk
+        of it is written.
+        """
+        self.file_lines = self.validate_lines(
+            SLBPOImportService.record_to_line(record) for _, record in SLBPOImportService.iter_records(file)
+        )
+
+    def validate_lines(self, lines):
+        file_lines = defaultdict(list)
+
+        for line in lines:
+            self.total_rows += 1
+            po = line.get("po") or {}
+            po_crn = po.get("customer_reference_number")
+            pol_crn = line.get("customer_reference_number")
+
+            if not po_crn:
+                self.add_error("UNKNOWN", pol_crn, "PO number missing.")
+                continue
+
+            for field in self.REQUIRED_PO_FIELDS:
+                if not po.get(field):
+                    self.add_error(po_crn, pol_crn, f"Field '{field}' is required for PO")
+
+            for field in self.REQUIRED_LINE_FIELDS:
+                if not line.get(field) and line.get(field) != 0:
+                    self.add_error(po_crn, pol_crn, f"Field '{field}' is required in PO Line")
+
+            file_lines[po_crn].append(pol_crn)
+
+        for po_crn, line_crns in file_lines.items():
+            for pol_crn, count in Counter(line_crns).items():
+                if count > 1:
+                    self.add_error(po_crn, pol_crn, f"PO '{po_crn}' has duplicate PO Line number '{pol_crn}'")
+
+        return dict(file_lines)
+
+    def report_progress(self):
+        if self.upload is None:
+            return
+        PurchaseOrderUpload.objects.filter(pk=self.upload.pk).update(
+            total_rows=self.total_rows,
+            processed_rows=self.processed_rows,
+            updated_at=timezone.now(),
+        )
+
+    ## -------- Chunk import --------
+
+    def import_chunk(self, lines):
+        po_crns = {line["po"]["customer_reference_number"] for line in lines}
+        try:
+            with transaction.atomic():
+                self.write_chunk(lines)
+        except Exception as e:
+            self.errors.append({("UNKNOWN", "UNKNOWN"): str(e)})
+            self.error_pos.update(po_crns)
+        self.report_progress()
+
+    def load_lookups(self, lines):
+        """Every table the chunk needs, one query each and scoped to the chunk."""
+        pos = [line["po"] for line in lines]
+        po_crns = {po["customer_reference_number"] for po in pos}
+        storer_codes = {po.get("storerkey") for po in pos}
+
+        ## all_objects: soft deleted rows keep their key in the unique constraints
+        existing_lines = defaultdict(dict)
+        for line in (
+            PurchaseOrderLine.all_objects
+            .filter(purchase_order__customer_reference_number__in=po_crns)
+            .annotate(po_crn=F("purchase_order__customer_reference_number"))
+        ):
+            existing_lines[line.po_crn][line.customer_reference_number] = line
+
+        storerkeys = {
+            s.storerkey_code: s
+            for s in StorerKey.objects.filter(storerkey_code__in=storer_codes).select_related("hub", "client", "cc_code")
+        }
+
+        cc_codes = {}
+        for cc in CostCenterCode.objects.filter(
+            plant_id__in={po.get("plant_id") for po in pos},
+            center_code__in={po.get("center_code") for po in pos},
+            sloc__in={po.get("sloc") for po in pos},
+        ).order_by("pk"):
+            cc_codes.setdefault((cc.plant_id, cc.center_code, cc.sloc), cc)
+
+        return {
+            "pos": {
+                po.customer_reference_number: po
+                for po in PurchaseOrder.all_objects.filter(customer_reference_number__in=po_crns)
+            },
+            "lines": existing_lines,
+            "suppliers": {
+                s.supplier_code: s
+                for s in Supplier.objects.filter(
+                    supplier_code__in={po["seller_details"].get("seller_code") for po in pos}
+                ).select_related("client")
+            },
+            "storerkeys": storerkeys,
+            "supplier_storerkeys": set(
+                Supplier.storerkeys.through.objects
+                .filter(storerkey__storerkey_code__in=storer_codes)
+                .values_list("supplier_id", "storerkey_id")
+            ),
+            "cc_codes": cc_codes,
+            "materials": set(
+                MaterialMaster.all_objects
+                .filter(
+                    product_code__in={self.material_code(line) for line in lines},
+                    storerkey_id__in=[s.id for s in storerkeys.values()],
+                )
+                .values_list("product_code", "storerkey_id", "hub_id")
+            ),
+        }
+
+    @staticmethod
+    def material_code(line):
+        return line["po"]["customer_reference_number"] + (line.get("customer_reference_number") or "") + "NOSKU"
+
+    def check_po(self, po, lookups):
+        """Returns (supplier, storerkey, error) for the PO columns of a line."""
+        supplier = lookups["suppliers"].get(po["seller_details"].get("seller_code"))
+        if not supplier:
+            return None, None, "Supplier not found."
+
+        storerkey = lookups["storerkeys"].get(po.get("storerkey"))
+        if not storerkey:
+            return None, None, "StorerKey not found."
+
+        order_type = po.get("order_type")
+        if order_type not in [OrderTypeChoices.BTS, OrderTypeChoices.BTO]:
+            return None, None, "Invalid Storerkey po type."
+        if storerkey.order_type != OrderTypeChoices.BOTH and storerkey.order_type != order_type:
+            return None, None, f"{order_type} type POs not allowed for this storerkey"
+
+        if not storerkey.cc_code:
+            return None, None, "Storerkey dont have Cost Center Code."
+
+        cc_code = lookups["cc_codes"].get((po.get("plant_id", ""), po.get("center_code", ""), po.get("sloc", "")))
+        if not cc_code:
+            return None, None, "Cost Center Code not found."
+        if storerkey.cc_code_id != cc_code.id:
+            return None, None, "Storerkey not linked with Cost Center Code."
+
+        if (supplier.id, storerkey.id) not in lookups["supplier_storerkeys"]:
+            return None, None, "Storerkey not matched with supplier."
+
+        if not storerkey.client:
+            return None, None, "Client not found."
+        if storerkey.client_id != supplier.client_id:
+            return None, None, "Seller code and buyer code are not linked."
+
+        return supplier, storerkey, None
+
+    def write_chunk(self, lines):
+        lookups = self.load_lookups(lines)
+
+        ## Validate every line first, a PO with any error is skipped as a whole
+        checked = []
+        for line in lines:
+            po = line["po"]
+            po_crn, pol_crn = po["customer_reference_number"], line["customer_reference_number"]
+
+            supplier, storerkey, error = self.check_po(po, lookups)
+            if not error and po_crn in lookups["pos"] and lookups["pos"][po_crn].is_deleted:
+                error = "Purchase Order already exists and is deleted."
+            if not error:
+                existing_line = lookups["lines"].get(po_crn, {}).get(pol_crn) if po_crn in lookups["pos"] else None
+                if existing_line and existing_line.is_deleted:
+                    error = "Purchase Order Line already exists and is deleted."
+                elif existing_line:
+                    line, error = POLineService.po_line_quantity_validations(line, existing_line)
+            if error:
+                self.add_error(po_crn, pol_crn, error)
+                continue
+            checked.append((line, supplier, storerkey, existing_line))
+
+        po_to_create, new_pos = [], {}
+        lines_to_create, lines_to_update, lines_to_cancel = [], [], []
+        material_to_create = []
+        touched_po_ids = set()
+
+        for line, supplier, storerkey, existing_line in checked:
+            po = line.pop("po")
+            po_crn = po["customer_reference_number"]
+            if po_crn in self.error_pos:
+                continue
+
+            purchase_order = lookups["pos"].get(po_crn) or new_pos.get(po_crn)
+            if purchase_order is None:
+                purchase_order = new_pos[po_crn] = self.build_po(po, supplier, storerkey)
+                po_to_create.append(purchase_order)
+            elif po_crn in lookups["pos"] and po_crn not in self.checked_pos:
+                self.checked_pos.add(po_crn)
+                file_crns = set(self.file_lines.get(po_crn, []))
+                lines_to_cancel.extend(
+                    l for crn, l in lookups["lines"].get(po_crn, {}).items() if crn not in file_crns and not l.is_deleted
+                )
+            touched_po_ids.add(purchase_order.id)
+
+            line.pop("purchase_order_crn", None)
+            material_code = self.material_code({**line, "po": po})
+            line["product_code"] = line.get("product_code") or material_code
+
+            material_key = (material_code, storerkey.id, storerkey.hub_id)
+            if material_key not in lookups["materials"]:
+                lookups["materials"].add(material_key)
+                material_to_create.append(MaterialMaster(
+                    storerkey=storerkey,
+                    hub=storerkey.hub,
+                    product_code=material_code,
+                    is_chemical=line.get("is_chemical"),
+                    is_dangerous_good=line.get("is_dangerous_good"),
+                ))
+
+            if existing_line:
+                existing_line.quantity = line["quantity"]
+                existing_line.status = line["status"]
+                existing_line.open_quantity = line["open_quantity"]
+                existing_line.purchase_order = purchase_order
+                lines_to_update.append(existing_line)
+                continue
+
+            line["purchase_order_id"] = purchase_order.id
+            line["open_quantity"] = line.get("quantity")
+            lines_to_create.append(PurchaseOrderLine(**line))
+
+        ## Missing lines are cancelled unless a consignment already uses them
+        linked_ids = set(
+            ConsignmentPOLine.objects
+            .filter(purchase_order_line_id__in=[l.id for l in lines_to_cancel])
+            .values_list("purchase_order_line_id", flat=True)
+        ) if lines_to_cancel else set()
+        lines_to_cancel = [l for l in lines_to_cancel if l.id not in linked_ids]
+        for l in lines_to_cancel:
+            l.status = PurchaseOrderStatusChoices.CANCELLED
+
+        if material_to_create:
+            MaterialMaster.objects.bulk_create(material_to_create, batch_size=500)
+        if po_to_create:
+            PurchaseOrder.objects.bulk_create(po_to_create, batch_size=500)
+            track_created("PO", po_to_create)
+            search_index.reindex(PurchaseOrder, [po.id for po in po_to_create])
+            self.created_po_ids.update(po.id for po in po_to_create)
+        if lines_to_create:
+            PurchaseOrderLine.objects.bulk_create(lines_to_create, batch_size=500)
+
+        if lines_to_update:
+            bulk_update_audit_trail(lines_to_update, "PO-Line", ["status", "quantity", "open_quantity"])
+            PurchaseOrderLine.objects.bulk_update(lines_to_update, fields=["status", "quantity", "open_quantity"], batch_size=500)
+        if lines_to_cancel:
+            bulk_update_audit_trail(lines_to_cancel, "PO-Line", ["status"])
+            PurchaseOrderLine.objects.bulk_update(lines_to_cancel, fields=["status"], batch_size=500)
+
+        ## POs created by this import (in this chunk or an earlier one) total their lines
+        created_ids = touched_po_ids & self.created_po_ids
+        if created_ids:
+            PurchaseOrderService.update_open_quantity(PurchaseOrder.objects.filter(id__in=created_ids))
+
+    @staticmethod
+    def build_po(po, supplier, storerkey):
+        data = {
+            key: value for key, value in po.items()
+            if key not in ("storer_key", "seller_details", "pieces_detail", "supplier_code", "buyer_code", "sloc", "quantity")
+        }
+        data.update(SLBPOImportService.seller_details(po.get("seller_details", {})))
+        data.update({
+            "id": uuid4(),
+            "client": storerkey.client,
+            "supplier": supplier,
+            "storerkey": storerkey,
+            "open_quantity": po.get("quantity"),
+        })
+        return PurchaseOrder(**data)
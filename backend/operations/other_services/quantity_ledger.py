@@ -0,0 +1,251 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from core.response import ServiceError
+from portal.choices import PackageStatusChoices, QuantityLedgerKindChoices
+
+
+## Package statuses whose allocations count as processed / fulfilled on the line
+PROCESSED_STATUSES = [PackageStatusChoices.NOT_RECEIVED]
+FULFILLED_STATUSES = [PackageStatusChoices.DELIVERED, PackageStatusChoices.RECEIVED]
+
+## Rows per UPDATE, keeps the CASE parameters well under the MSSQL limit of 2100
+BATCH_SIZE = 250
+
+ZERO = Decimal("0")
+
+
+## -------- Balances --------
+
+def allocated_balances(consignment_ids):
+    """
+    {(consignment_id, line_id): [po_id, processed, fulfilled]} as the
+    consignments' allocations stand now.
+    """
+    from operations.models import PackagingAllocation
+
+    rows = (
+        PackagingAllocation.objects
+        .filter(consignment_packaging__consignment_id__in=consignment_ids, purchase_order_line__isnull=False)
+        .values("consignment_packaging__consignment_id", "purchase_order_line_id", "purchase_order_line__purchase_order_id")
+        .annotate(
+            processed=Sum("allocated_qty", filter=Q(consignment_packaging__status__in=PROCESSED_STATUSES)),
+            fulfilled=Sum("allocated_qty", filter=Q(consignment_packaging__status__in=FULFILLED_STATUSES)),
+        )
+        .order_by()
+    )
+    return {
+        (row["consignment_packaging__consignment_id"], row["purchase_order_line_id"]): [
+            row["purchase_order_line__purchase_order_id"], row["processed"] or ZERO, row["fulfilled"] or ZERO
+        ]
+        for row in rows
+    }
+
+
+def posted_balances(consignment_ids):
+    """Same shape as allocated_balances, summed from the ledger."""
+    from operations.models import QuantityLedgerEntry
+
+    rows = (
+        QuantityLedgerEntry.objects
+        .filter(consignment_id__in=consignment_ids)
+        .values("consignment_id", "purchase_order_line_id", "purchase_order_id")
+        .annotate(processed=Sum("processed_delta"), fulfilled=Sum("fulfilled_delta"))
+        .order_by()
+    )
+    return {
+        (row["consignment_id"], row["purchase_order_line_id"]): [
+            row["purchase_order_id"], row["processed"] or ZERO, row["fulfilled"] or ZERO
+        ]
+        for row in rows
+    }
+
+
+## -------- Posting --------
+
+def post(consignment_ids, kind=QuantityLedgerKindChoices.ALLOCATION):
+    """
+    Post what changed in the consignments' allocations since they were last
+    posted: one entry per consignment line whose processed or fulfilled
+    quantity moved, added onto the line and PO totals with F() increments.
+    Only the given consignments are read, never a line's whole history.
+    Returns the new entries.
+    """
+    return _post(consignment_ids, kind, allocated_balances)
+
+
+def reverse(consignment_ids, kind=QuantityLedgerKindChoices.CANCELLATION):
+    """
+    Post entries taking everything posted for the consignments back to zero,
+    for consignments about to be deleted: their entries outlive them with
+    the consignment unset, and have to net out on the lines.
+    """
+    return _post(consignment_ids, kind, lambda consignment_ids: {})
+
+
+def ledger_pre_delete(sender, instance, **kwargs):
+    """pre_delete receiver for Consignment, see reverse()."""
+    reverse([instance.pk])
+
+
+def _post(consignment_ids, kind, balances):
+    from operations.models import Consignment, QuantityLedgerEntry
+
+    consignment_ids = sorted(set(consignment_ids))
+    if not consignment_ids:
+        return []
+
+    with transaction.atomic():
+        # A concurrent post of the same consignments waits here, then sees these entries
+        list(
+            Consignment._base_manager
+            .select_for_update()
+            .filter(id__in=consignment_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+        current = balances(consignment_ids)
+        posted = posted_balances(consignment_ids)
+
+        entries = []
+        for key in current.keys() | posted.keys():
+            po_id, processed, fulfilled = current.get(key) or posted[key][:1] + [ZERO, ZERO]
+            _, posted_processed, posted_fulfilled = posted.get(key) or [po_id, ZERO, ZERO]
+            if processed == posted_processed and fulfilled == posted_fulfilled:
+                continue
+            consignment_id, line_id = key
+            entries.append(QuantityLedgerEntry(
+                consignment_id=consignment_id,
+                purchase_order_line_id=line_id,
+                purchase_order_id=po_id,
+                kind=kind,
+                processed_delta=processed - posted_processed,
+                fulfilled_delta=fulfilled - posted_fulfilled,
+            ))
+
+        if entries:
+            QuantityLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+            apply(entries)
+    return entries
+
+
+def _increment(model, deltas):
+    """Add {pk: [processed, fulfilled]} onto the model's totals, a batch per UPDATE in pk order."""
+    pks = sorted(deltas)
+    output_field = DecimalField(max_digits=20, decimal_places=2)
+
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = pks[start:start + BATCH_SIZE]
+        processed = Case(*[When(pk=pk, then=Value(deltas[pk][0])) for pk in batch], default=Value(ZERO), output_field=output_field)
+        fulfilled = Case(*[When(pk=pk, then=Value(deltas[pk][1])) for pk in batch], default=Value(ZERO), output_field=output_field)
+        model._base_manager.filter(pk__in=batch).update(
+            processed_quantity=F("processed_quantity") + processed,
+            fulfilled_quantity=F("fulfilled_quantity") + fulfilled,
+        )
+
+
+def apply(entries):
+    """Add the entries onto the PO line and PO totals."""
+    from operations.models import PurchaseOrder, PurchaseOrderLine
+
+    lines = defaultdict(lambda: [ZERO, ZERO])
+    purchase_orders = defaultdict(lambda: [ZERO, ZERO])
+    for entry in entries:
+        for totals in (lines[entry.purchase_order_line_id], purchase_orders[entry.purchase_order_id]):
+            totals[0] += entry.processed_delta
+            totals[1] += entry.fulfilled_delta
+
+    _increment(PurchaseOrderLine, lines)
+    refresh_open_quantity(list(lines))
+    _increment(PurchaseOrder, purchase_orders)
+    check_quantities(list(lines))
+
+
+def check_quantities(line_ids):
+    """Raise ServiceError when any of the lines ended up with a negative open, processed or fulfilled quantity."""
+    from operations.models import PurchaseOrderLine
+
+    line_ids = sorted(set(line_ids))
+    for start in range(0, len(line_ids), 1000):
+        negative = list(
+            PurchaseOrderLine._base_manager
+            .filter(Q(open_quantity__lt=0) | Q(processed_quantity__lt=0) | Q(fulfilled_quantity__lt=0), pk__in=line_ids[start:start + 1000])
+            .values_list("id", flat=True)[:1]
+        )
+        if negative:
+            raise ServiceError(
+                error=f"Negative quantity calculated for PO Line ID {negative[0]}. "
+                      "Please check allocations."
+            )
+
+
+def refresh_open_quantity(line_ids):
+    """open = quantity - processed - fulfilled, for lines whose quantity or totals just changed."""
+    from operations.models import PurchaseOrderLine
+
+    line_ids = sorted(set(line_ids))
+    for start in range(0, len(line_ids), 1000):
+        PurchaseOrderLine._base_manager.filter(pk__in=line_ids[start:start + 1000]).update(
+            open_quantity=Coalesce(F("quantity"), Value(ZERO)) - F("processed_quantity") - F("fulfilled_quantity")
+        )
+
+
+## -------- Reconciliation --------
+
+def reconcile(dry_run=False, chunk_size=2000):
+    """
+    Recompute the line and PO totals from the ledger and fix the ones that
+    drifted. Returns (lines fixed, purchase orders fixed).
+    """
+    from operations.models import PurchaseOrder, PurchaseOrderLine, QuantityLedgerEntry
+
+    def ledger_totals(field):
+        return {
+            row[field]: (row["processed"] or ZERO, row["fulfilled"] or ZERO)
+            for row in (
+                QuantityLedgerEntry.objects
+                .values(field)
+                .annotate(processed=Sum("processed_delta"), fulfilled=Sum("fulfilled_delta"))
+                .order_by()
+            )
+        }
+
+    fixed = []
+    for model, field in ((PurchaseOrderLine, "purchase_order_line_id"), (PurchaseOrder, "purchase_order_id")):
+        totals = ledger_totals(field)
+        drifted = []
+        rows = model._base_manager.values_list("id", "processed_quantity", "fulfilled_quantity").order_by("id")
+        for pk, processed, fulfilled in rows.iterator(chunk_size=chunk_size):
+            expected = totals.get(pk, (ZERO, ZERO))
+            if (processed, fulfilled) != expected:
+                drifted.append(model(id=pk, processed_quantity=expected[0], fulfilled_quantity=expected[1]))
+
+        if drifted and not dry_run:
+            with transaction.atomic():
+                model._base_manager.bulk_update(drifted, ["processed_quantity", "fulfilled_quantity"], batch_size=500)
+                if model is PurchaseOrderLine:
+                    refresh_open_quantity([line.id for line in drifted])
+        fixed.append(len(drifted))
+    return tuple(fixed)
+
+
+def repost_all(kind=QuantityLedgerKindChoices.OPENING, chunk_size=500):
+    """
+    Post every consignment with allocations or ledger entries against its
+    allocations, so the ledger matches them again. Returns the entries written.
+    """
+    from operations.models import PackagingAllocation, QuantityLedgerEntry
+
+    consignment_ids = sorted(
+        set(PackagingAllocation.objects.values_list("consignment_packaging__consignment_id", flat=True).distinct())
+        | set(QuantityLedgerEntry.objects.filter(consignment__isnull=False).values_list("consignment_id", flat=True).distinct())
+    )
+    written = 0
+    for start in range(0, len(consignment_ids), chunk_size):
+        written += len(post(consignment_ids[start:start + chunk_size], kind=kind))
+    return written
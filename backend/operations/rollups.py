@@ -0,0 +1,139 @@
+from collections import Counter
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .audit import get_snapshot
+
+
+## Rollup name -> attname of the status field
+STATUS_FIELDS = {
+    "Consignment": "consignment_status",
+    "PO": "status",
+}
+
+ROLLUP_MODELS = {
+    "operations.consignment": "Consignment",
+    "operations.purchaseorder": "PO",
+}
+
+KEY_FIELDS = ("storerkey_id", "supplier_id", "client_id", "status", "day", "is_completed")
+
+
+def _value(source, name, default=None):
+    if isinstance(source, dict):
+        return source.get(name, default)
+    return getattr(source, name, default)
+
+
+def rollup_values(model, source):
+    """
+    The fields a rollup row is keyed on, read from an instance or from an
+    audit snapshot (a dict of attnames).
+    """
+    created_at = _value(source, "created_at")
+    return {
+        "storerkey_id": _value(source, "storerkey_id"),
+        "supplier_id": _value(source, "supplier_id"),
+        "client_id": _value(source, "client_id"),
+        "status": _value(source, STATUS_FIELDS[model]),
+        # Same day boundary as TruncDate/TruncMonth in the current timezone
+        "day": timezone.localtime(created_at).date() if created_at else None,
+        "is_completed": _value(source, "is_completed", True),
+    }
+
+
+def _key(values):
+    return tuple(values[name] for name in KEY_FIELDS)
+
+
+def apply(model, deltas):
+    """Add each {key: delta} to its rollup row, creating the row on first use."""
+    from .models import StatusRollup
+
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(KEY_FIELDS, key), model=model)
+        if lookup["day"] is None:
+            continue
+
+        # Rows are always summed on read, so a duplicate made by two
+        # concurrent first inserts splits the count without changing it
+        pk = StatusRollup.objects.filter(**lookup).values_list("pk", flat=True).first()
+        if pk:
+            StatusRollup.objects.filter(pk=pk).update(count=F("count") + delta)
+        else:
+            StatusRollup.objects.create(count=delta, **lookup)
+
+
+def track_created(model, instances):
+    apply(model, Counter(_key(rollup_values(model, instance)) for instance in instances))
+
+
+def track_deleted(model, instances):
+    deltas = Counter()
+    for instance in instances:
+        deltas[_key(rollup_values(model, getattr(instance, "_audit_snapshot", None) or instance))] -= 1
+    apply(model, deltas)
+
+
+def track_changes(model, changes):
+    """`changes` is a list of (old, new) instances or snapshots."""
+    deltas = Counter()
+    for old, new in changes:
+        old_key, new_key = _key(rollup_values(model, old)), _key(rollup_values(model, new))
+        if old_key != new_key:
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+    apply(model, deltas)
+
+
+## -------- Receivers --------
+
+def rollup_pre_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._rollup_old = get_snapshot(instance)
+
+
+def rollup_post_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    model = ROLLUP_MODELS[sender._meta.label_lower]
+    old = instance.__dict__.pop("_rollup_old", None)
+
+    if created:
+        track_created(model, [instance])
+        return
+    if not old:
+        return
+
+    new = instance
+    if update_fields is not None:
+        # Only update_fields reached the row
+        saved = {sender._meta.get_field(name).attname for name in update_fields}
+        new = {**old, **{name: getattr(instance, name) for name in saved}}
+    track_changes(model, [(old, new)])
+
+
+def rollup_post_delete(sender, instance, **kwargs):
+    track_deleted(ROLLUP_MODELS[sender._meta.label_lower], [instance])
+
+
+## -------- Reads --------
+
+def rollup_counts(model, group_by="status", filters=None, **lookups):
+    """
+    Summed rollup counts grouped by `group_by`, e.g.
+    rollup_counts("PO", storerkey__in=[...]) -> {status: count}.
+    """
+    from .models import StatusRollup
+
+    queryset = StatusRollup.objects.filter(model=model, **lookups)
+    if filters:
+        queryset = queryset.filter(filters)
+    return {
+        row[group_by]: row["total"] or 0
+        for row in queryset.values(group_by).annotate(total=Sum("count")).order_by()
+    }
@@ -1,28 +1,27 @@
 import json
 import uuid
-import pandas as pd
 import os
+from collections import defaultdict
 from django.conf import settings
-from pathlib import Path
-from django.core.files import File
 from decimal import Decimal
 from core.response import StandardResponse, ServiceError
 from django.db.models import F, Sum, Max, Value, Count, Q, Prefetch, Subquery, OuterRef
 from django.db import transaction
-from .unit_conversion import calculate_volume, convert_weight, convert_dimension
-from .utils import get_allocated_quantity, addresses_and_pickup,parse_any_date
+from .other_services import quantity_ledger
+from .unit_conversion import calculate_volume, calculate_volumes, convert_weight, convert_dimension, volume_expression, weight_expression
+from .utils import get_allocated_quantities, addresses_and_pickup,parse_any_date
 from .models import (ConsignmentPOLineBatch,Consignment,PurchaseOrderLine,PackagingAllocation, PurchaseOrder,
     ConsignmentPackaging, ConsignmentDocumentAttachment, ConsignmentDocument, ConsignmentPOLine, DangerousGoodDocuments,
     ConsignmentAuditTrailField)
 from portal.choices import (
     ConsignmentStatusChoices, ConsignmentCreationSteps, ConsignmentDocumentTypeChoices, ConsoleStatusChoices, PackageStatusChoices, ConsignmentDocumentTypeChoices,
-    PurchaseOrderStatusChoices
+    PurchaseOrderStatusChoices, QuantityLedgerKindChoices
     )
 from portal.utils import convert_to_decimal
+from portal.sequences import max_numeric_suffix, reserve
 from entities.models import Supplier, Client, MaterialMaster
-from django.utils.timezone import is_aware, make_naive
 from django.core.exceptions import ValidationError
-from .notifications import NotificationService
+from .notifications import NotificationService, notification_batch
 from datetime import datetime
 from django.db.models.functions import Coalesce
 from workflows.models import Console
@@ -281,10 +280,17 @@ class ConsignmentWorkflowServices:
             if po_lines.count() != len(unique_line_ids):
                 return None, "Invalid Purchase Orders Lines"
 
+            # Consignments are scoped by their one storerkey, see Consignment.storerkey
+            storerkey_ids = set(po_lines.values_list("purchase_order__storerkey_id", flat=True))
+            if len(storerkey_ids) > 1:
+                return None, "Purchase Order Lines of a consignment must belong to the same Storer Key"
+
             # Replace existing POs with new ones (clear previous associations)
             consignment.purchase_order_lines.set(po_lines)
-            consignment.supplier = po_lines.first().purchase_order.supplier
-            consignment.save(update_fields=["supplier"])
+            purchase_order = po_lines.values("purchase_order__supplier_id").first()
+            consignment.supplier_id = purchase_order["purchase_order__supplier_id"]
+            consignment.storerkey_id = storerkey_ids.pop()
+            consignment.save(update_fields=["supplier", "storerkey"])
             
             return True, None
         
@@ -493,6 +499,24 @@ class ConsignmentWorkflowServices:
             }
 
 
+            # Load the consignment's allocations once, first per package by pk as .first() picked them
+            allocations = (
+                PackagingAllocation.objects
+                .filter(consignment_packaging__consignment=consignment)
+                .select_related("purchase_order_line__purchase_order")
+                .order_by("pk")
+            )
+            package_allocations = {}
+            line_allocations = {}
+            for allocation in allocations:
+                package_allocations.setdefault(allocation.consignment_packaging_id, allocation)
+                line_allocations.setdefault((allocation.consignment_packaging_id, allocation.purchase_order_line_id), allocation)
+
+            # Flags for this line and every line already packed, in one go
+            line_flags = POLineService.logistics_flags_map(
+                [po_line.id] + [allocation.purchase_order_line_id for allocation in package_allocations.values()]
+            ) if package_allocations else {}
+
             for pkg in packages:
                 draft_package_id = pkg.get("draft_package_id")
                 allocated_qty = pkg.get("allocated_qty")
@@ -509,23 +533,17 @@ class ConsignmentWorkflowServices:
                     return None, f"Invalid Package ID: {draft_package_id or package_id}"
 
                 # Check if allocation already exists
-                allocations = (
-                    PackagingAllocation.objects
-                    .filter(consignment_packaging__consignment=consignment)
-                    .select_related("purchase_order_line")
-                    .only("purchase_order_line")
-                )
-                
-                package_allocation = allocations.filter(consignment_packaging=package).first()
+                package_allocation = package_allocations.get(package.id)
                 
                 if package_allocation:
 
                     ## Get dg and oder_type for old
-                    pa_flags = POLineService.logistics_flags(package_allocation.purchase_order_line.id, package_allocation.purchase_order_line.purchase_order)
-                    pa_dg = pa_flags.get("is_dangerous_good", package_allocation.purchase_order_line.is_dangerous_good)            
-                    pa_bt = package_allocation.purchase_order_line.purchase_order.order_type
+                    pa_line = package_allocation.purchase_order_line
+                    pa_flags = line_flags.get(str(pa_line.id), {})
+                    pa_dg = pa_flags.get("is_dangerous_good", pa_line.is_dangerous_good)            
+                    pa_bt = pa_line.purchase_order.order_type
                     
-                    current_line_flags = POLineService.logistics_flags(package_allocation.purchase_order_line.id, package_allocation.purchase_order_line.purchase_order)
+                    current_line_flags = line_flags.get(str(po_line.id), {})
                     current_line_dg = current_line_flags.get("is_dangerous_good", po_line.is_dangerous_good)
                     current_line_bt = po_line.purchase_order.order_type
                     if pa_dg != current_line_dg:
@@ -534,7 +552,7 @@ class ConsignmentWorkflowServices:
                         return None, f"This package contains {pa_bt} order. Please re-allocate to a different package."
                         
 
-                existing_allocation = allocations.filter(consignment_packaging=package, purchase_order_line=po_line).first()
+                existing_allocation = line_allocations.get((package.id, po_line.id))
                 
                 if existing_allocation:
                     # Remove allocation if qty < 0
@@ -569,20 +587,15 @@ class ConsignmentWorkflowServices:
 
 
     @staticmethod
-    def generate_package_id():
-        # Get all AR3 IDs
-        ids = (
-            ConsignmentPackaging.objects
-            .filter(package_id__startswith="AR3")
-            .values_list("package_id", flat=True)
-        )
-
-        # Extract numeric part
-        numbers = [int(i[3:]) for i in ids if i and i[3:].isdigit()]
-
-        # Find max
-        latest_number = max(numbers) if numbers else 30000 - 1  # Start from AR30000
-        return latest_number + 1
+    def generate_package_id(count=1):
+        """
+        Reserves `count` consecutive AR3 numbers, returns the first one.
+        """
+        return reserve(
+            "package", count,
+            # Start from AR30000 when no AR3 ids exist yet
+            seed=lambda: max_numeric_suffix(ConsignmentPackaging.all_objects, "package_id", "AR3", default=30000 - 1)
+        )[0]
 
 
     @classmethod
@@ -599,7 +612,11 @@ class ConsignmentWorkflowServices:
             draft_packages = packages.filter(status=PackageStatusChoices.DRAFT)
             
 
-            next_id = cls.generate_package_id()
+            draft_packages = list(draft_packages)
+            if not draft_packages:
+                return "Packages updated successfully", None
+
+            next_id = cls.generate_package_id(len(draft_packages))
 
             for package in draft_packages:
                 package.package_id = f"AR3{next_id:05d}"  # zero-padded
@@ -623,9 +640,7 @@ class ConsignmentWorkflowServices:
         """
         
         try:
-            lines = consignment.purchase_order_lines.all()
-
-            POLineService.update_line_quantities(lines)
+            quantity_ledger.post([consignment.id])
             
             # allocations = (
             #     PackagingAllocation.objects
@@ -809,16 +824,12 @@ class ConsignmentWorkflowServices:
         dg_lines_count = consignment_po_line.filter(compliance_dg=True).distinct().count()
         chemical_goods_count = consignment_po_line.filter(compliance_chemical=True).distinct().count()
 
-        total_weight_kg = 0
-        total_volume_m3 = 0
-        
-        for pkg in packages.select_related("packaging_type"):
-            package_type = pkg.packaging_type
-
-            total_weight_kg += convert_weight(pkg.weight, pkg.weight_unit, "Kilogram")
-            total_volume_m3 += calculate_volume(
-                package_type.length, package_type.width, package_type.height, package_type.dimension_unit
-            )
+        totals = packages.aggregate(
+            weight=Coalesce(Sum(weight_expression()), Value(Decimal("0"))),
+            volume=Coalesce(Sum(volume_expression("packaging_type__")), Value(Decimal("0"))),
+        )
+        total_weight_kg = totals["weight"]
+        total_volume_m3 = totals["volume"]
 
         counts = {
             "purchase_orders": po_count,
@@ -882,7 +893,12 @@ class ConsignmentWorkflowServices:
             if errors:
                 return "", errors
             
-            packages = consignment.packagings.filter(draft_package_id__isnull=False)
+            packages = (
+                consignment.packagings
+                .filter(draft_package_id__isnull=False)
+                .select_related("packaging_type")
+                .annotate(weight_kg=weight_expression(), volume=volume_expression("packaging_type__"))
+            )
             
             # Calculate total weight (convert all to kg for consistency)
             total_weight_kg = Decimal('0.0')
@@ -893,16 +909,10 @@ class ConsignmentWorkflowServices:
 
                 # Calculate weight
                 # total_weight_kg += package.weight / Decimal('1000') if package.weight else Decimal('0.0')
-                total_weight_kg += convert_weight(package.weight, package.weight_unit, 'Kilogram')
+                total_weight_kg += package.weight_kg
 
                 # Calculate volume
-                packaging_type = package.packaging_type
-                volume = calculate_volume(
-                    packaging_type.length if packaging_type else None,
-                    packaging_type.width if packaging_type else None,
-                    packaging_type.height if packaging_type else None,
-                    packaging_type.dimension_unit if packaging_type else None
-                )
+                volume = package.volume
                 total_volume_m3 += volume
 
                 # Get po lines for the package
@@ -1050,13 +1060,14 @@ class ConsignmentWorkflowServices:
 
             allocation_map.setdefault(pkg_id, []).append(allocation_data)
 
-        for pkg in packages:
-            pkg["volume"] = calculate_volume(
-                pkg.get("length", ""),
-                pkg.get("width", ""),
-                pkg.get("height", ""),
-                pkg.get("dimension_unit", "")
-            )
+        volumes = calculate_volumes(
+            [pkg["length"] for pkg in packages],
+            [pkg["width"] for pkg in packages],
+            [pkg["height"] for pkg in packages],
+            [pkg["dimension_unit"] for pkg in packages],
+        )
+        for pkg, volume in zip(packages, volumes):
+            pkg["volume"] = round(Decimal(str(volume)), 6)
 
             pkg["allocations"] = allocation_map.get(pkg["id"], [])
 
@@ -1093,21 +1104,12 @@ class ConsignmentWorkflowServices:
         packages_qs = consignment.packagings.all()
         packages_count = packages_qs.count()
 
-        total_weight = 0
-        total_volume = 0
-        for package in packages_qs:
-
-            total_weight += convert_weight(
-                package.weight,
-                package.weight_unit
-            )
-
-            total_volume += calculate_volume(
-                package.packaging_type.length if package.packaging_type else None,
-                package.packaging_type.width if package.packaging_type else None,
-                package.packaging_type.height if package.packaging_type else None,
-                package.packaging_type.dimension_unit if package.packaging_type else None
-            )
+        totals = packages_qs.aggregate(
+            weight=Coalesce(Sum(weight_expression()), Value(Decimal("0"))),
+            volume=Coalesce(Sum(volume_expression("packaging_type__")), Value(Decimal("0"))),
+        )
+        total_weight = totals["weight"]
+        total_volume = totals["volume"]
 
         address, errors = addresses_and_pickup(consignment_id=consignment_id)
         if errors:
@@ -1164,25 +1166,9 @@ class ConsignmentWorkflowServices:
             orphan_allocations.delete()
             return
 
-        #Aggregate allocated qty by line
-        restore_qty = (
-            orphan_allocations
-            .values("purchase_order_line_id")
-            .annotate(total_allocated=Sum("allocated_qty"))
-        )
-
-        #Update open_quantity in bulk
-        for row in restore_qty:
-            line_id = row["purchase_order_line_id"]
-            qty_to_restore = row["total_allocated"] or 0
-            if qty_to_restore > 0:
-                PurchaseOrderLine.objects.filter(id=line_id).update(
-                    open_quantity=F("open_quantity") + qty_to_restore,
-                    processed_quantity=F("processed_quantity") - qty_to_restore
-                )
-
-        #Delete orphan allocations afterwards
+        #Delete orphan allocations, then give their quantities back to the lines
         orphan_allocations.delete()
+        quantity_ledger.post([consignment.id])
 
 
 
@@ -1700,22 +1686,17 @@ class ConsignmentStatusService:
         # if error:
         #     raise ServiceError(error=error)
         
+        consignment_ids = list(consignments.values_list("id", flat=True))
         consignments.update(consignment_status=ConsignmentStatusChoices.CANCELLED,cancellation_remarks = cancellation_reason,console="")
 
         (
             ConsignmentPackaging.objects
-            .filter(consignment__in=consignments)
+            .filter(consignment_id__in=consignment_ids)
             .update(status=PackageStatusChoices.CANCELLED)
         )
-        
-        po_lines = (
-            PurchaseOrderLine.objects
-            .filter(consignments_po_lines__consignment__in=consignments)
-            .select_related("purchase_order")
-            .distinct()
-        )
 
-        POLineService.update_line_quantities(po_lines)
+        ## Releases the processed quantities back to the lines
+        quantity_ledger.post(consignment_ids, kind=QuantityLedgerKindChoices.CANCELLATION)
         
         return consignments, None
 
@@ -1842,20 +1823,19 @@ class ConsignmentStatusService:
             )
 
             ## Get all distinct lines 
-            po_lines = (
-                PurchaseOrderLine.objects
-                .filter(consignments_po_lines__consignment__in=consignments)
-                .select_related("purchase_order")
+            po_line_ids = list(
+                ConsignmentPOLine.objects
+                .filter(consignment_id__in=consignment_ids)
+                .values_list("purchase_order_line_id", flat=True)
                 .distinct()
             )
 
-            if not po_lines:
+            if not po_line_ids:
                 return consignments, None
 
-            ## Update fullfilled, open, and processed quantities
-            POLineService.update_line_quantities(po_lines)
+            ## Move the delivered quantities from processed to fulfilled
+            quantity_ledger.post(consignment_ids, kind=QuantityLedgerKindChoices.RECEIPT)
             
-            po_line_ids = list(po_lines.values_list("id", flat=True).distinct())
             # Update PARTIALLY_FULFILLED lines
             PurchaseOrderLine.objects.filter(
                 id__in=po_line_ids, fulfilled_quantity__gt=0
@@ -1866,10 +1846,9 @@ class ConsignmentStatusService:
                 id__in=po_line_ids,open_quantity=0,processed_quantity=0
             ).update(status=PurchaseOrderStatusChoices.CLOSED)
 
-            purchase_orders = [po_line.purchase_order for po_line in po_lines]
-
-            for po in purchase_orders:
-                po.update_status()
+            PurchaseOrderService.update_statuses(
+                PurchaseOrderLine.objects.filter(id__in=po_line_ids).values_list("purchase_order_id", flat=True).distinct()
+            )
 
             return consignments, None
         
@@ -1923,7 +1902,22 @@ class ConsignmentStatusService:
 class ConsignmentServices:
 
     @classmethod
-    def notify_consignment_update(cls ,user ,instance):
+    def notify_consignments_update(cls, user, consignments):
+        """
+        notify_consignment_update for many consignments, fanned out in one
+        write with the recipients looked up once per supplier/client.
+        """
+        if hasattr(consignments, "select_related"):
+            consignments = consignments.select_related("client", "console__freight_forwarder")
+
+        recipients = {}
+        with notification_batch():
+            for instance in consignments:
+                cls.notify_consignment_update(user, instance, recipients=recipients)
+
+
+    @classmethod
+    def notify_consignment_update(cls ,user ,instance, recipients=None):
 
         """
         Pre-save signal for updating consignment notifications.
@@ -1955,7 +1949,7 @@ class ConsignmentServices:
             if console and console.freight_forwarder:
                 header = "Pickup Rejected by Freight Forwarder"
                 message = "Pickup for the Console {console_id} is Rejected by FF " + f"{console.freight_forwarder.name}"
-                hyperlink_value = {"console_id":console_id}
+                hyperlink_value = {"console_id":console.console_id}
 
             else:
                 header = "Pickup Request {consignment_id} Rejected"
@@ -2016,7 +2010,7 @@ class ConsignmentServices:
         
         handler = getattr(NotificationService, f"consignment_update", None)
         if handler:
-            handler(instance, user, header, message, hyperlink_value)
+            handler(instance, user, header, message, hyperlink_value, recipients=recipients)
 
 
 
@@ -2139,56 +2133,70 @@ class POLineService:
         """
         Collects logistics/compliance flags for a given PurchaseOrderLine.
         """
-        result = {}
+        return cls.logistics_flags_map([line_id], purchase_order).get(str(line_id), {})
+
 
-        line = (
+    @classmethod
+    def logistics_flags_map(cls, line_ids, purchase_order=None):
+        """
+        logistics_flags for many PurchaseOrderLines with one line/PO query and
+        one MaterialMaster query.
+        Args:
+            line_ids: The PurchaseOrderLine ids.
+            purchase_order: Used instead of each line's own purchase order, if given.
+        Returns:
+            {str(line_id): flags}
+        """
+        lines = list(
             PurchaseOrderLine.objects
-            .filter(id=line_id)
-            .only("product_code")
-            .first()
+            .filter(id__in={line_id for line_id in line_ids if line_id})
+            .select_related("purchase_order__storerkey")
         )
+        if not lines:
+            return {}
 
-        if line:
-            # storerkeys_qs = line.purchase_order.storerkey
-            purchase_order = purchase_order if purchase_order else line.purchase_order
-            storerkey = purchase_order.storerkey
-            hub = storerkey.hub
-
-            mm = (
-                MaterialMaster.objects
-                .filter(
-                    product_code=line.product_code,
-                    storerkey=storerkey,
-                    hub=hub
-                )
-                .values("is_dangerous_good", "is_chemical")
-                .first()
+        storerkeys = {line.id: (purchase_order or line.purchase_order).storerkey for line in lines}
+
+        # First match per (product_code, storerkey, hub), as .first() picked it
+        materials = {}
+        for mm in (
+            MaterialMaster.objects
+            .filter(
+                product_code__in={line.product_code for line in lines},
+                storerkey_id__in={storerkey.id for storerkey in storerkeys.values()},
             )
+            .values("product_code", "storerkey_id", "hub_id", "is_dangerous_good", "is_chemical")
+            .order_by("pk")
+        ):
+            materials.setdefault((mm["product_code"], mm["storerkey_id"], mm["hub_id"]), mm)
+
+        flags_map = {}
+        for line in lines:
+            storerkey = storerkeys[line.id]
+            result = {}
+
+            mm = materials.get((line.product_code, storerkey.id, storerkey.hub_id))
             if mm:
                 if mm["is_dangerous_good"]:
                     result["is_dangerous_good"] = True
                 if mm["is_chemical"]:
                     result["is_chemical"] = True
 
-        # Fetch storer level validations
-        # storerkeys = purchase_order.storerkeys
-        # s = storerkey
-
-        # Merge storer flags into result if any True
-        # for s in storerkeys:
-        if storerkey.generate_asn:
-            result["generate_asn"] = True
-        if storerkey.hs_code_validation:
-            result["hs_code_validation"] = True
-        if storerkey.eccn_validation:
-            result["eccn_validation"] = True
-        if storerkey.chemical_good_handling:
-            result["chemical_good_handling"] = True
-            result["is_chemical"] = True
+            # Merge storer flags into result if any True
+            if storerkey.generate_asn:
+                result["generate_asn"] = True
+            if storerkey.hs_code_validation:
+                result["hs_code_validation"] = True
+            if storerkey.eccn_validation:
+                result["eccn_validation"] = True
+            if storerkey.chemical_good_handling:
+                result["chemical_good_handling"] = True
+                result["is_chemical"] = True
 
-        result["order_type"] = purchase_order.order_type
+            result["order_type"] = (purchase_order or line.purchase_order).order_type
+            flags_map[str(line.id)] = result
 
-        return result
+        return flags_map
 
 
     @classmethod
@@ -2266,14 +2274,28 @@ class POLineService:
     def add_additional_info(cls, po_lines_qs, purchase_order, consignment = None):
         """
         Sets extra fields for a given PO line based on the provided flags.
+        Flags, compliance details and allocated quantities are loaded for all
+        the lines at once.
         """
-        # Post-process the queryset in Python
-        for line in po_lines_qs:
-            
-            po_id = line.get("po_id") if line.get("po_id") else line.get("purchase_order")
+        line_ids = [line.get("id") for line in po_lines_qs]
+        flags_map = cls.logistics_flags_map(line_ids)
+
+        compliance_map = {}
+        allocated_map = {}
+        if consignment:
+            for compliance_data in (ConsignmentPOLine.objects
+                .filter(consignment_id=consignment.id, purchase_order_line_id__in=line_ids)
+                .values("id", "purchase_order_line_id", "hs_code", "eccn", "country_of_origin")
+                .order_by("pk")
+            ):
+                compliance_map.setdefault(str(compliance_data["purchase_order_line_id"]), compliance_data)
+
+            allocated_map = get_allocated_quantities(consignment.id, line_ids)
 
-            purchase_order = PurchaseOrder.objects.filter(id=po_id).first()          
-            flags = POLineService.logistics_flags(line['id'],purchase_order)
+        # Post-process the lines in Python
+        for line in po_lines_qs:
+            line_id = str(line.get("id"))
+            flags = flags_map.get(line_id, {})
 
             line["is_dangerous_good"] = flags.get("is_dangerous_good", line.get("is_dangerous_good"))
             line["is_chemical"] = flags.get("is_chemical", line.get("is_chemical"))
@@ -2289,15 +2311,10 @@ class POLineService:
                     line[flag] = False
             
             if consignment:
+                compliance_data = compliance_map.get(line_id)
 
-                compliance_data = (ConsignmentPOLine.objects
-                    .filter(consignment_id=consignment.id, purchase_order_line_id=line.get("id"))
-                    .values("id","hs_code", "eccn","country_of_origin")
-                    .first()
-                )
-
-                line["allocated_quantity"] = get_allocated_quantity(consignment.id,line.get("id"))
-                if compliance_data["country_of_origin"]:
+                line["allocated_quantity"] = allocated_map.get(line_id, 0)
+                if compliance_data and compliance_data["country_of_origin"]:
                     line["hs_code"] = compliance_data["hs_code"]
                     line["eccn"] = compliance_data["eccn"]
                     line["country_of_origin"] = compliance_data["country_of_origin"]
@@ -2359,50 +2376,40 @@ class POLineService:
 
     @classmethod
     def update_line_quantities(cls, po_lines):
-        po_line_ids = [line.id for line in po_lines]
-
-        # Annotate processed quantity for all lines in 1 query
-        annotated_lines = (
-            PurchaseOrderLine.objects
-            .filter(id__in=po_line_ids)
-            .annotate(
-                processed_qty_calc=Sum(
-                    "packaging_allocations__allocated_qty",
-                    filter=Q(packaging_allocations__consignment_packaging__status=PackageStatusChoices.NOT_RECEIVED)
-                ),
-
-                fulfilled_qty_calc=Sum(
-                    "packaging_allocations__allocated_qty",
-                    filter=Q(packaging_allocations__consignment_packaging__status__in=[
-                        PackageStatusChoices.DELIVERED, PackageStatusChoices.RECEIVED]
-                    )
-                )
-            )
-        )
-
-        lines_to_update = []
-        for line in annotated_lines:
-            processed_qty = line.processed_qty_calc or Decimal(0)
-            fulfilled = line.fulfilled_qty_calc or Decimal(0)
-            original = line.quantity or Decimal(0)
-
-            line.processed_quantity = processed_qty
-            line.fulfilled_quantity = fulfilled
-            line.open_quantity = original - processed_qty - fulfilled
-
-            if line.open_quantity < 0 or line.processed_quantity < 0 or line.fulfilled_quantity < 0:
-                raise ServiceError(
-                    error=f"Negative quantity calculated for PO Line ID {line.id}. "
-                          "Please check allocations."
-                )
-
-            lines_to_update.append(line)
-
-        PurchaseOrderLine.objects.bulk_update(lines_to_update, ["fulfilled_quantity", "processed_quantity", "open_quantity"])
+        """
+        Refresh the open quantity of lines whose ordered quantity changed.
+        Processed and fulfilled quantities are kept by the quantity ledger,
+        see operations.other_services.quantity_ledger.post. Raises
+        ServiceError when a quantity falls below what is already allocated.
+        """
+        line_ids = [line.id for line in po_lines]
+        quantity_ledger.refresh_open_quantity(line_ids)
+        quantity_ledger.check_quantities(line_ids)
 
 
 
 class PurchaseOrderService:
+
+    @staticmethod
+    def update_statuses(po_ids):
+        """
+        PurchaseOrder.update_status for many POs: the line statuses in one
+        query, and a save only for the POs whose status actually changes.
+        """
+        line_statuses = defaultdict(set)
+        for po_id, status in (
+            PurchaseOrderLine.objects
+            .filter(purchase_order_id__in=list(po_ids))
+            .values_list("purchase_order_id", "status")
+            .distinct()
+        ):
+            line_statuses[po_id].add(status)
+
+        for po in PurchaseOrder.objects.filter(id__in=list(line_statuses)).order_by("id"):
+            status = PurchaseOrder.status_from_lines(line_statuses[po.id], po.status)
+            if status != po.status:
+                po.status = status
+                po.save(update_fields=["status"])
     
     @staticmethod
     def update_open_quantity(po_qs):
@@ -2424,296 +2431,6 @@ class PurchaseOrderService:
 
 class ComprehensiveReportService:
 
-    @classmethod
-    def json_data(cls, consignments_qs):
-        """
-        Returns comprehensive report data in JSON format.
-        Args:
-            from_date and to_date: The date range for the report.
-            both the arguments are datetime objects and format is 'YYYY-MM-DD'.
-            from_date: The start date for the report.
-            to_date: The end date for the report.
-            status: The status of the consignments to include in the report.
-        Returns:
-            A dictionary containing the comprehensive report data in JSON format.
-        """
-        try:
-
-            # Get only IDs
-            consignment_ids = consignments_qs.values_list("consignment_id", flat=True)
-
-            values = ["is_dangerous_good"]
-            packages_qs = (
-                PackagingAllocation.objects
-                .filter(consignment_packaging__consignment__consignment_id__in=consignment_ids)
-                .exclude(consignment_packaging__status__in=[PackageStatusChoices.DRAFT])
-                .values(*values)
-                .annotate(
-                    package_id = F("consignment_packaging__package_id"),
-                    pickup_id = F("consignment_packaging__consignment__consignment_id"),
-                    console_id = F("consignment_packaging__consignment__console__console_id"),
-                    weight = F("consignment_packaging__weight"),
-                    weight_unit = F("consignment_packaging__weight_unit"),
-                    length= F("consignment_packaging__packaging_type__length"),
-                    width= F("consignment_packaging__packaging_type__width"),
-                    height= F("consignment_packaging__packaging_type__height"),
-                    dimension_unit= F("consignment_packaging__packaging_type__dimension_unit"),
-                    package_type=F("consignment_packaging__packaging_type__package_type"),
-                    is_stackable=F("consignment_packaging__packaging_type__is_stackable"),
-                    is_kit = Value('-'),
-                    supplier_customer_code = F("consignment_packaging__consignment__supplier__supplier_code"),
-                    supplier_customer_name = F("consignment_packaging__consignment__supplier__name"),
-                    transection_number=F("purchase_order_line__purchase_order__customer_reference_number"),
-                    transaction_type= Value('PO'),
-                    transaction_line = F("purchase_order_line__customer_reference_number"),
-                    product_code=F("purchase_order_line__product_code"),
-                    quantity = F("allocated_qty"),
-                    uom = F("purchase_order_line__sku"),
-                    pickup_creation_date= F("consignment_packaging__consignment__created_at"),
-                    collection_approval_date=Value('-'),
-                    approval_kpi = Value('-'),
-                    green_light_release_date=Value('-'),
-                    ncr_reference=Value('-'),
-                    ncr_created_date=Value('-'),
-                    ncr_closed_date=Value('-'),
-                    pick_up_required_date=Value('-'),
-                    actual_pickup_date=F("consignment_packaging__consignment__actual_pickup_datetime"),
-                    customs_cleared_date=Value('-'),
-                    actual_delivery_date=Value('-'),
-                    collection_status=F("consignment_packaging__status"),
-                    age_till_date = Value('-'),
-                    age_range = Value('-'),
-                    sloc = F("purchase_order_line__purchase_order__center_code"),
-                    plant_code = F("purchase_order_line__purchase_order__plant_id"),
-                    pickup_status=F("consignment_packaging__consignment__consignment_status"),
-                    classification = Value('-'),
-                    urgent_priority_order = Value('-'),
-                    remarks = Value('-'),
-                    hawb = Value('-'),
-                    mawb = Value('-'),
-                    bol = Value('-'),
-                    nvision_sync_status=Value('NO'),
-                    asn_aa_applicable = Value('-'),
-                    asn_reference=Value('-'),
-                    aa_reference=Value('-'),
-                    carrier = F("consignment_packaging__consignment__console__freight_forwarder__name"),
-                    sender_name = F("consignment_packaging__consignment__consignor_address__address_name"),
-                    sender_address=F("consignment_packaging__consignment__consignor_address__address_name"),
-                    sender_pincode=F("consignment_packaging__consignment__consignor_address__zipcode"),
-                    sender_city=F("consignment_packaging__consignment__consignor_address__city"),
-                    sender_state=F("consignment_packaging__consignment__consignor_address__state"),
-                    sender_country=F("consignment_packaging__consignment__consignor_address__country"),
-                    destination_name = F("consignment_packaging__consignment__delivery_address__address_name"),
-                    destination_address=F('consignment_packaging__consignment__delivery_address__address_name'),
-                    destination_pincode=F("consignment_packaging__consignment__delivery_address__zipcode"),
-                    destination_city=F("consignment_packaging__consignment__delivery_address__city"),
-                    destination_state=F("consignment_packaging__consignment__delivery_address__state"),
-                    destination_country=F("consignment_packaging__consignment__delivery_address__country"),
-                    created_by = F("consignment_packaging__consignment__created_by__name"),
-                    approved_by = Value('-'),
-                    dangerous_good_un_class=Value('-'),
-                    dangerous_good_name=Value('-'),
-                    dangerous_good_class=Value('-'),
-                    eccn=Value('-'),
-                    hscode=Value('-'),
-                    quote_requested_date=Value('-'),
-                    quote_approval_date=Value('-'),
-                    shipped_date=Value('-'),
-                    receiption_date=Value('-'),
-                    receiption_status=Value('-'),
-                    etd = Value('-'),
-                    eta = Value('-'),
-                    atd = Value('-'),
-                    ata = Value('-'),
-                    tracking_url = Value('-'),
-                )
-            )
-            compliance_qs = (
-                ConsignmentPOLine.objects
-                .select_related('dg_class', 'dg_category')
-                .filter(
-                    consignment__consignment_id__in=consignment_ids,
-                    purchase_order_line__customer_reference_number__in=packages_qs.values_list('transaction_line', flat=True),
-                )
-            )
-
-            compliance_map = {
-                (c.consignment.consignment_id, c.purchase_order_line.customer_reference_number): c
-                for c in compliance_qs
-            }
-
-
-            audit_logs = ConsignmentAuditTrailField.objects.filter(
-                audit_trail__consignment__consignment_id__in=consignment_ids
-            )
-            
-            packages = []
-            for p in packages_qs:
-                # Make timezone-naive
-                if p.get('actual_pickup_date') and is_aware(p['actual_pickup_date']):
-                    p['actual_pickup_date'] = make_naive(p['actual_pickup_date'])
-
-                if p.get('pickup_creation_date') and is_aware(p.get('pickup_creation_date')):
-                    p['pickup_creation_date'] = make_naive(p['pickup_creation_date'])
-
-                # Convert dimensions and weight
-                l = convert_dimension(p.get('length'), p.get('dimension_unit'), "Inch")
-                w = convert_dimension(p.get('width'), p.get('dimension_unit'), "Inch")
-                h = convert_dimension(p.get('height'), p.get('dimension_unit'), "Inch")
-                p["dimensions"] = f"{l} * {w} * {h}"
-                p["weight"] = convert_weight(p.get('weight'), p.get('weight_unit'), "Pound")
-
-                # Fill compliance
-                comp = compliance_map.get((p['pickup_id'], p['transaction_line']))
-                if comp:
-                    p["is_dangerous_good"] = comp.compliance_dg,
-                    p["is_chemical"] = comp.compliance_chemical,
-                    p["dangerous_good_un_class"] = comp.dg_class.name if comp.dg_class else ""
-                    p["dangerous_good_name"] = comp.dg_category.name if comp.dg_category else ""
-                    p["dangerous_good_class"] = comp.dg_class.name if comp.dg_class else ""
-                    p["eccn"] = comp.eccn or ""
-                    p["hscode"] = comp.hs_code or ""
-
-                
-                ## Set dates from logs
-                logs = audit_logs.filter(audit_trail__consignment__consignment_id=p["pickup_id"])
-                
-                creation_date = parse_any_date(p["pickup_creation_date"])
-                approval_date = parse_any_date(
-                    logs.filter(title__icontains="Pending Console Assignment")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-                delivery_date = parse_any_date(
-                    logs.filter(title__icontains="Consignment Delivered")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-
-                requested_id_approval_kpi = None
-                age_till_date = None
-
-                if delivery_date:
-                    age_till_date = (
-                        datetime.strptime(delivery_date, "%Y-%m-%d").date() -
-                        datetime.strptime(creation_date, "%Y-%m-%d").date() 
-                    ).days
-
-                if approval_date and creation_date:
-                    requested_id_approval_kpi = (
-                        datetime.strptime(approval_date, "%Y-%m-%d").date() -
-                        datetime.strptime(creation_date, "%Y-%m-%d").date() 
-                    ).days
-
-                p["pickup_creation_date"] = creation_date
-                p["collection_approval_date"] = approval_date
-                p["approval_kpi"] = requested_id_approval_kpi if requested_id_approval_kpi else ""
-
-                p["pick_up_required_date"] = parse_any_date(
-                    logs.filter(title__icontains="Freight Forwarder Assigned")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-
-                p["actual_pickup_date"] = parse_any_date(
-                    logs.filter(title__icontains="Pickup Completed")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-
-                p["actual_delivery_date"] = delivery_date
-
-                p["quote_requested_date"] = parse_any_date(
-                    logs.filter(title__icontains="Consignment Pending Bid")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-
-
-                p["quote_approval_date"] = parse_any_date(
-                    logs.filter(title__icontains="Consignment Console Assigned")
-                    .values_list("created_at", flat=True)
-                    .order_by("-updated_at")
-                    .first()
-                )
-                
-                p["age_till_date"] = "" if age_till_date == None else age_till_date
-
-                p["shipped_date"] = parse_any_date(
-                    logs.filter(title__icontains="Received At Destination")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-
-                p["atd"] = parse_any_date(
-                    logs.filter(title__icontains="Received At Destination")
-                    .values_list("created_at", flat=True)
-                    .first()
-                )
-    
-                packages.append(p)
-
-            return packages, None
-
-        except Exception as e:
-            return None, str(e)
-
-    
-    @classmethod
-    def build_report(cls, data):
-        try:
-            qs = ConsignmentDocumentAttachment.objects.filter(document__document_type=ConsignmentDocumentTypeChoices.COMPREHENSIVE_REPORT)
-
-            # delete files from storage first
-            for att in qs:
-                if att.file:
-                    att.file.delete(save=False)
-            qs.delete()
-
-            df = pd.DataFrame(data)
-            header_map = ComprehensiveReportService.get_headers()
-
-            # Rename headers:
-            df.rename(columns=header_map, inplace=True)
-
-            # Reorder to match mapping exactly
-            df = df[list(header_map.values())]
-
-            report_dir = Path(settings.MEDIA_ROOT) / "consignments/documents/comprehensive_reports"
-            report_dir.mkdir(parents=True, exist_ok=True)
-
-            # filename = f"consignment_report_{generate_unique_id('')}.xlsx"
-            filename = f"pickup_comprehensive_reports.xlsx"
-
-            file_path = report_dir / filename
-
-            # Save Excel file
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Report', index=False)
-                worksheet = writer.sheets['Report']
-                for cell in next(worksheet.iter_rows(min_row=1, max_row=1)):
-                    cell.font = cell.font.copy(bold=True)
-
-            # Save file to DB
-            relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-            file_url = f"{settings.MEDIA_URL}{relative_path.replace(os.sep, '/')}"
-
-            document = ConsignmentDocument.objects.create(
-                document_type=ConsignmentDocumentTypeChoices.COMPREHENSIVE_REPORT
-            )
-            with open(file_path, 'rb') as f:
-                django_file = File(f)
-                attachment = ConsignmentDocumentAttachment.objects.create(document=document)
-                attachment.file.save(filename, django_file, save=True)
-
-            return file_url, None
-
-        except Exception as e:
-            return None, str(e)
-
-        
-
-        
     @classmethod
     def get_headers(cls):
 
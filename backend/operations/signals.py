@@ -1,6 +1,7 @@
 from crequest.middleware import CrequestMiddleware
 from .notifications import NotificationService
-from portal.choices import ConsignmentStatusChoices, NotificationChoices, Role, OperationUserRole
+from .audit import audit_batch, get_snapshot, record
+from portal.choices import ConsignmentStatusChoices, NotificationChoices, Role, OperationUserRole, AuditTrailKindChoices
 import os
 
 
@@ -16,6 +17,16 @@ def create_title(model,field_name,new_value,old_value):
     return ""
 
 
+def field_change(model, field_name, old_value, new_value):
+    return {
+        "field_name": field_name,
+        "old_value": old_value,
+        "new_value": new_value,
+        "title" : create_title(model,field_name,new_value,old_value),
+        'description' : f'{field_name.replace("_", " ").title()} changed from {old_value} to {new_value}'
+    }
+
+
 def track_field_changes(instance, old_instance,model,**kwargs,):
     
     """Detect field changes between old and new instances."""
@@ -31,57 +42,50 @@ def track_field_changes(instance, old_instance,model,**kwargs,):
                 new_value = getattr(instance, field_name, None)
 
             if old_value != new_value:
+                field_changes.append(field_change(model, field_name, old_value, new_value))
+
+    return field_changes
 
-                title = create_title(model,field_name,new_value,old_value)
-                
-                field_changes.append({
-                    "field_name": field_name,
-                    "old_value": old_value,
-                    "new_value": new_value,
-                    "title" : title,
-                    'description' : f'{field_name.replace("_", " ").title()} changed from {old_value} to {new_value}'
-                })
+
+def snapshot_changes(instance, model, update_fields=None):
+    """
+    Detect field changes against the values the instance was loaded with.
+    """
+    snapshot = get_snapshot(instance)
+    field_changes = []
+
+    for field in instance._meta.concrete_fields:
+        field_name = field.attname
+        if update_fields is not None and field.name not in update_fields and field_name not in update_fields:
+            continue
+        if field_name not in snapshot or field_name not in instance.__dict__:
+            continue
+
+        old_value = snapshot[field_name]
+        new_value = instance.__dict__[field_name]
+        if old_value != new_value:
+            field_changes.append(field_change(model, field_name, old_value, new_value))
 
     return field_changes
     
 
-def create_logs(field_changes, instance, model,updated_by=None):
-    from .models import ConsignmentAuditTrail, ConsignmentAuditTrailField,AuditTrail,AuditTrailField
-
-    """Created audit trail logs for field changes."""
-    if field_changes:
-            if model == "Consignment":
-
-                audit_trail = ConsignmentAuditTrail.objects.create(
-                    consignment=instance,
-                    updated_by=updated_by,
-                )
-
-                for change in field_changes:
-                    ConsignmentAuditTrailField.objects.create(
-                        audit_trail=audit_trail,
-                        title = change['title'],
-                        description = change['description'],
-                        field_name=change['field_name'],
-                        old_value=change['old_value'],
-                        new_value=change['new_value']
-                    )
+def bulk_update_audit_trail(instances, model, fields):
+    """
+    Audit trail for instances about to be written with bulk_update,
+    which skips the pre_save receivers.
+    """
+    updated_by = get_current_user()
+    if not updated_by:
+        return
 
-            else:
-                audit_trail = AuditTrail.objects.create(
-                    model=instance,
-                    updated_by=updated_by,
-                )
-
-                for change in field_changes:
-                    AuditTrailField.objects.create(
-                        audit_trail=audit_trail,
-                        title = change['title'],
-                        description = change['description'],
-                        field_name=change['field_name'],
-                        old_value=change['old_value'],
-                        new_value=change['new_value']
-                    )
+    with audit_batch():
+        for instance in instances:
+            create_logs(snapshot_changes(instance, model, fields), instance, model, updated_by)
+
+
+def create_logs(field_changes, instance, model,updated_by=None):
+    """Queue audit trail logs for field changes, written in bulk on commit."""
+    record(model, instance, updated_by, field_changes)
 
 
 def awb_file_added_audit_trail(instance):
@@ -121,8 +125,9 @@ def awb_file_deleted_audit_trail(instance):
 
 
 
-def create_audit_trail(sender, instance, **kwargs):
-    from .models import Consignment,ConsignmentAuditTrail
+def create_audit_trail(sender, instance, update_fields=None, **kwargs):
+    from .models import ConsignmentAuditTrail
+    from .other_services import audit_archive
 
     """
     Pre-save signal for creating audit trail entries for the Consignment model.
@@ -131,11 +136,14 @@ def create_audit_trail(sender, instance, **kwargs):
         updated_by = get_current_user()
         if not updated_by:
             return
-        
-        old_instance = Consignment.objects.get(pk=instance.pk)
-        existing_logs = ConsignmentAuditTrail.objects.filter(consignment_id = instance.pk)
 
-        if not existing_logs:
+        if not getattr(instance, "_audit_has_trail", False):
+            instance._audit_has_trail = (
+                ConsignmentAuditTrail.objects.filter(consignment_id=instance.pk).exists()
+                or audit_archive.has_archived(AuditTrailKindChoices.CONSIGNMENT, instance.pk)
+            )
+
+        if not instance._audit_has_trail:
 
             field_changes = [{
                 'title' : "Consignment Created" ,
@@ -146,16 +154,15 @@ def create_audit_trail(sender, instance, **kwargs):
             }]
             
             create_logs(field_changes, instance,"Consignment", updated_by)
+            instance._audit_has_trail = True
 
         else:
 
-            field_changes = track_field_changes(instance, old_instance,"Consignment",**kwargs)
+            field_changes = snapshot_changes(instance, "Consignment", update_fields)
             create_logs(field_changes, instance,"Consignment", updated_by)
 
 
-def po_audit_trail(sender, instance, **kwargs):
-    from .models import PurchaseOrder
-
+def po_audit_trail(sender, instance, update_fields=None, **kwargs):
     """
     Pre-save signal for creating audit trail entries for the PO model.
     """
@@ -164,29 +171,25 @@ def po_audit_trail(sender, instance, **kwargs):
         if not user:
             return
         updated_by = user  
-        old_instance = PurchaseOrder.objects.get(pk=instance.pk)
 
-        field_changes = track_field_changes(instance, old_instance,"PO",**kwargs)
+        field_changes = snapshot_changes(instance, "PO", update_fields)
 
         create_logs(field_changes, instance,"PO", updated_by)
 
 
-def poline_audit_trail(sender, instance, **kwargs):
-    from .models import PurchaseOrderLine
-
+def poline_audit_trail(sender, instance, update_fields=None, **kwargs):
     """
-    Pre-save signal for creating audit trail entries for the PO model.
+    Pre-save signal for creating audit trail entries for the PO line model.
     """
     if not instance._state.adding and instance.id:
         user = get_current_user()
         if not user:
             return
         updated_by = user
-        old_instance = PurchaseOrderLine.objects.get(pk=instance.pk)
 
-        field_changes = track_field_changes(instance, old_instance,"PO",**kwargs)
+        field_changes = snapshot_changes(instance, "PO-Line", update_fields)
 
-        create_logs(field_changes, instance,"PO", updated_by)
+        create_logs(field_changes, instance,"PO-Line", updated_by)
 
 
 def get_current_user():
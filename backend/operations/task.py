@@ -13,7 +13,9 @@ from openpyxl import load_workbook
 from django.core.files import File
 import os
 from .mixins import PurchaseOrderMixin
-from operations.services import ComprehensiveReportService 
+from .rollups import track_created
+from portal import search as search_index
+from operations.other_services.comprehensive_report import ComprehensiveReportEngine
 # import datetime
 
 def _is_valid_date(date_val, field_name):
@@ -28,8 +30,9 @@ def _is_valid_date(date_val, field_name):
 
     return True , ""
 
-def _handle_unexpected_errors(temp_obj,wb,e):
+def _handle_unexpected_errors(temp_obj,e):
     print("unexpected error",str(e))
+    wb = load_workbook(temp_obj.uploaded_file, data_only=True)
     po_header_sheet = wb["PO Header"]
     poh_headers = [str(cell.value).strip().lower().replace(" ", "_") for cell in next(po_header_sheet.iter_rows(min_row=1, max_row=1))]
     
@@ -72,25 +75,89 @@ def parse_date_field(val):
         return None
     return None
 
+## Values per IN (...), under the MSSQL limit of 2100 parameters
+LOOKUP_CHUNK_SIZE = 1000
+
+def _filter_in(queryset, field, values):
+    """Rows of `queryset` whose `field` is one of `values`, LOOKUP_CHUNK_SIZE values per query."""
+    values = sorted(values)
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        yield from queryset.filter(**{f"{field}__in": values[start:start + LOOKUP_CHUNK_SIZE]})
+
+def _sheet_headers(sheet):
+    return [str(value).strip().lower().replace(" ", "_") for value in next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))]
+
+def _sheet_rows(sheet, width):
+    """(row number, values) of the data rows up to the first blank one, padded to `width`."""
+    for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        values = list(row[:width]) + [None] * (width - len(row))  # exclude Error column
+        if not any(values):
+            break
+        yield i, values
+
+def _save_error_file(temp_obj, errors):
+    """
+    Writes the upload back with an ERROR column holding `errors`
+    ({sheet name: {row number: message}}) and the failed rows in red.
+    Validation reads the file read-only, the editable workbook is only
+    loaded here.
+    """
+    wb = load_workbook(temp_obj.uploaded_file, data_only=True)
+    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+    for sheet_name, rows in errors.items():
+        sheet = wb[sheet_name]
+        headers = _sheet_headers(sheet)
+        error_col_index = len(headers) + 1
+        error_cell = sheet.cell(row=1, column=error_col_index, value="ERROR")
+        error_cell.font = Font(bold=True)
+        for i, error_msg in rows.items():
+            sheet.cell(row=i, column=error_col_index, value=error_msg)
+            for col_index in range(1, len(headers) + 1):
+                cell = sheet.cell(row=i, column=col_index)
+                cell.fill = red_fill
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_name = f"Purchase_Order_Errors_{timestamp}.xlsx"
+    error_dir = os.path.join("media", "po", "upload", "errors")
+    if not os.path.exists(error_dir):
+        os.makedirs(error_dir, exist_ok=True)
+    filename = os.path.join(error_dir, file_name)
+    wb.save(filename)
+
+    with open(filename, "rb") as f:
+        temp_obj.error_file.save(file_name, File(f), save=False)
+
+def _header_codes(sheet, columns):
+    """Distinct values of `columns` in the PO Header sheet, as the text the lookups use."""
+    headers = _sheet_headers(sheet)
+    indexes = {column: headers.index(column) for column in columns if column in headers}
+    codes = {column: set() for column in columns}
+
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        if not any(row):
+            break
+        for column, index in indexes.items():
+            if index < len(row) and row[index] is not None:
+                codes[column].add(str(row[index]))
+    return codes
+
 def file_has_error(wb, suppliers, storerkeys, existing_po, existing_po_lines):
+    """
+    Validates the PO Header and PO Lines sheets, returns (errors,
+    po_header_data, po_lines_data) with errors as {sheet name: {row number: message}}.
+    """
     po_header_sheet = wb["PO Header"]
-    poh_headers = [str(cell.value).strip().lower().replace(" ", "_") for cell in next(po_header_sheet.iter_rows(min_row=1, max_row=1))]
+    poh_headers = _sheet_headers(po_header_sheet)
     
     po_lines_sheet = wb["PO Lines"]
-    pol_headers = [str(cell.value).strip().lower().replace(" ", "_") for cell in next(po_lines_sheet.iter_rows(min_row=1, max_row=1))]
+    pol_headers = _sheet_headers(po_lines_sheet)
         
-    is_error = False
+    errors = {"PO Header": {}, "PO Lines": {}}
     po_header_data = []
     po_lines_data = []
-    error_col_index = len(poh_headers) + 1
-    error_cell = po_header_sheet.cell(row=1, column=error_col_index, value="ERROR")
-    error_cell.font = Font(bold=True)
     
     excel_poh_crn = []    
-    for i, row in enumerate(po_header_sheet.iter_rows(min_row=2), start=2):
-        values = [cell.value for cell in row[:len(poh_headers)]]  # exclude Error column
-        if not any(values):
-            break
+    for i, values in _sheet_rows(po_header_sheet, len(poh_headers)):
 
         poh_crn = str(values[1])
         supplier = str(values[2])
@@ -147,25 +214,13 @@ def file_has_error(wb, suppliers, storerkeys, existing_po, existing_po_lines):
         #     error_msg = error_msg + "Missing value(s) in row, all columns are required."
             
         if error_msg:
-            po_header_sheet.cell(row=i, column=error_col_index, value=error_msg)
-            red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            for col_index in range(1, len(poh_headers) + 1):
-                cell = po_header_sheet.cell(row=i, column=col_index)
-                cell.fill = red_fill
-            is_error = True
+            errors["PO Header"][i] = error_msg
             
         else:
             po_header_data.append(dict(zip(poh_headers, values)))
             
             
-    error_col_index = len(pol_headers) + 1
-    error_cell = po_lines_sheet.cell(row=1, column=error_col_index, value="ERROR")
-    error_cell.font = Font(bold=True)
-        
-    for i, row in enumerate(po_lines_sheet.iter_rows(min_row=2), start=2):
-        values = [cell.value for cell in row[:len(pol_headers)]]  # exclude Error column
-        if not any(values):
-            break 
+    for i, values in _sheet_rows(po_lines_sheet, len(pol_headers)):
         
         error_msg = ""
         
@@ -201,16 +256,11 @@ def file_has_error(wb, suppliers, storerkeys, existing_po, existing_po_lines):
         #     error_msg = error_msg + "Missing value(s) in row, all columns are required."
         
         if error_msg:
-            po_lines_sheet.cell(row=i, column=error_col_index, value=error_msg)
-            red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            for col_index in range(1, len(pol_headers) + 1):
-                cell = po_lines_sheet.cell(row=i, column=col_index)
-                cell.fill = red_fill
-            is_error = True
+            errors["PO Lines"][i] = error_msg
             
         else:
             po_lines_data.append(dict(zip(pol_headers, values)))
-    return is_error, po_header_data, po_lines_data
+    return {sheet: rows for sheet, rows in errors.items() if rows}, po_header_data, po_lines_data
 
 def process_purchase_orders_v2(temp_order_id):
     temp_obj = PurchaseOrderUpload.objects.filter(id=temp_order_id).first()
@@ -231,25 +281,25 @@ def process_purchase_orders(temp_order_id):
     file = temp_obj.uploaded_file
     try:
 
-        wb = load_workbook(file, data_only=True)
-        suppliers = {supplier.supplier_code: supplier for supplier in Supplier.objects.filter()}
-        client = {client.client_code: client for client in Client.objects.filter()}
-        storerkeys = {storerkey.storerkey_code: storerkey for storerkey in StorerKey.objects.filter().select_related("client")}
-        existing_po = {po.customer_reference_number: po for po in PurchaseOrder.objects.filter()}
-        existing_po_lines = {(po_line.purchase_order.customer_reference_number, po_line.customer_reference_number): po_line for po_line in PurchaseOrderLine.objects.filter().select_related("purchase_order")}
-        is_error, po_header_data, po_lines_data = file_has_error(wb, suppliers, storerkeys, existing_po, existing_po_lines)
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            codes = _header_codes(wb["PO Header"], ["customer_reference_number", "supplier_code", "storer_key", "buyer_code"])
+
+            ## Only the rows the file refers to
+            suppliers = {supplier.supplier_code: supplier for supplier in _filter_in(Supplier.objects.all(), "supplier_code", codes["supplier_code"])}
+            client = {client.client_code: client for client in _filter_in(Client.objects.all(), "client_code", codes["buyer_code"])}
+            storerkeys = {storerkey.storerkey_code: storerkey for storerkey in _filter_in(StorerKey.objects.select_related("client"), "storerkey_code", codes["storer_key"])}
+            existing_po = {po.customer_reference_number: po for po in _filter_in(PurchaseOrder.all_objects.all(), "customer_reference_number", codes["customer_reference_number"])}
+            existing_po_lines = {
+                (po_line.purchase_order.customer_reference_number, po_line.customer_reference_number): po_line
+                for po_line in _filter_in(PurchaseOrderLine.objects.select_related("purchase_order"), "purchase_order__customer_reference_number", codes["customer_reference_number"])
+            }
+            errors, po_header_data, po_lines_data = file_has_error(wb, suppliers, storerkeys, existing_po, existing_po_lines)
+        finally:
+            wb.close()
         
-        if is_error: 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_name = f"Purchase_Order_Errors_{timestamp}.xlsx"  
-            error_dir = os.path.join("media", "po", "upload", "errors")
-            if not os.path.exists(error_dir):
-                os.makedirs(error_dir, exist_ok=True)
-            filename = os.path.join(error_dir, file_name)
-            wb.save(filename)
-            
-            with open(filename, "rb") as f:
-                temp_obj.error_file.save(file_name, File(f), save=False)
+        if errors: 
+            _save_error_file(temp_obj, errors)
 
             temp_obj.status = POUploadStatusChoices.ERROR
             temp_obj.save()
@@ -286,13 +336,15 @@ def process_purchase_orders(temp_order_id):
             }
             po_to_create.append(PurchaseOrder(**data))
     except Exception as e:
-        _handle_unexpected_errors(temp_obj,wb,e)
+        _handle_unexpected_errors(temp_obj,e)
 
     with transaction.atomic():
         try:
             print(len(po_to_create))
             
             po_header_objects = PurchaseOrder.objects.bulk_create(po_to_create)
+            track_created("PO", po_header_objects)
+            search_index.reindex(PurchaseOrder, [po.id for po in po_header_objects])
             purchase_order_mapping = {
                 i.customer_reference_number: i.id
                 for i in po_header_objects
@@ -352,15 +404,21 @@ def process_purchase_orders(temp_order_id):
             }
         except IntegrityError as e:
             transaction.set_rollback(True)
-            _handle_unexpected_errors(temp_obj,wb,e)
+            _handle_unexpected_errors(temp_obj,e)
             return str(e)
             # Handle error (e.g., log it)
         except Exception as e:
             transaction.set_rollback(True)
-            _handle_unexpected_errors(temp_obj,wb,e)
+            _handle_unexpected_errors(temp_obj,e)
             return str(e)
         # Handle error (e.g., log it)
 
+@shared_task
+def run_background_job(name, pk=None):
+    """Celery entry point of the background job runner, used when a broker is configured."""
+    from operations.other_services.job_runner import execute
+    return execute(name, pk)
+
 # @shared_task
 # def delete_old_staging_data():
 #     cutoff_time = timezone.now() - timedelta(minutes=15)
@@ -371,19 +429,8 @@ def process_purchase_orders(temp_order_id):
 
 
 # @shared_task(bind=True)
-def generate_comperhensive_report(consignments_qs):
-    
-    data, errors = ComprehensiveReportService.json_data(consignments_qs)
-    
-    if errors:
-        return errors
-    
-    if not data:
-        return "Not data found for the given date range and status. Please try again."
-    
-    
-    file_path, errors = ComprehensiveReportService.build_report(data)
-    if errors:
-        return errors
-    
-    return f"File generation successfull : {file_path} "
\ No newline at end of file
+def generate_comperhensive_report(consignments_qs, file_format="xlsx"):
+    """
+    Returns: (file_url, error)
+    """
+    return ComprehensiveReportEngine(consignments_qs, file_format=file_format).generate()
@@ -1,3 +1,186 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from entities.models import Client, Hub, StorerKey, Supplier, SupplierUser
+from portal.choices import AuditTrailKindChoices, ConsignmentStatusChoices
+from portal.models import PackagingType
+from portal.pagination import encode_cursor
+from portal import search as search_index
+
+from .consignment_apis import ConsignmentListAPI
+from .models import (
+    ArchivedAuditTrail,
+    Consignment,
+    ConsignmentAuditTrail,
+    ConsignmentAuditTrailField,
+    ConsignmentPackaging,
+    ConsignmentPOLine,
+    PackagingAllocation,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    QuantityLedgerEntry,
+)
+from .other_services import audit_archive, quantity_ledger
+from .v2_apis.consignment_apis import ConsignmentPackagesAPI
+
+
+class ConsignmentTestCase(TestCase):
+    """A supplier user with a PO of two lines, consignments each packing one of both in every package."""
+
+    consignments = 3
+    packages = 2
+
+    def setUp(self):
+        self.user = User.objects.create(username="supplier", name="Supplier User", role="Supplier User")
+        client = Client.objects.create(client_code="C1", name="Client")
+        hub = Hub.objects.create(hub_code="H1", name="Hub")
+        storerkey = StorerKey.objects.create(
+            storerkey_code="SK1", aramex_wms_storerkey="W", name="SK", client=client, hub=hub,
+            timezone="UTC", service_type="3PL",
+        )
+        supplier = Supplier.objects.create(supplier_code="S1", name="Supplier", address="x", client=client)
+        supplier.storerkeys.add(storerkey)
+        SupplierUser.objects.create(user=self.user, supplier=supplier).storerkeys.add(storerkey)
+        packaging_type = PackagingType.objects.create(
+            package_name="Box", package_type="Box", measurement_method="Metric System", supplier=supplier,
+            length=10, width=20, height=30, dimension_unit="Centimeter",
+        )
+
+        self.po = PurchaseOrder.objects.create(
+            customer_reference_number="PO1", open_quantity=200, supplier=supplier, client=client, storerkey=storerkey,
+        )
+        self.lines = [
+            PurchaseOrderLine.objects.create(
+                purchase_order=self.po, customer_reference_number=f"L{i}", quantity=100, open_quantity=100, product_code=f"P{i}",
+            )
+            for i in range(2)
+        ]
+
+        self.cons = []
+        for i in range(self.consignments):
+            consignment = Consignment.objects.create(
+                consignment_id=f"PKU{i:05d}", supplier=supplier, client=client, storerkey=storerkey, pickup_timezone="UTC",
+                created_by=self.user,
+            )
+            self.cons.append(consignment)
+            for line in self.lines:
+                ConsignmentPOLine.objects.create(consignment=consignment, purchase_order_line=line, allocated_qty=self.packages)
+            for k in range(self.packages):
+                package = ConsignmentPackaging.objects.create(
+                    package_id=f"AR3{i:04d}{k:03d}", consignment=consignment, packaging_type=packaging_type,
+                    weight=5, weight_unit="Kilogram",
+                )
+                for line in self.lines:
+                    PackagingAllocation.objects.create(consignment_packaging=package, purchase_order_line=line, allocated_qty=1)
+
+
+class ConsignmentCursorTests(ConsignmentTestCase):
+    def list(self, **params):
+        request = RequestFactory().get("/", params)
+        request.this_user = self.user
+        view = ConsignmentListAPI()
+        view.request = request
+        return view.get_all_data(request)
+
+    def test_walks_every_page(self):
+        response = self.list(limit=2, cursor="")
+        seen = [row["consignment_id"] for row in response.data["data"]]
+        while response.data.get("next_cursor"):
+            response = self.list(limit=2, cursor=response.data["next_cursor"])
+            seen += [row["consignment_id"] for row in response.data["data"]]
+        self.assertEqual(seen, ["PKU00002", "PKU00001", "PKU00000"])
+
+    def test_invalid_cursors_are_bad_requests(self):
+        for cursor in ["%%%", encode_cursor(["PKU00001"]), encode_cursor(["PKU00001", "not-a-uuid"])]:
+            with self.subTest(cursor=cursor):
+                response = self.list(limit=2, cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["errors"], ["Invalid cursor"])
+
+
+@override_settings(SEARCH_BACKEND="like")
+class GlobalSearchTests(ConsignmentTestCase):
+    consignments = 2
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+
+    def test_ranks_title_matches_first(self):
+        Consignment.objects.filter(pk=self.cons[1].pk).update(additional_instructions="see PKU00000")
+        search_index.index(Consignment, [self.cons[1].pk])
+
+        found = list(search_index.ranked(Consignment.objects.order_by("-created_at"), " pku00000 ").values_list("consignment_id", flat=True))
+        self.assertEqual(found, ["PKU00000", "PKU00001"])
+
+    def test_matches_related_fields(self):
+        self.assertEqual(Consignment.objects.filter(search_index.search_filter(Consignment, "supplier")).count(), 2)
+        self.assertEqual(PurchaseOrder.objects.filter(search_index.search_filter(PurchaseOrder, "po1")).count(), 1)
+
+
+class QuantityLedgerTests(ConsignmentTestCase):
+    def setUp(self):
+        super().setUp()
+        quantity_ledger.post([consignment.pk for consignment in self.cons])
+
+    def assertProcessed(self, quantity):
+        for line in self.lines:
+            line.refresh_from_db()
+            self.assertEqual((line.processed_quantity, line.open_quantity), (quantity, 100 - quantity))
+        self.po.refresh_from_db()
+        self.assertEqual(self.po.processed_quantity, 2 * quantity)
+        self.assertEqual(quantity_ledger.reconcile(dry_run=True), (0, 0))
+
+    def test_post(self):
+        self.assertProcessed(Decimal(6))
+        self.assertEqual(quantity_ledger.post([consignment.pk for consignment in self.cons]), [])
+
+    def test_package_delete_gives_quantities_back(self):
+        package = ConsignmentPackaging.objects.filter(consignment=self.cons[0]).first()
+        request = RequestFactory().delete("/")
+        request.this_user = self.user
+
+        response = ConsignmentPackagesAPI().delete(request, id=package.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertProcessed(Decimal(5))
+
+    def test_consignment_delete_reverses_its_entries(self):
+        self.cons[0].delete()
+        self.assertProcessed(Decimal(4))
+        self.assertTrue(QuantityLedgerEntry.objects.filter(consignment__isnull=True).exists())
+
+
+class AuditArchiveTests(ConsignmentTestCase):
+    consignments = 1
+
+    def trail(self, title, at):
+        trail = ConsignmentAuditTrail.objects.create(consignment=self.cons[0], updated_by=self.user)
+        ConsignmentAuditTrailField.objects.create(audit_trail=trail, title=title, field_name="consignment_status")
+        ConsignmentAuditTrail.objects.filter(pk=trail.pk).update(created_at=at, updated_at=at)
+        return trail
+
+    def test_reads_across_both_tables(self):
+        now = timezone.now()
+        consignment = self.cons[0]
+        ConsignmentAuditTrail.objects.filter(consignment=consignment).delete()
+        old = self.trail("Consignment Pending Bid", now - timedelta(days=30))
+        Consignment.objects.filter(pk=consignment.pk).update(
+            consignment_status=ConsignmentStatusChoices.DELIVERED, updated_at=now - timedelta(days=20),
+        )
+
+        archived = audit_archive.archive(retention_days=10, kinds=[AuditTrailKindChoices.CONSIGNMENT])
+        self.assertEqual(archived, {AuditTrailKindChoices.CONSIGNMENT: 1})
+        self.assertFalse(ConsignmentAuditTrail.all_objects.filter(pk=old.pk).exists())
+        self.assertTrue(ArchivedAuditTrail.objects.filter(pk=old.pk).exists())
+        self.assertTrue(audit_archive.has_archived(AuditTrailKindChoices.CONSIGNMENT, consignment.pk))
+
+        recent = self.trail("Consignment Delivered", now - timedelta(days=1))
+        trails = audit_archive.trails(AuditTrailKindChoices.CONSIGNMENT, consignment.pk)
+        self.assertEqual([trail["id"] for trail in trails], [recent.pk, old.pk])
+        self.assertEqual([trail["fields"][0]["title"] for trail in trails], ["Consignment Delivered", "Consignment Pending Bid"])
+        self.assertEqual(trails[1]["created_at"], now - timedelta(days=30))
+        self.assertEqual(audit_archive.pending(retention_days=10, kinds=[AuditTrailKindChoices.CONSIGNMENT]), {AuditTrailKindChoices.CONSIGNMENT: 0})
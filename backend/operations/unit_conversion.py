@@ -1,6 +1,10 @@
 # Unit conversion utilities for weight and volume
 from decimal import Decimal
 
+import numpy as np
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+
 # Weight conversion factors to convert to kilograms
 WEIGHT_TO_KG = {
     'Kilogram': Decimal('1.0'),
@@ -93,4 +97,104 @@ def calculate_volume(length, width, height, unit):
     height_m = convert_dimension(height, unit)
     
     # Calculate volume in cubic meters
-    return length_m * width_m * height_m
\ No newline at end of file
+    return length_m * width_m * height_m
+
+
+## -------- Columns --------
+# The functions below convert whole columns at once (lists, numpy arrays or
+# pandas Series of values with a matching column of units) and build the
+# same conversions as SQL expressions, for totals computed in the database.
+# Like the scalar functions every converted value is rounded to 2 places,
+# None counts as 0 and an unknown unit as the base unit.
+
+def _column(values):
+    values = np.array(values, dtype=object)
+    values[np.equal(values, None)] = 0
+    return values.astype(float)
+
+
+def _factors(units, table, to_unit):
+    """Per row factor from `units` to `to_unit`, looked up once per distinct unit."""
+    names, inverse = np.unique(np.array(units, dtype=object).astype(str), return_inverse=True)
+    target = float(table.get(to_unit, 1))
+    return np.array([float(table.get(name, 1)) / target for name in names])[inverse]
+
+
+def _hundredths(values, units, table, to_unit):
+    """Converted values rounded to 2 places, as integer hundredths so totals add up exactly."""
+    hundredths = _column(values) * _factors(units, table, to_unit) * 100
+    # Drop the float noise first so exact ties round half to even like the Decimal version
+    return np.rint(np.round(hundredths, 6)).astype(np.int64)
+
+
+def convert_weights(weights, units, to_unit='Kilogram'):
+    """Column version of convert_weight, returns a float array."""
+    return _hundredths(weights, units, WEIGHT_TO_KG, to_unit) / 100
+
+
+def convert_dimensions(dimensions, units, to_unit='Meter'):
+    """Column version of convert_dimension, returns a float array."""
+    return _hundredths(dimensions, units, DIMENSION_TO_METER, to_unit) / 100
+
+
+def calculate_volumes(lengths, widths, heights, units):
+    """Column version of calculate_volume, cubic meters as a float array."""
+    return convert_dimensions(lengths, units) * convert_dimensions(widths, units) * convert_dimensions(heights, units)
+
+
+def total_weight(weights, units, to_unit='Kilogram'):
+    """Sum of convert_weight over the columns, as a Decimal."""
+    hundredths = _hundredths(weights, units, WEIGHT_TO_KG, to_unit)
+    return Decimal(int(hundredths.sum(dtype=object))).scaleb(-2)
+
+
+def total_volume(lengths, widths, heights, units):
+    """Sum of calculate_volume over the columns, cubic meters as a Decimal."""
+    volumes = (
+        _hundredths(lengths, units, DIMENSION_TO_METER, 'Meter').astype(object)
+        * _hundredths(widths, units, DIMENSION_TO_METER, 'Meter')
+        * _hundredths(heights, units, DIMENSION_TO_METER, 'Meter')
+    )
+    return Decimal(int(volumes.sum())).scaleb(-6)
+
+
+## -------- SQL --------
+
+def _converted(value, unit, table, to_unit):
+    # ROUND in the database breaks exact ties away from zero, where the
+    # Decimal and column versions round them to even
+    target = table.get(to_unit, Decimal('1.0'))
+    factor = lambda base: Value((base / target).quantize(Decimal('1e-10')))
+    return Cast(
+        Coalesce(
+            Case(
+                *[When(**{unit: name}, then=Round(F(value) * factor(base), 2)) for name, base in table.items()],
+                default=Round(F(value) * factor(Decimal('1.0')), 2),
+            ),
+            Value(Decimal('0')),
+        ),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+def weight_expression(value='weight', unit='weight_unit', to_unit='Kilogram'):
+    """convert_weight as a query expression, e.g. .aggregate(weight=Sum(weight_expression()))."""
+    return _converted(value, unit, WEIGHT_TO_KG, to_unit)
+
+
+def dimension_expression(value, unit='dimension_unit', to_unit='Meter'):
+    return _converted(value, unit, DIMENSION_TO_METER, to_unit)
+
+
+def volume_expression(prefix=''):
+    """
+    calculate_volume as a query expression, cubic meters from the length, width,
+    height and dimension_unit found under `prefix` (e.g. "packaging_type__").
+    """
+    unit = f'{prefix}dimension_unit'
+    return ExpressionWrapper(
+        dimension_expression(f'{prefix}length', unit)
+        * dimension_expression(f'{prefix}width', unit)
+        * dimension_expression(f'{prefix}height', unit),
+        output_field=DecimalField(max_digits=30, decimal_places=6),
+    )
@@ -40,6 +40,21 @@ def get_allocated_quantity(consignment_id, line_id):
     ).aggregate(allocated_quantity=Sum('allocated_qty'))['allocated_quantity'] or 0
 
 
+def get_allocated_quantities(consignment_id, line_ids):
+    """
+    get_allocated_quantity for many lines in one grouped query,
+    returns {str(line_id): allocated quantity} for the lines that have allocations.
+    """
+    rows = (
+        PackagingAllocation.objects
+        .filter(consignment_packaging__consignment__id=consignment_id, purchase_order_line__id__in=line_ids)
+        .values("purchase_order_line_id")
+        .annotate(allocated_quantity=Sum('allocated_qty'))
+        .order_by()
+    )
+    return {str(row["purchase_order_line_id"]): row["allocated_quantity"] or 0 for row in rows}
+
+
 
 def generate_unique_id(prefix: str) -> str:
     # Timestamp in YYMMDDHHMMSS format → always 12 digits
@@ -17,6 +17,7 @@ from operations.models import (
     ComprehensiveReport
 )
 from operations.services import POLineService, ConsignmentWorkflowServices, ComprehensiveReportService
+from operations.other_services import quantity_ledger
 from rest_framework.parsers import MultiPartParser, FormParser
 from operations.serializers import ConsignmentComplianceSerializer, ConsignmentPackagingSerializer, ConsignmentSerializer, ComprehensiveReportSerializer
 from portal.choices import ConsignmentStatusChoices, ConsignmentDocumentTypeChoices
@@ -380,11 +381,16 @@ class ConsignmentPackagesAPI(APIView):
 
 
 
+    @transaction.atomic
     def delete(self, request, id=None, *args, **kwargs):
         if id is None:
             return StandardResponse(success=False, errors=["ID required"], status=400)
         
-        ConsignmentPackaging.objects.filter(id=id).delete()
+        packages = ConsignmentPackaging.objects.filter(id=id)
+        consignment_ids = list(packages.values_list("consignment_id", flat=True))
+        packages.delete()
+        # The package's allocations go with it, give their quantities back to the lines
+        quantity_ledger.post(consignment_ids)
 
         return StandardResponse({"message": "Package deleted successfully"}, status=200)
 
@@ -423,7 +429,7 @@ class PoLineAllocationAPI(APIView):
                 message, errors = ConsignmentStepHandler.pack_po_line(consignment, po_line, packages)
             else:
                 message, errors = ConsignmentStepHandler.pack_po_line(consignment, po_line, packages)
-                POLineService.update_line_quantities([po_line])
+                quantity_ledger.post([consignment.id])
 
             if errors:
                 transaction.set_rollback(True)
@@ -517,7 +523,10 @@ class PoLineAllocationAPI(APIView):
         if id is None:
             return StandardResponse(success=False, errors=["ID required"], status=400)
         
-        PackagingAllocation.objects.filter(id=id).delete()
+        allocations = PackagingAllocation.objects.filter(id=id)
+        consignment_ids = list(allocations.values_list("consignment_packaging__consignment_id", flat=True))
+        allocations.delete()
+        quantity_ledger.post(consignment_ids)
 
         return StandardResponse(success=False, errors=["Allocation deleted successfully"], status=200)
 
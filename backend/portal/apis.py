@@ -2,11 +2,16 @@ from rest_framework.views import APIView
 from django.core.exceptions import ValidationError
 from django.db.models import ProtectedError
 from core.response import StandardResponse
+from core.notification_state import invalidate_unread, unread_count
 from .models import AddressBook, PackagingType, MOT, FreightForwarder, GLAccount, CostCenterCode, RejectionCode, Notification, UserNotification
 from .serializers import PostAddressBookSerializer, GetFreightForwarderSerializer, FreightForwarderSerializer, MOTSerializer, AddressBookSerializer, PackagingTypeSerializer, GetAddressBookSerializer, GetPackagingTypeSerializer, GLAccountSerializer , CostCenterCodeSerializer, RejectionCodeSerializer
 from .utils import get_all_fields          
 from .mixins import SearchAndFilterMixin, PaginationMixin
-from .choices import Role
+from .pagination import InvalidCursor
+from .choices import Role, OperationUserRole
+from .bulk_import import BulkImporter
+from .import_specs import ADDRESS_BOOK
+from core.decorators import role_required
 from django.db.models import Q, F, Value, CharField
 from operations.services import ConsignmentWorkflowServices
 from operations.models import Consignment 
@@ -223,6 +228,20 @@ class AddressBookView(SearchAndFilterMixin, PaginationMixin, APIView):
         
             
 
+class AddressBookBulkImportAPI(APIView):
+    @role_required(OperationUserRole.L1)
+    def post(self, request, *args, **kwargs):
+        data = request.data.get("data", [])
+        if not isinstance(data, list) or not data:
+            return StandardResponse(status=400, success=False, errors=["Invalid or empty data payload"])
+
+        report = BulkImporter(ADDRESS_BOOK).run(data)
+        if report.errors:
+            return StandardResponse(status=400, success=False, errors=report.messages(), data=report.as_dict())
+
+        return StandardResponse(status=201, message="Addresses imported successfully", data=report.as_dict())
+
+
 class PackagingTypeView(SearchAndFilterMixin, PaginationMixin, APIView):
     def get(self, request, id=None, *args, **kwargs):
         if id != "list":
@@ -580,7 +599,8 @@ class NotificationAPIView(PaginationMixin,APIView):
     def get(self, request, id=None):
         """
         Fetch user notifications with filters for 'all', 'read', 'unread', or 'count'.
-        Supports pagination and keyword search.
+        Supports pagination (pg/limit, or ?cursor= for keyset pages) and keyword search.
+        Reading never writes, the bell follows the unread count.
         """
 
         user = request.this_user
@@ -588,47 +608,63 @@ class NotificationAPIView(PaginationMixin,APIView):
         limit = int(request.GET.get("limit", 25))
         q = (request.GET.get("q") or "").strip()
 
+        if id == "count":
+            return StandardResponse(success=True, data=[], count=unread_count(user.id), status=200)
+
         values = [
             "id",
-            "header",
-            "type",
-            "message",
             "created_at",
-            "hyperlink_value",
-            "user_notifications__is_read",
-            "attachment"
+            "is_read",
+            "notification_id",
+            "notification__header",
+            "notification__type",
+            "notification__message",
+            "notification__created_at",
+            "notification__hyperlink_value",
+            "notification__attachment",
         ]
 
-        base_qs = Notification.objects.all()
-        filters = Q(user_notifications__user=user)
+        # The user's own rows, one per notification, no distinct needed
+        queryset = UserNotification.objects.filter(user=user)
 
         if q:
-            filters &= Q(hyperlink_value__icontains=q) | Q(header__icontains=q) | Q(message__icontains=q)
-
-        user.has_notif = False
-        user.save()
-
-        if id == "count":
-            unread_count = UserNotification.objects.filter(user=user, is_read=False).count()
-            return StandardResponse(success=True, data=[], count=unread_count, status=200)
+            queryset = queryset.filter(
+                Q(notification__hyperlink_value__icontains=q) | Q(notification__header__icontains=q) | Q(notification__message__icontains=q)
+            )
 
         if id == "read":
-            filters &= Q(user_notifications__is_read=True)
+            queryset = queryset.filter(is_read=True)
         elif id == "unread":
-            filters &= Q(user_notifications__is_read=False)
-
-        notif_qs = base_qs.filter(filters).distinct().order_by("-created_at")
+            queryset = queryset.filter(is_read=False)
 
-        notifications_qs = notif_qs.values(*values)
+        queryset = queryset.values(*values).order_by("-created_at", "-id")
 
-        total_count = notifications_qs.count()
+        total_count = queryset.count()
 
-        paginated_result = self.paginate_results(notifications_qs, pg, limit)
-
-        for item in paginated_result:
-            item["is_read"] = item.pop("user_notifications__is_read", False)
+        next_cursor = None
+        if "cursor" in request.GET:
+            try:
+                paginated_result, next_cursor = self.paginate_keyset(queryset, request, ["-created_at", "-id"], limit)
+            except InvalidCursor as e:
+                return StandardResponse(status=400, success=False, errors=[str(e)])
+        else:
+            paginated_result = self.paginate_results(queryset, pg, limit)
+
+        data = [
+            {
+                "id": item["notification_id"],
+                "header": item["notification__header"],
+                "type": item["notification__type"],
+                "message": item["notification__message"],
+                "created_at": item["notification__created_at"],
+                "hyperlink_value": item["notification__hyperlink_value"],
+                "is_read": item["is_read"],
+                "attachment": item["notification__attachment"],
+            }
+            for item in paginated_result
+        ]
 
-        return StandardResponse(success=True, data=paginated_result, count=total_count, status=200)
+        return StandardResponse(success=True, data=data, count=total_count, next_cursor=next_cursor, status=200)
 
 
     @transaction.atomic
@@ -653,10 +689,7 @@ class NotificationAPIView(PaginationMixin,APIView):
             else:
                 qs.filter(notification_id=id).update(is_read=True)
 
-            # If no unread notifications remain, set has_notif = False
-            if not qs.exists():
-                user.has_notif = False
-                user.save(update_fields=["has_notif"])
+            invalidate_unread([user.id])
 
             return StandardResponse(
                 status=200,
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PortalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portal'
+
+    def ready(self):
+        from .lov_cache import connect_invalidation
+        from .lovs import lov_cache_policies
+
+        # LOV entries are cached until one of the models they read changes
+        connect_invalidation(lov_cache_policies())
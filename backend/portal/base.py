@@ -7,7 +7,10 @@ from .constants import POST, PUT, DELETE, GET, GETALL
 from django.db.models import Q
 from rest_framework import serializers
 from django.db.models import ProtectedError
+from django.utils import timezone
 from core.response import StandardResponse
+from .pagination import InvalidCursor, cached_count, keyset_page
+from .soft_delete import LiveManager, SoftDeleteQuerySet
 from rest_framework import serializers
 
 
@@ -21,6 +24,12 @@ class BaseModel(models.Model):
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(blank=True, null=True)
 
+    ## The default manager only sees live rows, related managers included.
+    ## Foreign key access goes through the plain base manager and still
+    ## reaches soft deleted rows, all_objects is the escape hatch for queries.
+    objects = LiveManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
     class Meta:
         abstract = True
         # ordering = ("id",)
@@ -149,7 +158,7 @@ class BaseAPIView(APIView):
                 queryset.distinct(*self.distinct_fields)
             for param in self.request.query_params:
                 if not (
-                    param in ["pageIndex", "pageSize", "q"] or param in self.search_ignore_fields
+                    param in ["pageIndex", "pageSize", "q", "cursor"] or param in self.search_ignore_fields
                 ):
                     param_value = self.request.query_params[param]
                     if self.request.query_params[param] == "true":
@@ -157,12 +166,22 @@ class BaseAPIView(APIView):
                     if self.request.query_params[param] == "false":
                         param_value = False
                     queryset = queryset.filter(**{param: param_value})
-            count = queryset.count()
-            objs = queryset[int(pg) * int(limit): (int(pg) + 1) * int(limit)]
+            count = cached_count(queryset, scope=getattr(getattr(request, "this_user", None), "pk", ""))
+            next_cursor = None
+            if "cursor" in request.GET:
+                order = self.get_order()
+                ordering = [order] if order.lstrip("-") == "id" else [order, "-id" if order.startswith("-") else "id"]
+                try:
+                    objs, next_cursor = keyset_page(queryset, ordering, int(limit), request.GET.get("cursor"))
+                except InvalidCursor as e:
+                    return StandardResponse(success=False, errors=[str(e)], status=400)
+            else:
+                objs = queryset[int(pg) * int(limit): (int(pg) + 1) * int(limit)]
             return StandardResponse(
                 success=True,
                 data=self.serializer(objs, many=True).data,
                 count=count,
+                next_cursor=next_cursor,
                 status=200
             )
         else:
@@ -236,6 +255,7 @@ class BaseAPIView(APIView):
             obj = self.model.objects.get(**filter)
             if self.archive_in_delete:
                 obj.is_deleted = True
+                obj.deleted_at = timezone.now()
                 obj.save()
             else:
                 obj.delete()
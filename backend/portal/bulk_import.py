@@ -0,0 +1,387 @@
+import math
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import BooleanField, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from portal.lov_cache import bump_model_version
+
+
+## Values per IN (...) / rows per write, under the MSSQL limit of 2100 parameters
+CHUNK_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+
+TRUE_VALUES = {"true", "yes", "1"}
+FALSE_VALUES = {"false", "no", "0"}
+
+
+class OnConflict:
+    """What happens to a row whose natural key already exists."""
+    UPDATE = "update"   ## upsert
+    SKIP = "skip"
+    ERROR = "error"
+
+
+def key_filters(fields, keys):
+    """
+    Filters covering the composite `keys`, CHUNK_SIZE values of the first
+    field at a time with IN lists of the others' distinct values. They
+    match a superset of the keys, callers keep the rows whose key they asked for.
+    """
+    rest = {field: sorted({key[index] for key in keys}, key=str) for index, field in enumerate(fields[1:], start=1)}
+    first = sorted({key[0] for key in keys}, key=str)
+    for start in range(0, len(first), CHUNK_SIZE):
+        yield Q(**{f"{fields[0]}__in": first[start:start + CHUNK_SIZE]}, **{f"{field}__in": values for field, values in rest.items()})
+
+
+class RelatedKey:
+    """
+    A foreign key given in the file by the related row's natural key, e.g.
+    RelatedKey(StorerKey, "storerkey_code"). Several lookup fields are
+    given as one "a|b" value.
+    """
+
+    def __init__(self, model, lookup="name", required=True):
+        self.model = model
+        self.lookup = [part.strip() for part in lookup.split("|")]
+        self.required = required
+
+    def key(self, value):
+        parts = [part.strip() for part in str(value).split("|")]
+        if len(parts) != len(self.lookup) or not all(parts):
+            return None
+        return tuple(parts)
+
+    def resolve(self, keys):
+        """{key: instance} for the distinct keys, one query per CHUNK_SIZE of them."""
+        keys = list(keys)
+        found = {}
+        if len(self.lookup) == 1 and self.model._meta.get_field(self.lookup[0]).unique:
+            for start in range(0, len(keys), CHUNK_SIZE):
+                chunk = [key[0] for key in keys[start:start + CHUNK_SIZE]]
+                found.update({(value,): obj for value, obj in self.model.objects.in_bulk(chunk, field_name=self.lookup[0]).items()})
+            return found
+
+        wanted = set(keys)
+        for query in key_filters(self.lookup, keys):
+            for obj in self.model.objects.filter(query).order_by("pk"):
+                key = tuple(str(getattr(obj, field)) for field in self.lookup)
+                if key in wanted:
+                    # The first match wins, as with .filter().first()
+                    found.setdefault(key, obj)
+        return found
+
+
+def model_fields(model, exclude=()):
+    """Names of the model's own editable fields, without the BaseModel bookkeeping ones."""
+    bookkeeping = {"id", "created_at", "updated_at", "is_active", "is_deleted", "deleted_at"}
+    return [
+        field.name for field in model._meta.concrete_fields
+        if field.editable and field.name not in bookkeeping and field.name not in exclude
+    ]
+
+
+class ImportSpec:
+    """
+    How rows of a master-data file map onto `model`:
+    - fields: the model fields read from each row (related ones included)
+    - related: {field: RelatedKey} for foreign keys given by natural key
+    - natural_key: fields identifying an existing row, None to always insert
+    - on_conflict: OnConflict policy for rows whose natural key exists
+    - update_fields: fields written on update, defaults to all non-key fields,
+      of which a row only updates those it gives
+    - validate_row: optional callable(values) returning an error message
+    """
+
+    def __init__(self, model, fields, related=None, natural_key=None, on_conflict=OnConflict.ERROR,
+                 update_fields=None, validate_row=None, defaults=None):
+        self.model = model
+        self.fields = list(fields)
+        self.related = related or {}
+        self.natural_key = list(natural_key) if natural_key else None
+        self.on_conflict = on_conflict
+        self.update_fields = update_fields or [field for field in self.fields if field not in (self.natural_key or [])]
+        self.validate_row = validate_row
+        self.defaults = defaults or {}
+
+
+class ImportReport:
+    """Outcome of an import, errors as {"row", "field", "error"} with 1-based row numbers."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, row, message, field=None):
+        self.errors.append({"row": row, "field": field, "error": message})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "errors": self.sorted_errors(),
+        }
+
+    def sorted_errors(self):
+        return sorted(self.errors, key=lambda error: error["row"])
+
+    def messages(self):
+        return [
+            f"Row {error['row']}: " + (f"{error['field']}: " if error["field"] else "") + error["error"]
+            for error in self.sorted_errors()
+        ]
+
+
+def _blank(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return True
+    try:
+        return math.isnan(value)
+    except TypeError:
+        return False
+
+
+def _clean(field, value):
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    elif hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # numpy scalars from a pandas frame
+        value = value.item()
+    if isinstance(value, str):
+        value = value.strip()
+    if isinstance(field, BooleanField) and isinstance(value, str):
+        lowered = value.lower()
+        if lowered in TRUE_VALUES:
+            value = True
+        elif lowered in FALSE_VALUES:
+            value = False
+    if isinstance(value, float) and value.is_integer() and field.get_internal_type() in ("CharField", "TextField"):
+        # Spreadsheets hand codes like 1001 over as 1001.0
+        value = str(int(value))
+    return field.clean(value, None)
+
+
+class BulkImporter:
+    """
+    Validates, resolves and upserts rows (dicts keyed by field name) for an
+    ImportSpec with a fixed number of queries per CHUNK_SIZE rows:
+    related keys are resolved once per distinct value, existing rows are
+    matched by natural key in bulk, and rows are written with bulk_create /
+    bulk_create(update_conflicts) / batched bulk_update. Nothing is written
+    when any row has an error.
+    """
+
+    def __init__(self, spec, trigger_post_save=False):
+        self.spec = spec
+        self.model = spec.model
+        self.trigger_post_save = trigger_post_save
+
+    def run(self, rows):
+        report = ImportReport()
+        values, given = self._convert(rows, report)
+        self._resolve_related(values, given, report)
+        if self.spec.validate_row:
+            failed = {error["row"] for error in report.errors}
+            for number, row in values.items():
+                if number in failed:
+                    continue
+                message = self.spec.validate_row(row)
+                if message:
+                    report.error(number, message)
+        keys = self._natural_keys(values, report)
+        if report.errors:
+            return report
+
+        to_create, to_update = self._match_existing(values, given, keys, report)
+        if report.errors:
+            return report
+
+        with transaction.atomic():
+            self._write(to_create, to_update, report)
+        bump_model_version(sender=self.model)
+        return report
+
+    ## -------- Steps --------
+
+    def _convert(self, rows, report):
+        """
+        {row number: {field: value}} with every non-related value cleaned by
+        its model field, and {row number: fields the row gave}. A required
+        field left out of a row is only an error once the row turns out to
+        be new (see _missing()).
+        """
+        values, given = {}, {}
+        for number, row in enumerate(rows, start=1):
+            converted, ok = dict(self.spec.defaults), True
+            # The natural key identifies the row, it can't be left out
+            given[number] = {name for name in self.spec.fields if name in row} | set(self.spec.natural_key or [])
+            for name in self.spec.fields:
+                value = row.get(name)
+                if _blank(value):
+                    value = None
+                if name in self.spec.related:
+                    converted[name] = value
+                    continue
+                field = self.model._meta.get_field(name)
+                if value is None and field.null:
+                    converted[name] = None
+                    continue
+                if value is None:
+                    if field.has_default():
+                        converted[name] = field.get_default()
+                        continue
+                    if name not in given[number]:
+                        continue
+                    if not field.blank:
+                        report.error(number, "This field is required.", name)
+                        ok = False
+                        continue
+                    value = ""
+                try:
+                    converted[name] = _clean(field, value)
+                except ValidationError as e:
+                    report.error(number, " ".join(e.messages), name)
+                    ok = False
+            if ok:
+                values[number] = converted
+        return values, given
+
+    def _resolve_related(self, values, given, report):
+        for name, related in self.spec.related.items():
+            keys = {}   ## row number -> lookup key, None when the value can't be a key
+            for number, row in values.items():
+                if row[name] is None:
+                    continue
+                keys[number] = related.key(row[name])
+                if keys[number] is None:
+                    report.error(number, f"Invalid value '{row[name]}'.", name)
+
+            found = related.resolve({key for key in keys.values() if key is not None})
+            for number, row in values.items():
+                key = keys.get(number)
+                row[name] = found.get(key) if key is not None else None
+                if row[name] is not None or not related.required or (number in keys and key is None):
+                    continue
+                if name not in given[number]:
+                    continue
+                if key is None:
+                    report.error(number, "This field is required.", name)
+                else:
+                    report.error(number, f"No {related.model._meta.verbose_name} found for '{'|'.join(key)}'.", name)
+
+    def _natural_key(self, row):
+        return tuple(
+            getattr(row[name], "pk", row[name]) if name in self.spec.related else row[name]
+            for name in self.spec.natural_key
+        )
+
+    def _natural_keys(self, values, report):
+        """{natural key: row number}, reporting rows that repeat an earlier row's key."""
+        if not self.spec.natural_key:
+            return {}
+
+        failed = {error["row"] for error in report.errors}
+        seen = {}
+        for number, row in values.items():
+            if number in failed:
+                continue
+            key = self._natural_key(row)
+            if key in seen:
+                report.error(number, f"Duplicate of row {seen[key]}.")
+            else:
+                seen[key] = number
+        return seen
+
+    def _manager(self):
+        """Every row, soft deleted ones included, where the model soft deletes."""
+        return getattr(self.model, "all_objects", self.model.objects)
+
+    def _missing(self, row):
+        """Required fields a row left out, which a new row can't."""
+        return [
+            name for name in self.spec.fields
+            if name not in row or (name in self.spec.related and self.spec.related[name].required and row[name] is None)
+        ]
+
+    def _match_existing(self, values, given, seen, report):
+        if not self.spec.natural_key:
+            for number, row in values.items():
+                for name in self._missing(row):
+                    report.error(number, "This field is required.", name)
+            return list(values.values()), []
+
+        attnames = [self.model._meta.get_field(name).attname for name in self.spec.natural_key]
+        # Soft deleted rows still hold their key in the unique constraint, an
+        # update brings them back
+        soft_delete = hasattr(self.model, "all_objects")
+        existing = {}
+        for query in key_filters(attnames, list(seen)):
+            for row in self._manager().filter(query).values("pk", *attnames, *(["is_deleted"] if soft_delete else [])):
+                key = tuple(row[attname] for attname in attnames)
+                if key in seen:
+                    existing[key] = (row["pk"], row.get("is_deleted", False))
+
+        to_create, to_update = [], []
+        for key, number in seen.items():
+            pk, deleted = existing.get(key, (None, False))
+            if pk is None:
+                for name in self._missing(values[number]):
+                    report.error(number, "This field is required.", name)
+                to_create.append(values[number])
+            elif self.spec.on_conflict == OnConflict.UPDATE:
+                to_update.append((pk, values[number], given[number], deleted))
+            elif self.spec.on_conflict == OnConflict.SKIP:
+                report.skipped += 1
+            else:
+                report.error(number, "Already exists.")
+        return to_create, to_update
+
+    def _write(self, to_create, to_update, report):
+        created = [self.model(**row) for row in to_create]
+        if created:
+            self.model.objects.bulk_create(created, batch_size=WRITE_BATCH_SIZE)
+            report.created = len(created)
+
+        if to_update:
+            now = timezone.now()
+            touch = any(field.name == "updated_at" for field in self.model._meta.concrete_fields)
+
+            # Rows only update the fields they gave, one write per set of fields
+            groups = {}
+            for pk, row, given, deleted in to_update:
+                fields = tuple(field for field in self.spec.update_fields if field in given)
+                obj = self.model(**row)
+                obj.pk = pk
+                if touch:
+                    obj.updated_at = now
+                if deleted:
+                    obj.is_deleted, obj.deleted_at = False, None
+                groups.setdefault((fields, deleted), []).append(obj)
+
+            for (fields, restore), updated in groups.items():
+                # A partial row can't go through an INSERT, its missing columns may be NOT NULL
+                whole = len(fields) == len(self.spec.update_fields)
+                fields = list(fields) + (["is_deleted", "deleted_at"] if restore else [])
+                if touch and "updated_at" not in fields:
+                    # auto_now isn't applied by bulk writes
+                    fields.append("updated_at")
+                if not fields:
+                    continue
+                if whole and connection.features.supports_update_conflicts_with_target:
+                    # One INSERT ... ON CONFLICT per batch instead of a CASE per column
+                    self.model.objects.bulk_create(
+                        updated, batch_size=WRITE_BATCH_SIZE,
+                        update_conflicts=True, unique_fields=["pk"], update_fields=fields,
+                    )
+                else:
+                    self._manager().bulk_update(updated, fields, batch_size=WRITE_BATCH_SIZE)
+            report.updated = len(to_update)
+
+        if self.trigger_post_save:
+            for obj in created:
+                post_save.send(sender=self.model, instance=obj, created=True)
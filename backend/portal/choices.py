@@ -184,4 +184,24 @@ class OrderTypeChoices(models.TextChoices):
 
 class POImportFormatsChoices(models.TextChoices):
     PO = PO, PO
-    SLB = SLB, SLB
\ No newline at end of file
+    SLB = SLB, SLB
+
+
+class OutboxStatusChoices(models.TextChoices):
+    QUEUE = QUEUE, QUEUE
+    SENT = SENT, SENT
+    FAILED = FAILED, FAILED
+
+
+class QuantityLedgerKindChoices(models.TextChoices):
+    ALLOCATION = ALLOCATION, ALLOCATION
+    RECEIPT = RECEIPT, RECEIPT
+    CANCELLATION = CANCELLATION, CANCELLATION
+    OPENING = OPENING, OPENING      ## Balances carried over when the ledger was introduced
+
+
+class AuditTrailKindChoices(models.TextChoices):
+    CONSIGNMENT = CONSIGNMENT, CONSIGNMENT
+    PURCHASE_ORDER = PURCHASE_ORDER, PURCHASE_ORDER
+    PURCHASE_ORDER_LINE = PURCHASE_ORDER_LINE, PURCHASE_ORDER_LINE
+    CONSOLE = CONSOLE, CONSOLE
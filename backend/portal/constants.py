@@ -105,6 +105,16 @@ ERROR = "Error"
 IN_PROGRESS = "In Progress"
 FAILED = "Failed"
 QUEUE = "Queue"
+SENT = "Sent"
+
+## Quantity ledger entry kinds
+ALLOCATION = "Allocation"
+RECEIPT = "Receipt"
+CANCELLATION = "Cancellation"
+OPENING = "Opening"
+
+## Archived audit trail kinds, next to CONSIGNMENT, PURCHASE_ORDER and CONSOLE
+PURCHASE_ORDER_LINE = "Purchase Order Line"
 
 
 ## User Grid's
@@ -0,0 +1,16 @@
+from entities.models import Client, StorerKey, Supplier
+
+from .bulk_import import ImportSpec, RelatedKey, model_fields
+from .models import AddressBook
+
+
+## Addresses have no natural key, every row is a new address
+ADDRESS_BOOK = ImportSpec(
+    AddressBook,
+    fields=model_fields(AddressBook),
+    related={
+        "client": RelatedKey(Client, "client_code", required=False),
+        "supplier": RelatedKey(Supplier, "supplier_code", required=False),
+        "storerkey": RelatedKey(StorerKey, "storerkey_code", required=False),
+    },
+)
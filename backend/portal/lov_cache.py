@@ -0,0 +1,66 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+
+from core import cache_versions
+
+
+def _cache():
+    return caches[getattr(settings, "LOV_CACHE_ALIAS", "default")]
+
+
+def _version_key(model):
+    return f"lov:version:{model._meta.label_lower}"
+
+
+def model_versions(cache, models):
+    """Current version of each model."""
+    return cache_versions.current(cache, [_version_key(model) for model in models])
+
+
+def bump_model_version(sender, **kwargs):
+    """post_save/post_delete receiver, drops every LOV entry built from `sender`."""
+    cache_versions.bump(_cache(), [_version_key(sender)])
+
+
+def connect_invalidation(policies):
+    """Connect the version bump for every model a LOV cache policy depends on."""
+    models = {model for policy in policies if policy for model in policy.get("models", [])}
+
+    for model in models:
+        post_save.connect(bump_model_version, sender=model, dispatch_uid=f"lov-{model._meta.label_lower}-save")
+        post_delete.connect(bump_model_version, sender=model, dispatch_uid=f"lov-{model._meta.label_lower}-delete")
+
+
+def cached_lov(name, policy, scope, params, build):
+    """
+    Return build()'s result for (name, scope, params), cached under the
+    versions of the models in `policy`. A missing policy or a zero
+    timeout always builds.
+    """
+    if not policy or not policy.get("timeout"):
+        return build()
+
+    cache = _cache()
+    versions = model_versions(cache, policy["models"])
+    digest = hashlib.sha256(
+        json.dumps([name, str(scope), sorted(params.items()), versions], default=str).encode("utf-8")
+    ).hexdigest()
+    key = f"lov:{name}:{digest}"
+
+    result = cache.get(key)
+    if result is None:
+        result = build()
+        cache.set(key, result, policy["timeout"])
+    return result
+
+
+def request_params(request, ignore=()):
+    # Search is case-insensitive, so "ABC" and "abc" share an entry
+    params = {key: ",".join(request.GET.getlist(key)) for key in request.GET if key not in ignore}
+    if "q" in params:
+        params["q"] = params["q"].strip().lower()
+    return params
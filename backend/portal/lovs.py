@@ -13,54 +13,68 @@ from .choices import Role,PurchaseOrderStatusChoices, ConsoleStatusChoices, Oper
 from adhoc.models import AdhocPurchaseOrderLine
 import pandas as pd
 from .mixins import SearchAndFilterMixin
-from entities.models import ClientUser, DangerousGoodClass
+from entities.models import ClientUser, DangerousGoodClass, DangerousGoodCategory
+from accounts.models import User
 from operations.mixins import FilterMixin
 from operations.mixins import PaginationMixin
 from core.decorators import role_required
+from .lov_cache import cached_lov, request_params
+
+## Cache policy per entry: seconds to keep results and the models whose
+## post_save/post_delete invalidate them (see portal.lov_cache)
+STATIC_LOV_TIMEOUT = 60 * 60
+MASTER_LOV_TIMEOUT = 10 * 60
+TRANSACTIONAL_LOV_TIMEOUT = 60
 
 lov_options = {
     "manufacturing_country": {
         "fields": ["id", "value", "label"],
         "model": DropDownValues,
         "filters": {"dropdown_name": "ISO2"},
-        "order_by" : "label"
+        "order_by" : "label",
+        "cache": {"timeout": STATIC_LOV_TIMEOUT, "models": [DropDownValues]}
     },
     "operations": {
         "fields": ["id", "access_level","user__name","user__username","user__role","is_active"],
         "model": Operations,
         "filters": {},
         "select_related": ["user"],
-        "order_by": "user__name"
+        "order_by": "user__name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [Operations, User]}
     },
     "client": {
         "fields": ["id", "client_code", "name","is_active"],
         "model": Client,
         "filters": {},
-        "order_by": "name"
+        "order_by": "name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [Client]}
     },
     "client-user": {
         "fields": ["user__username","user__name", "user__role", "client__name", "is_active"],
         "model": ClientUser,
         "filters": {},
         "select_related": ["user","client"],
-        "order_by": "client__name"
-
+        "order_by": "client__name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [ClientUser, User, Client]}
     },
     "hub": {
         "fields": ["id", "hub_code", "name","location", "is_active"],
         "model": Hub,
         "filters": {},
-        "order_by": "name"
+        "order_by": "name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [Hub]}
     },
     "rejection-code": {
         "fields": ["id", "rejection_code"],
         "model": RejectionCode,
         "filters": {},
+        "cache": {"timeout": STATIC_LOV_TIMEOUT, "models": [RejectionCode]}
     },
     "gl-account": {
         "fields": ["id", "gl_code", "shipment_type","is_active"],
         "model": GLAccount,
         "filters": {},
+        "cache": {"timeout": STATIC_LOV_TIMEOUT, "models": [GLAccount]}
     },
     "supplier": {
         "fields": ["id", "supplier_code", "name","client","client__name","address","is_active"],
@@ -68,19 +82,22 @@ lov_options = {
         "model": Supplier,
         "filters": {},
         "select_related" : ["client"],
-        "order_by": "name"
+        "order_by": "name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [Supplier, Client]}
     },
     "mot": {
         "fields": ["id", "mot_type", "mode","is_active"],
         "model": MOT,
         "filters": {},
+        "cache": {"timeout": STATIC_LOV_TIMEOUT, "models": [MOT]}
     },
     "freight-forwarder": {
         "fields": ["id", "name", "mot","mot__mot_type", "mc_dot", "scac", "is_active"],
         "model": FreightForwarder,
         "filters": {},
         "distinct_fields" : {"id"},
-        "order_by": "name"
+        "order_by": "name",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [FreightForwarder, MOT]}
     },
     "consignment": {
         "fields": ["id", "consignment_id","type", "delivery_address","supplier__name","client__name", "packages",
@@ -89,66 +106,77 @@ lov_options = {
         "filters": {}, 
         "order_by": "-consignment_id",
         "select_related": ["supplier","client","delivery_address","console"],
-        "Q" : ~Q(consignment_status__in = [ConsignmentStatusChoices.DRAFT])
+        "Q" : ~Q(consignment_status__in = [ConsignmentStatusChoices.DRAFT]),
+        "cache": {"timeout": TRANSACTIONAL_LOV_TIMEOUT, "models": [Consignment, Supplier, Client]}
     },
     "purchase-order": {
         "fields": ["id", "reference_number", "customer_reference_number","supplier__name","description", "open_quantity", "type", "order_due_date"],
         "model": PurchaseOrder,
         "filters": {},
-        "select_related": ["supplier"]
+        "select_related": ["supplier"],
+        "cache": {"timeout": TRANSACTIONAL_LOV_TIMEOUT, "models": [PurchaseOrder, Supplier]}
     },
     "purchase-order-line": {
         "fields": ["id", "reference_number", "customer_reference_number","product_code"],
         "model": PurchaseOrderLine,
         "query_params": ["purchase_order"],
         "lookup_field": {"purchase_order" : "purchase_order__customer_reference_number"},
-        "select_related": ["purchase_order"]
+        "select_related": ["purchase_order"],
+        "cache": {"timeout": TRANSACTIONAL_LOV_TIMEOUT, "models": [PurchaseOrderLine, PurchaseOrder]}
     },
     "client-storer-key": {
         "fields": ["id", "storerkey_code", "name"],
         "model": StorerKey,
         "filters": {},
-        "query_params": ["client","hub"]
+        "query_params": ["client","hub"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [StorerKey]}
     },
     "package-type": {
         "fields": ["id", "package_name", "package_type", "measurement_method"],
         "model": PackagingType,
         "filters": {},
-        "query_params": ["supplier"]
+        "query_params": ["supplier"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [PackagingType]}
     },
     "storer-key": {
         "fields": ["id", "storerkey_code", "name","client","hub","timezone","service_type","measurement_method", "is_active"],
         "model": StorerKey,
         "filters": {},
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [StorerKey]}
     },
     "supplier-storer-key": {
         "fields": ["id", "storerkey_code", "name"],
         "model": StorerKey,
         "filters": {},
-        "query_params": ["suppliers"]
+        "query_params": ["suppliers"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [StorerKey]}
     },
     "address": {
         "fields": ["id", "address_name", "address_type", "address_line_1", "address_line_2", "city", "state", "country", "zipcode", "mobile_no", "alternate_mobile_no", "responsible_person_name", "latitude", "longitude"],
         "model": AddressBook,
         "filters": {},
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [AddressBook]}
     },
     "client-address": {
         "fields": ["id", "address_name", "address_type", "address_line_1", "address_line_2", "city", "state", "country", "zipcode", "mobile_no", "alternate_mobile_no", "responsible_person_name", "latitude", "longitude"],
         "model": AddressBook,
         "filters": {},
-        "query_params": ["client"]
+        "query_params": ["client"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [AddressBook]}
     },
     "storerkey-address": {
         "fields": ["id", "address_name", "address_type", "address_line_1", "address_line_2", "city", "state", "country", "zipcode", "mobile_no", "alternate_mobile_no", "responsible_person_name", "latitude", "longitude"],
         "model": AddressBook,
         "filters": {},
-        "query_params": ["storerkey"]
+        "query_params": ["storerkey"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [AddressBook]}
     },
     "supplier-address": {
         "fields": ["id", "address_name", "address_type", "address_line_1", "address_line_2", "city", "state", "country", "zipcode", "mobile_no", "alternate_mobile_no", "responsible_person_name", "latitude", "longitude"],
         "model": AddressBook,
         "filters": {},
-        "query_params": ["supplier"]
+        "query_params": ["supplier"],
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [AddressBook]}
     },
     "console": {
         "fields": ["id", "console_id","console_status","gl_account", "last_bol_generated_at", "last_bol_generated_by"],
@@ -156,19 +184,22 @@ lov_options = {
         "filters": {},
         "order_by" : "-console_id",
         "select_related": ["gl_account","last_bol_generated_by"],
-        # "Q" : ~Q(console_status__in = [ConsoleStatusChoices.CANCELLED,ConsoleStatusChoices.DELIVERED,ConsoleStatusChoices.RECEIVED_AT_DESTINATION])
+        # "Q" : ~Q(console_status__in = [ConsoleStatusChoices.CANCELLED,ConsoleStatusChoices.DELIVERED,ConsoleStatusChoices.RECEIVED_AT_DESTINATION]),
+        "cache": {"timeout": TRANSACTIONAL_LOV_TIMEOUT, "models": [Console, GLAccount, User]}
     },
     "cc-code": {
         "fields": ["id","cc_code","plant_id","center_code","sloc"],
         "model": CostCenterCode,
         "filters": {},
         "order_by" : "-created_at",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [CostCenterCode]}
     },
     "dangerous-good": {
         "fields": ["id","name","categories__name"],
         "model": DangerousGoodClass,
         "filters": {},
         "order_by" : "-created_at",
+        "cache": {"timeout": STATIC_LOV_TIMEOUT, "models": [DangerousGoodClass, DangerousGoodCategory]}
     },
     "material_master": {
         "fields": ["id","product_code","description","storerkey__name","storerkey__storerkey_code","hub__name","hub__hub_code","hs_code",
@@ -177,13 +208,13 @@ lov_options = {
         "model": MaterialMaster,
         "filters": {},
         "order_by" : "-updated_at",
+        "cache": {"timeout": MASTER_LOV_TIMEOUT, "models": [MaterialMaster, StorerKey, Hub]}
     }
 }
 
 def _build_filters(request, query_params, static_filters,lookup_field):
     """Build dynamic filters from query parameters and static ones."""
     filters = {
-        "is_deleted": False,
         "is_active": True,
     }
     if query_params:
@@ -231,7 +262,7 @@ class LovApiView(APIView,SearchAndFilterMixin,PaginationMixin):
         if not model:
             return StandardResponse(status=500, success=False, errors=["Invalid configuration for the given key."])
 
-        try:
+        def build():
             filters = _build_filters(request, query_params, static_filters,lookup_field)
             queryset = model.objects.filter(**filters).select_related(*select_related)
 
@@ -248,11 +279,16 @@ class LovApiView(APIView,SearchAndFilterMixin,PaginationMixin):
             if pg and limit:
                 count = queryset.count()
                 paginate_result = self.paginate_results(queryset, pg, limit)
-                serialized_data = self.filter_annotations_by_fields(paginate_result, key, fields)
+                return self.filter_annotations_by_fields(paginate_result, key, fields), count
+            return self.filter_annotations_by_fields(queryset, key, fields), None
+
+        try:
+            # Entries are not tenant scoped, the query params fully describe the result
+            serialized_data, count = cached_lov(key, lov_config.get("cache"), "", request_params(request), build)
+
+            if pg and limit:
                 return StandardResponse(data=serialized_data, status=200,count = count)
-            else:
-                serialized_data = self.filter_annotations_by_fields(queryset, key, fields)
-                return Response(data=serialized_data, status=200)
+            return Response(data=serialized_data, status=200)
 
         except Exception as e:
             return StandardResponse(status=500, success=False, errors=f"Internal Server Error: {str(e)}")
@@ -296,26 +332,31 @@ class SupplierLOVAPI(APIView,SearchAndFilterMixin,PaginationMixin):
                 profile = request.this_user.profile()
                 filters["id"] = profile.supplier.id
 
-                
-            queryset = model.objects.filter(**filters).select_related(*select_related)
-            if q_filters:
-                queryset = queryset.filter(q_filters)
-            if distinct_fields:
-                queryset = queryset.distinct() ## dont add the fields into distinct it will not work for mssql
-            if order_by:
-                queryset = queryset.order_by(order_by)
+            def build():
+                queryset = model.objects.filter(**filters).select_related(*select_related)
+                if q_filters:
+                    queryset = queryset.filter(q_filters)
+                if distinct_fields:
+                    queryset = queryset.distinct() ## dont add the fields into distinct it will not work for mssql
+                if order_by:
+                    queryset = queryset.order_by(order_by)
 
-            if search_query:
-                queryset = _apply_search_filter(queryset, search_fields if search_fields else fields, search_query)
+                if search_query:
+                    queryset = _apply_search_filter(queryset, search_fields if search_fields else fields, search_query)
+
+                if pg and limit:
+                    count = queryset.count()
+                    paginate_result = self.paginate_results(queryset, pg, limit)
+                    return self.filter_annotations_by_fields(paginate_result, "supplier", fields), count
+                return self.filter_annotations_by_fields(queryset, "supplier", fields), None
+
+            # Supplier users only ever see their own supplier
+            scope = filters.get("id", "")
+            serialized_data, count = cached_lov("supplier", lov_config.get("cache"), scope, request_params(request), build)
 
             if pg and limit:
-                count = queryset.count()
-                paginate_result = self.paginate_results(queryset, pg, limit)
-                serialized_data = self.filter_annotations_by_fields(paginate_result, "supplier", fields)
                 return StandardResponse(data=serialized_data, status=200,count = count)
-            else:
-                serialized_data = self.filter_annotations_by_fields(queryset, "supplier", fields)
-                return Response(data=serialized_data, status=200)
+            return Response(data=serialized_data, status=200)
 
         except Exception as e:
             # Log the exception properly in production code
@@ -324,6 +365,8 @@ class SupplierLOVAPI(APIView,SearchAndFilterMixin,PaginationMixin):
 
 
 class PurchaseOrderLovApi(FilterMixin, PaginationMixin, APIView):
+    cache_policy = {"timeout": TRANSACTIONAL_LOV_TIMEOUT, "models": [PurchaseOrder, PurchaseOrderLine, Supplier]}
+
     def get(self, request, *args, **kwargs):
 
          ## Pagination
@@ -368,7 +411,11 @@ class PurchaseOrderLovApi(FilterMixin, PaginationMixin, APIView):
         #     return Response(data=paginated_result, status=200)
         # return Response(data=queryset, status=200)
 
-        paginated_result = self.paginate_results(queryset,pg,limit)
+        # build_filter scopes by the user's storerkeys and role
+        paginated_result = cached_lov(
+            "purchase-order-by-user", self.cache_policy, request.this_user.pk, request_params(request),
+            lambda: list(self.paginate_results(queryset,pg,limit))
+        )
         return Response(data=paginated_result, status=200)
 
 
@@ -525,7 +572,7 @@ class AvailableConsolesLOV(APIView,PaginationMixin):
         limit = request.GET.get("limit",10)
         
 
-        try:
+        def build():
             queryset = (
                 Console.objects
                 .select_related(*select_related)
@@ -540,9 +587,10 @@ class AvailableConsolesLOV(APIView,PaginationMixin):
                 .order_by("-console_id")
                 .values(*fields)
             )
+            return list(self.paginate_results(queryset, pg, limit)), queryset.count()
 
-            count = queryset.count()
-            paginated_result = self.paginate_results(queryset, pg, limit)
+        try:
+            paginated_result, count = cached_lov("available-consoles", lov_config.get("cache"), "", request_params(request), build)
                     
             return StandardResponse(data=paginated_result, status=200, count=count)
             
@@ -551,6 +599,10 @@ class AvailableConsolesLOV(APIView,PaginationMixin):
      
     
 
+def lov_cache_policies():
+    return [config.get("cache") for config in lov_options.values()] + [PurchaseOrderLovApi.cache_policy]
+
+
 def add_drop_down_values():
 
     file_path = '/home/apsis/Development/Dev/PickupTool/aramex-pickup-tool/backend/portal/countries_iso_codes.xlsx'
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0038_addressbook_addr_client_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('name', models.CharField(max_length=50)),
+                ('scope', models.CharField(blank=True, default='', max_length=100)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'scope')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0039_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.UUIDField()),
+                ('body', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'unique_together': {('model', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,101 @@
+from django.db import migrations
+
+
+## Text index on portal_searchdocument.body for the database in use, see portal.search.
+## SQL Server full-text DDL can't run inside a transaction, hence atomic = False.
+
+POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS search_body_trgm_idx ON portal_searchdocument USING gin (body gin_trgm_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS search_body_trgm_idx",
+]
+
+MSSQL = [
+    """
+    IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'search_catalog')
+            CREATE FULLTEXT CATALOG search_catalog;
+
+        DECLARE @key sysname = (
+            SELECT name FROM sys.indexes
+            WHERE object_id = OBJECT_ID('portal_searchdocument') AND is_primary_key = 1
+        );
+        EXEC('CREATE FULLTEXT INDEX ON portal_searchdocument (body) KEY INDEX ' + QUOTENAME(@key)
+             + ' ON search_catalog WITH CHANGE_TRACKING AUTO');
+    END
+    """,
+]
+MSSQL_REVERSE = [
+    """
+    IF EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('portal_searchdocument'))
+        DROP FULLTEXT INDEX ON portal_searchdocument
+    """,
+]
+
+## External content FTS5 table over the documents' implicit rowid, kept in sync by triggers
+SQLITE = [
+    """
+    CREATE VIRTUAL TABLE portal_searchdocument_fts USING fts5(
+        body, content='portal_searchdocument', content_rowid='rowid', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER portal_searchdocument_fts_ai AFTER INSERT ON portal_searchdocument BEGIN
+        INSERT INTO portal_searchdocument_fts (rowid, body) VALUES (new.rowid, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER portal_searchdocument_fts_ad AFTER DELETE ON portal_searchdocument BEGIN
+        INSERT INTO portal_searchdocument_fts (portal_searchdocument_fts, rowid, body) VALUES ('delete', old.rowid, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER portal_searchdocument_fts_au AFTER UPDATE ON portal_searchdocument BEGIN
+        INSERT INTO portal_searchdocument_fts (portal_searchdocument_fts, rowid, body) VALUES ('delete', old.rowid, old.body);
+        INSERT INTO portal_searchdocument_fts (rowid, body) VALUES (new.rowid, new.body);
+    END
+    """,
+    "INSERT INTO portal_searchdocument_fts (portal_searchdocument_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS portal_searchdocument_fts_ai",
+    "DROP TRIGGER IF EXISTS portal_searchdocument_fts_ad",
+    "DROP TRIGGER IF EXISTS portal_searchdocument_fts_au",
+    "DROP TABLE IF EXISTS portal_searchdocument_fts",
+]
+
+STATEMENTS = {
+    "postgresql": (POSTGRES, POSTGRES_REVERSE),
+    "microsoft": (MSSQL, MSSQL_REVERSE),
+    "sqlite": (SQLITE, SQLITE_REVERSE),
+}
+
+
+def _run(schema_editor, reverse):
+    forward_sql, reverse_sql = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in (reverse_sql if reverse else forward_sql):
+        schema_editor.execute(sql, params=None)
+
+
+def create_text_index(apps, schema_editor):
+    _run(schema_editor, reverse=False)
+
+
+def drop_text_index(apps, schema_editor):
+    _run(schema_editor, reverse=True)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('portal', '0040_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
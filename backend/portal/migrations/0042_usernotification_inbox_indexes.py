@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0041_searchdocument_text_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user', 'is_read'], name='usernotif_user_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user', 'created_at'], name='usernotif_user_created_idx'),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.db.models import Func, IntegerField
 from django.db.models.expressions import RawSQL
 from datetime import datetime, timedelta
 from .utils import get_utc_range_for_date
+from .pagination import cached_count, keyset_page
 
 class SearchAndFilterMixin:
     operator_mapping = {
@@ -200,6 +201,17 @@ class PaginationMixin:
         end = (int(page_index) + 1) * int(page_size)
         return queryset_list[start:end]
 
+    def paginate_keyset(self, queryset, request, ordering, page_size):
+        """
+        Cursor pagination for list grids, returns (rows, next_cursor).
+        Pass the returned cursor back as ?cursor= for the next page.
+        """
+        return keyset_page(queryset, ordering, int(page_size), request.GET.get("cursor"))
+
+    def get_count(self, queryset, request):
+        # Scoped per user, their filters are part of the queryset already
+        return cached_count(queryset, scope=getattr(getattr(request, "this_user", None), "pk", ""))
+
 
 
 
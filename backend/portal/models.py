@@ -168,6 +168,45 @@ class UserNotification(BaseModel):
 
     class Meta:
         unique_together = ('user', 'notification')
+        indexes = [
+            models.Index(fields=['user', 'is_read'], name='usernotif_user_read_idx'),
+            models.Index(fields=['user', 'created_at'], name='usernotif_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.notification.header
+
+
+class Sequence(BaseModel):
+    """
+    Counter behind the business identifiers (PKU, DRAFT, CN, XML, AR3).
+    `value` is the last number handed out, see portal.sequences.
+    """
+
+    name = models.CharField(max_length=50)
+    scope = models.CharField(max_length=100, blank=True, default="")
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('name', 'scope')
+
+    def __str__(self):
+        return f"{self.name}{' | ' + self.scope if self.scope else ''} | {self.value}"
+
+
+class SearchDocument(BaseModel):
+    """
+    Denormalized, lower-cased search text of one row of a searchable model,
+    maintained by portal.search and matched through the database's text
+    index (pg_trgm, SQL Server full-text or SQLite FTS5).
+    """
+
+    model = models.CharField(max_length=100)
+    object_id = models.UUIDField()
+    body = models.TextField(blank=True, default="")
+
+    class Meta:
+        unique_together = ('model', 'object_id')
 
     def __str__(self):
-        return self.notification.header
\ No newline at end of file
+        return f"{self.model} | {self.object_id}"
@@ -0,0 +1,126 @@
+import base64
+import datetime
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds, a cursor needs the exact value
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    payload = json.dumps(values, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def _row_value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def keyset_page(queryset, ordering, page_size, cursor=None):
+    """
+    One page of `queryset` ordered by `ordering` (e.g. ["-consignment_id", "-id"]),
+    continuing after `cursor`. The last ordering field must be unique and none
+    of them nullable. Works with model and values() querysets as long as the
+    ordering fields are selected.
+
+    Returns (rows, next_cursor), next_cursor is None on the last page.
+    """
+    names = [field.lstrip("-") for field in ordering]
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(names):
+            raise InvalidCursor("Invalid cursor")
+
+        model = queryset.model
+        try:
+            values = [model._meta.get_field(name).to_python(value) for name, value in zip(names, values)]
+        except (ValidationError, TypeError, ValueError) as e:
+            # A cursor edited by hand, e.g. a value that isn't a UUID
+            raise InvalidCursor("Invalid cursor") from e
+
+        # (a, b) after (x, y)  ->  a > x OR (a = x AND b > y), per field direction
+        after = Q()
+        for i, field in enumerate(ordering):
+            lookup = "lt" if field.startswith("-") else "gt"
+            step = Q(**{f"{names[i]}__{lookup}": values[i]})
+            for j in range(i):
+                step &= Q(**{names[j]: values[j]})
+            after |= step
+        queryset = queryset.filter(after)
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, encode_cursor([_row_value(rows[-1], name) for name in names])
+
+
+_count_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="list-count")
+_refreshing = set()
+
+
+def _count_key(queryset, scope):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha256(f"{scope}|{sql}|{params!r}".encode("utf-8")).hexdigest()
+    return f"list-count:{digest}"
+
+
+def _refresh_count(key, queryset):
+    try:
+        cache.set(key, {"count": queryset.count(), "at": time.time()}, getattr(settings, "LIST_COUNT_TTL", 600))
+    finally:
+        _refreshing.discard(key)
+        connections.close_all()
+
+
+def cached_count(queryset, scope=""):
+    """
+    Total rows for a list filter, cached per (scope, filter). Counts older than
+    LIST_COUNT_FRESH seconds are still returned but recounted in the background,
+    so only the first request for a filter pays for the count.
+    """
+    key = _count_key(queryset, scope)
+    entry = cache.get(key)
+
+    if entry is None:
+        count = queryset.count()
+        cache.set(key, {"count": count, "at": time.time()}, getattr(settings, "LIST_COUNT_TTL", 600))
+        return count
+
+    if time.time() - entry["at"] > getattr(settings, "LIST_COUNT_FRESH", 30) and key not in _refreshing:
+        _refreshing.add(key)
+        _count_executor.submit(_refresh_count, key, queryset.all())
+
+    return entry["count"]
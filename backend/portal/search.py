@@ -0,0 +1,192 @@
+import json
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BooleanField, Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import SearchDocument
+
+
+## model label -> {"title", "fields", "related"}, see register()
+SEARCH_MODELS = {}
+
+## Bookkeeping fields nobody searches on
+SKIP_FIELDS = {"id", "updated_at", "deleted_at"}
+
+BATCH_SIZE = 500
+
+
+def register(model, title, related=()):
+    """
+    Make `model` searchable. Its document holds every concrete, non-relation,
+    non-boolean field plus the `related` lookups (e.g. "supplier__name").
+    `title` is the identifier field exact and prefix matches rank on.
+    Connect search_post_save/search_post_delete for the model alongside.
+    """
+    fields = [
+        field.name for field in model._meta.concrete_fields
+        if not field.is_relation and not isinstance(field, BooleanField) and field.name not in SKIP_FIELDS
+    ]
+    SEARCH_MODELS[model._meta.label_lower] = {"title": title, "fields": fields, "related": list(related)}
+
+
+def _spec(model):
+    return SEARCH_MODELS.get(model._meta.label_lower)
+
+
+def normalize(term):
+    return " ".join((term or "").split()).lower()
+
+
+## -------- Documents --------
+
+def _text(value):
+    if value is None or isinstance(value, bool):
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str) if value else ""
+    return str(value)
+
+
+def index(model, ids):
+    """(Re)build the documents of `ids`, one read and one write per batch."""
+    spec = _spec(model)
+    label = model._meta.label_lower
+    ids = list(dict.fromkeys(ids))
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+
+        # Multi-valued related lookups return a row per related object
+        parts = defaultdict(list)
+        rows = model._base_manager.filter(pk__in=batch).values("pk", *spec["fields"], *spec["related"])
+        for row in rows:
+            pk = row.pop("pk")
+            parts[pk].extend(text for text in map(_text, row.values()) if text)
+
+        documents = [
+            SearchDocument(model=label, object_id=pk, body="\n".join(dict.fromkeys(texts)).lower())
+            for pk, texts in parts.items()
+        ]
+        with transaction.atomic():
+            SearchDocument.objects.filter(model=label, object_id__in=batch).delete()
+            SearchDocument.objects.bulk_create(documents, batch_size=BATCH_SIZE)
+
+
+def _index_committed(model, ids):
+    try:
+        index(model, ids)
+    except IntegrityError:
+        # A concurrent save of the same row indexed it first, redo it on top
+        index(model, ids)
+
+
+def reindex(model, ids):
+    """Index `ids` once the current transaction commits, for bulk writes that skip signals."""
+    if _spec(model) and ids:
+        transaction.on_commit(partial(_index_committed, model, list(ids)), robust=True)
+
+
+def search_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    reindex(sender, [instance.pk])
+
+
+def search_post_delete(sender, instance, **kwargs):
+    label, pk = sender._meta.label_lower, instance.pk
+    transaction.on_commit(
+        lambda: SearchDocument.objects.filter(model=label, object_id=pk).delete(), robust=True
+    )
+
+
+## -------- Matching --------
+
+## Whether portal_searchdocument has its SQL Server full-text index, looked up once per process
+_fulltext_index = None
+
+
+def _has_fulltext_index():
+    global _fulltext_index
+    if _fulltext_index is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)",
+                [SearchDocument._meta.db_table],
+            )
+            _fulltext_index = cursor.fetchone() is not None
+    return _fulltext_index
+
+
+def backend():
+    """
+    The text index searches go through. SQL Server full-text only matches
+    word prefixes, not substrings, so it is opt-in (SEARCH_BACKEND=fulltext)
+    and falls back to LIKE where migration 0041 couldn't create the index.
+    """
+    name = getattr(settings, "SEARCH_BACKEND", "auto")
+    if name == "auto":
+        return {"postgresql": "trigram", "sqlite": "fts5"}.get(connection.vendor, "like")
+    if name == "fulltext" and (connection.vendor != "microsoft" or not _has_fulltext_index()):
+        return "like"
+    return name
+
+
+def _match(term):
+    table = connection.ops.quote_name(SearchDocument._meta.db_table)
+    name = backend()
+
+    if name == "fulltext":
+        # Word prefix search, CONTAINS(body, '"abc*" AND "12*"')
+        words = [word.replace('"', "") for word in term.split()]
+        words = [word for word in words if word]
+        if words:
+            expression = " AND ".join(f'"{word}*"' for word in words)
+            return Q(pk__in=RawSQL(f"SELECT id FROM {table} WHERE CONTAINS(body, %s)", [expression]))
+
+    if name == "fts5" and len(term) >= 3:
+        # The trigram tokenizer matches substrings of 3+ characters
+        fts = connection.ops.quote_name(SearchDocument._meta.db_table + "_fts")
+        phrase = '"' + term.replace('"', '""') + '"'
+        return Q(pk__in=RawSQL(
+            f"SELECT d.id FROM {table} d JOIN {fts} f ON f.rowid = d.rowid WHERE {fts} MATCH %s", [phrase]
+        ))
+
+    # Postgres serves LIKE from the pg_trgm index, everywhere else it is the fallback
+    return Q(body__contains=term)
+
+
+def documents(model, term):
+    return SearchDocument.objects.filter(Q(model=model._meta.label_lower) & _match(normalize(term)))
+
+
+def search_filter(model, term):
+    """Q matching the rows of `model` whose document contains `term`."""
+    return Q(pk__in=documents(model, term).values("object_id"))
+
+
+def ranked(queryset, term, limit=None):
+    """
+    Rows of `queryset` matching `term`, exact then prefix matches on the
+    title field first, then in the queryset's own order, capped at `limit`
+    (SEARCH_RESULT_LIMIT by default).
+    """
+    model = queryset.model
+    title = _spec(model)["title"]
+    term = normalize(term)
+    limit = limit or getattr(settings, "SEARCH_RESULT_LIMIT", 50)
+
+    return (
+        queryset
+        .filter(search_filter(model, term))
+        .annotate(search_rank=Case(
+            When(**{f"{title}__iexact": term}, then=Value(0)),
+            When(**{f"{title}__istartswith": term}, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        .order_by("search_rank", *queryset.query.order_by)
+    )[:limit]
@@ -0,0 +1,57 @@
+from django.db import IntegrityError, transaction
+
+from .models import Sequence
+
+
+def max_numeric_suffix(queryset, field, prefix, default=0):
+    """
+    Highest number following `prefix` in `field`, used once to seed a
+    sequence from ids that were generated before the counter existed.
+    """
+    numbers = [
+        int(value[len(prefix):])
+        for value in queryset.filter(**{f"{field}__startswith": prefix}).values_list(field, flat=True).iterator()
+        if value and value[len(prefix):].isdigit()
+    ]
+    return max(numbers, default=default)
+
+
+def _locked_row(name, scope, seed):
+    row = Sequence.objects.select_for_update().filter(name=name, scope=scope).first()
+    if row is not None:
+        return row
+
+    # First use: start after whatever ids already exist
+    try:
+        with transaction.atomic():
+            Sequence.objects.create(name=name, scope=scope, value=seed() if seed else 0)
+    except IntegrityError:
+        # Another request created it first
+        pass
+    return Sequence.objects.select_for_update().get(name=name, scope=scope)
+
+
+def reserve(name, count=1, scope="", seed=None):
+    """
+    Claim `count` consecutive numbers from the sequence in one round trip.
+
+    The counter row is locked with select_for_update, so concurrent callers
+    queue on it instead of reading the same max. `seed` is a callable
+    returning the last number already in use; it only runs when the row is
+    created. Returns a range of the claimed numbers.
+    """
+    if count < 1:
+        return range(0)
+
+    with transaction.atomic():
+        row = _locked_row(name, scope, seed)
+        first = row.value + 1
+        row.value += count
+        row.save(update_fields=["value", "updated_at"])
+
+    return range(first, first + count)
+
+
+def next_value(name, scope="", seed=None):
+    return reserve(name, 1, scope=scope, seed=seed)[0]
+
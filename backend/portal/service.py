@@ -1,9 +1,8 @@
-from django.db import transaction
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models.signals import post_save
 import xlsxwriter
 import pandas as pd
 
+from .bulk_import import BulkImporter, ImportSpec, RelatedKey
+
 class ExcelService:
     
     def add_meta_sheet(self, wb, meta_data):
@@ -113,73 +112,28 @@ class ExcelService:
         return df
 
 
-    @transaction.atomic
     def upload_data(self, model, file, fields, trigger_post_save=False, extra_field=None):
         df = self.check_validations(file, fields)
         if isinstance(df, str):
             return df
 
-        data_to_create = []
+        missing = [field for field, info in fields.items() if info.get("type") == "list" and info.get("related") and not info.get("related_model")]
+        if missing:
+            return f"Error during data upload: 'related_model' not defined for field '{missing[0]}'."
+
+        related = {
+            field: RelatedKey(info["related_model"], info.get("related_lookup", "name"), required=bool(info.get("required")))
+            for field, info in fields.items()
+            if info.get("type") == "list" and info.get("related")
+        }
 
+        spec = ImportSpec(model, fields=list(fields), related=related, defaults=extra_field)
         try:
-            for _, row in df.iterrows():
-                data = {}
-                for field, info in fields.items():
-                    value = row[field]
-                    if pd.isna(value):
-                        data[field] = None
-                    else:
-                        if info.get("type") == "text":
-                            data[field] = value
-                        elif info.get("type") == "list":
-                            if info.get("related"):
-                                related_model = info.get("related_model")
-                                lookup_field = info.get("related_lookup", "name")  # Default lookup field is 'name'
-
-                                if not related_model:
-                                    raise ValueError(f"'related_model' not defined for field '{field}'.")
-
-                                # Handle cases like 'code|name' in value
-                                lookup_fields = [lf.strip() for lf in lookup_field.split("|")]
-                                lookup_query = {lf: val.strip() for lf, val in zip(lookup_fields, value.split("|")) if val}
-
-                                if not lookup_query:
-                                    raise ValueError(f"No valid lookup values provided for related field '{field}'.")
-
-                                related_instance = related_model.objects.filter(**lookup_query).first()
-
-                                if not related_instance and info.get("required"):
-                                    raise ObjectDoesNotExist(
-                                        f"Related object not found for field '{field}' with lookup: {lookup_query}."
-                                    )
-
-                                data[field] = related_instance
-                            else:
-                                if value in ["True", "TRUE", True, "true"]:
-                                    data[field] = True
-                                elif value in ["False", "FALSE", False, "false"]:
-                                    data[field] = False
-                                else: 
-                                    data[field] = value
-                        else:
-                            data[field] = value
-                                
-                data_to_create.append(data)
-
-            if extra_field:
-                data_to_create = [model(**{**data, **extra_field}) for data in data_to_create]
-            else:
-                data_to_create = [model(**data) for data in data_to_create]
-            created_objects = model.objects.bulk_create(data_to_create)
-
-            # Trigger post_save for each created object if required
-            if trigger_post_save:
-                for obj in created_objects:
-                    post_save.send(sender=model, instance=obj, created=True)
-
-            return True
-                        
+            report = BulkImporter(spec, trigger_post_save=trigger_post_save).run(df[list(fields)].to_dict("records"))
         except Exception as e:
-            transaction.set_rollback(True)
             return f"Error during data upload: {str(e)}"
+
+        if report.errors:
+            return "Error during data upload: " + "; ".join(report.messages())
+        return True
                         
\ No newline at end of file
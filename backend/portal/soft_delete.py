@@ -0,0 +1,61 @@
+from django.db import models
+from django.db.models import BooleanField, Lookup, Q
+from django.utils import timezone
+
+
+@BooleanField.register_lookup
+class Is(Lookup):
+    """
+    field__is=True/False, with the constant written into the SQL instead of
+    bound as a parameter. SQL Server only uses a filtered index when it can
+    see the query's predicate matches the index filter, which it can't for
+    `is_deleted = @P1`.
+    """
+    lookup_name = "is"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        if self.rhs not in (True, False):
+            raise ValueError("The 'is' lookup takes True or False.")
+        lhs, params = self.process_lhs(compiler, connection)
+        if connection.vendor == "postgresql":
+            literal = "true" if self.rhs else "false"
+        else:
+            literal = "1" if self.rhs else "0"
+        return f"{lhs} = {literal}", params
+
+
+## Rows the application works with, the condition of the live_index()es
+LIVE = Q(is_deleted__is=False)
+
+
+def live_index(*fields, name):
+    """
+    Index over the live rows only, a partial index on Postgres and a
+    filtered index on SQL Server, so soft deleted rows don't weigh on the
+    hot lookups going through `objects`. The condition is written the way
+    LiveManager filters, the form the query planners match on.
+    """
+    return models.Index(fields=list(fields), name=name, condition=LIVE)
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def live(self):
+        return self.filter(LIVE)
+
+    def active(self):
+        """Live rows not deactivated, what the LOVs and pickers offer."""
+        return self.filter(LIVE, is_active=True)
+
+    def soft_delete(self):
+        return self.update(is_deleted=True, deleted_at=timezone.now())
+
+    def restore(self):
+        return self.update(is_deleted=False, deleted_at=None)
+
+
+class LiveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Manager over the rows that aren't soft deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(LIVE)
@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from entities.import_specs import MATERIAL_MASTER
+from entities.models import Client, Hub, MaterialMaster, StorerKey
+
+from . import search
+from .bulk_import import BulkImporter, ImportSpec, OnConflict
+from .mixins import SearchAndFilterMixin
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+
+HUB = ImportSpec(Hub, fields=["hub_code", "name", "location"], natural_key=["hub_code"], on_conflict=OnConflict.UPDATE)
+
+
+class CursorTests(TestCase):
+    def setUp(self):
+        self.hubs = [Hub.objects.create(hub_code=f"H{i}", name=f"Hub {i}") for i in range(5)]
+
+    def test_round_trip(self):
+        values = ["H1", str(self.hubs[1].pk)]
+        self.assertEqual(decode_cursor(encode_cursor(values)), values)
+
+    def test_garbage_cursors(self):
+        for cursor in ["not base64!", encode_cursor({"a": 1})[:-2], "e30"]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_pages_follow_each_other(self):
+        rows, cursor = keyset_page(Hub.objects.all(), ["hub_code", "id"], 2)
+        seen = [hub.hub_code for hub in rows]
+        while cursor:
+            rows, cursor = keyset_page(Hub.objects.all(), ["hub_code", "id"], 2, cursor)
+            seen += [hub.hub_code for hub in rows]
+        self.assertEqual(seen, ["H0", "H1", "H2", "H3", "H4"])
+
+    def test_cursor_of_other_ordering(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Hub.objects.all(), ["hub_code", "id"], 2, encode_cursor(["H1"]))
+
+    def test_cursor_value_of_wrong_type(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Hub.objects.all(), ["hub_code", "id"], 2, encode_cursor(["H1", "not-a-uuid"]))
+
+
+class SearchBackendTests(SimpleTestCase):
+    @override_settings(SEARCH_BACKEND="auto")
+    def test_auto_picks_the_vendor_index(self):
+        for vendor, expected in [("postgresql", "trigram"), ("sqlite", "fts5"), ("microsoft", "like"), ("oracle", "like")]:
+            with self.subTest(vendor=vendor), mock.patch.object(connection, "vendor", vendor):
+                self.assertEqual(search.backend(), expected)
+
+    @override_settings(SEARCH_BACKEND="fulltext")
+    def test_fulltext_falls_back_to_like(self):
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            self.assertEqual(search.backend(), "like")
+        with mock.patch.object(connection, "vendor", "microsoft"), mock.patch.object(search, "_has_fulltext_index", return_value=False):
+            self.assertEqual(search.backend(), "like")
+        with mock.patch.object(connection, "vendor", "microsoft"), mock.patch.object(search, "_has_fulltext_index", return_value=True):
+            self.assertEqual(search.backend(), "fulltext")
+
+
+class GridSearchTests(TestCase):
+    def test_substring_any_field_any_case(self):
+        Hub.objects.create(hub_code="DXB01", name="Dubai")
+        Hub.objects.create(hub_code="AUH01", name="Abu Dhabi")
+        mixin = SearchAndFilterMixin()
+
+        def codes(term):
+            return sorted(mixin.apply_search(["hub_code", "name"], Hub.objects.all(), term).values_list("hub_code", flat=True))
+
+        self.assertEqual(codes("xb0"), ["DXB01"])
+        self.assertEqual(codes("DHABI"), ["AUH01"])
+        self.assertEqual(codes("01"), ["AUH01", "DXB01"])
+
+
+class BulkImporterTests(TestCase):
+    def setUp(self):
+        self.hub = Hub.objects.create(hub_code="DXB", name="Dubai")
+        client = Client.objects.create(client_code="C1", name="Client")
+        self.storerkey = StorerKey.objects.create(
+            storerkey_code="SK1", aramex_wms_storerkey="W", name="SK", client=client, hub=self.hub,
+            timezone="UTC", service_type="3PL",
+        )
+
+    def material(self, product_code, **fields):
+        return {"storerkey": "SK1", "hub": "DXB", "product_code": product_code, **fields}
+
+    def test_reupload_updates_in_place(self):
+        report = BulkImporter(MATERIAL_MASTER).run([self.material("P1", description="first"), self.material("P2")])
+        self.assertEqual((report.created, report.updated, report.errors), (2, 0, []))
+
+        report = BulkImporter(MATERIAL_MASTER).run([self.material("P1", description="second")])
+        self.assertEqual((report.created, report.updated, report.errors), (0, 1, []))
+        self.assertEqual(MaterialMaster.objects.get(product_code="P1").description, "second")
+        self.assertEqual(MaterialMaster.objects.count(), 2)
+
+    def test_conflict_error_writes_nothing(self):
+        spec = ImportSpec(Hub, fields=["hub_code", "name"], natural_key=["hub_code"])
+        report = BulkImporter(spec).run([{"hub_code": "AUH", "name": "Abu Dhabi"}, {"hub_code": "DXB", "name": "Renamed"}])
+        self.assertEqual(report.messages(), ["Row 2: Already exists."])
+        self.assertFalse(Hub.objects.filter(hub_code="AUH").exists())
+        self.assertEqual(Hub.objects.get(hub_code="DXB").name, "Dubai")
+
+    def test_conflict_skip(self):
+        spec = ImportSpec(Hub, fields=["hub_code", "name"], natural_key=["hub_code"], on_conflict=OnConflict.SKIP)
+        report = BulkImporter(spec).run([{"hub_code": "DXB", "name": "Renamed"}])
+        self.assertEqual((report.updated, report.skipped), (0, 1))
+        self.assertEqual(Hub.objects.get(hub_code="DXB").name, "Dubai")
+
+    def test_duplicate_rows_in_file(self):
+        report = BulkImporter(MATERIAL_MASTER).run([self.material("P1"), self.material("P1")])
+        self.assertEqual(report.messages(), ["Row 2: Duplicate of row 1."])
+        self.assertFalse(MaterialMaster.objects.exists())
+
+    def test_partial_row_only_updates_given_fields(self):
+        Hub.objects.filter(pk=self.hub.pk).update(location="Jebel Ali")
+        report = BulkImporter(HUB).run([{"hub_code": "DXB", "location": "Al Quoz"}])
+        self.assertEqual((report.updated, report.errors), (1, []))
+        self.hub.refresh_from_db()
+        self.assertEqual((self.hub.name, self.hub.location), ("Dubai", "Al Quoz"))
+
+    def test_partial_row_needs_required_fields_when_new(self):
+        report = BulkImporter(HUB).run([{"hub_code": "AUH", "location": "Mussafah"}])
+        self.assertEqual(report.messages(), ["Row 1: name: This field is required."])
+        self.assertFalse(Hub.objects.filter(hub_code="AUH").exists())
+
+    def test_soft_deleted_row_is_restored(self):
+        BulkImporter(MATERIAL_MASTER).run([self.material("P1", description="first")])
+        MaterialMaster.objects.filter(product_code="P1").soft_delete()
+
+        report = BulkImporter(MATERIAL_MASTER).run([self.material("P1", description="back")])
+        self.assertEqual((report.created, report.updated, report.errors), (0, 1, []))
+        material = MaterialMaster.objects.get(product_code="P1")
+        self.assertEqual((material.description, material.deleted_at), ("back", None))
+        self.assertEqual(MaterialMaster.all_objects.count(), 1)
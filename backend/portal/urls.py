@@ -3,7 +3,7 @@ from .lovs import (
     AdhocPurchaseOrderLineLovApi, LovApiView, StorerKeyByHubLOV, SuppliersByStorerKeyLOV, PurchaseOrderLovApi, 
     PlantByIdLOV, CenterCodeByIdLOV,ConsoleBOLGeneratedByLOV, ConsignmentCreatedBy,HubByStorerKeyLOV, SupplierLOVAPI, AvailableConsolesLOV
     )
-from .apis import  AddressBookView, PackagingTypeView, MOTView,FreightForwarderView, GLAccountView, CostCenterCodeView, RejectionView,NotificationAPIView,UserNotificationAPIView
+from .apis import  AddressBookView, AddressBookBulkImportAPI, PackagingTypeView, MOTView,FreightForwarderView, GLAccountView, CostCenterCodeView, RejectionView,NotificationAPIView,UserNotificationAPIView
 
 
 urlpatterns = [
@@ -19,6 +19,7 @@ urlpatterns = [
     path('lovs/storer-key/by-hub/', StorerKeyByHubLOV.as_view(), name='storerkey-by-hub'),
     path('lovs/hub/by-storerkey/', HubByStorerKeyLOV.as_view(), name='storerkey-by-hub'),
     path('lovs/suppliers/by-storerkey/', SuppliersByStorerKeyLOV.as_view(), name='suppliers-by-storerkey'),
+    path('address/bulk_import/', AddressBookBulkImportAPI.as_view(), name='address-book-bulk-import'),
     path('address/<str:id>/', AddressBookView.as_view(), name='address-book'),
     path('mot/<str:id>/', MOTView.as_view(), name='mot'),
     path('freight-forwarder/<str:id>/', FreightForwarderView.as_view(), name='frieght-forwader'),
@@ -116,8 +116,7 @@ class AddConsignmentsToConsoleAPI(APIView):
             
             log_console_audit(console=obj, old_consignments=old_consignment_ids, new_consignments=new_consignment_ids)
             
-            for consignment in consignments:
-                ConsignmentServices.notify_consignment_update(request.this_user,consignment)
+            ConsignmentServices.notify_consignments_update(request.this_user, consignments)
             
             return StandardResponse(status=201, message="Consignment added Successfully.") 
         except Exception as e:
@@ -283,8 +282,7 @@ class ConsoleView(SearchAndFilterMixin, PaginationMixin, APIView):
             
             consignments.update(console=console,consignment_status = ConsignmentStatusChoices.CONSOLE_ASSIGNED)
             
-            for consignment in consignments:
-                ConsignmentServices.notify_consignment_update(request.this_user,consignment)
+            ConsignmentServices.notify_consignments_update(request.this_user, consignments)
                 
             return StandardResponse(status=201, message="Console created Successfully.") 
         except Exception as e:
@@ -391,8 +389,7 @@ class ConsoleFFAssignAPI(SearchAndFilterMixin, PaginationMixin, APIView):
             console.console_status = ConsoleStatusChoices.FREIGHT_FORWARDER_ASSIGNED
             console.save(update_fields=["freight_forwarder","console_status"])
 
-            for consignment in consignments:
-                ConsignmentServices.notify_consignment_update(request.this_user,consignment)
+            ConsignmentServices.notify_consignments_update(request.this_user, consignments)
 
             # create_update_bol(console=console, consignments=consignments)
 
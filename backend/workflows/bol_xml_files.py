@@ -11,6 +11,7 @@ from django.conf import settings
 from django.utils import timezone
 from django.utils._os import safe_join
 from .services import BOLServices
+from .documents import ConsignmentDocuments, logo_base64, render_bol_pdf, write_xml
 from django.db.models import Subquery, OuterRef, Sum
 from collections import defaultdict
 
@@ -189,10 +190,7 @@ class BOLGenerateHTMLV2API(APIView):
             output_dir = os.path.join(settings.MEDIA_ROOT, 'bols')
             os.makedirs(output_dir, exist_ok=True)
 
-            logo_path = os.path.join(settings.BASE_DIR, 'static', 'aramexlogo.png')
-
-            with open(logo_path, 'rb') as img_file:
-                logo_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+            logo = logo_base64()
             
             html_outputs = []
             
@@ -200,7 +198,7 @@ class BOLGenerateHTMLV2API(APIView):
 
             # context = BOLServices.bol_context(consignment,serialized,logo_base64)
 
-            context = BOLServices.bol_context_data(consignment=consignment, logo_base64=logo_base64)
+            context = BOLServices.bol_context_data(consignment=consignment, logo_base64=logo)
             
             filename = f"bol_{consignment.consignment_id}.pdf"
             output_path = safe_join(output_dir, filename)
@@ -246,32 +244,37 @@ class ConsoleBOL(APIView):
             output_dir = os.path.join(settings.MEDIA_ROOT, 'bols')
             os.makedirs(output_dir, exist_ok=True)
 
-            logo_path = os.path.join(settings.BASE_DIR, 'static', 'aramexlogo.png')
-
-            with open(logo_path, 'rb') as img_file:
-                logo_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+            logo = logo_base64()
             
             html_outputs = []
             
             grouped = defaultdict(list)
 
             for c in consignments:
-                key = (c.supplier, c.consignor_address, c.delivery_address)
+                key = (c.supplier_id, c.consignor_address_id, c.delivery_address_id)
                 grouped[key].append(c)
 
+            # Every group's lines, packages and cost centers in one round of queries
+            documents = ConsignmentDocuments([c.pk for c in consignments])
+
             context = []
             for i, (key, value) in enumerate(grouped.items(), start=1):
                 data = BOLServices.console_bol_context_data(
                     consignments=value,
-                    logo_base64=logo_base64
+                    logo_base64=logo,
+                    documents=documents,
                 )
                 data["bill_of_lading_id"] = f"{console.console_id}-{i}"
                 context.append(data)
 
             filename = f"bol_{console.console_id}.pdf"
             output_path = safe_join(output_dir, filename)
-            html = render_to_html("multi_pdf_template.html", {"context" : context})   
-            html_outputs.append(html)         
+            if request.GET.get("format") == "pdf":
+                render_bol_pdf(context, output_path)
+                html_outputs.append(f"/media/bols/{filename}")
+            else:
+                html = render_to_html("multi_pdf_template.html", {"context" : context})   
+                html_outputs.append(html)         
 
             user = getattr(request, "this_user", None)
 
@@ -298,75 +301,8 @@ class ConsoleBOL(APIView):
 class XMLGenerateAPI(APIView):
 
     def to_representation(self, consignments):
-
-        representation = []
-        for consignment in consignments:
-            data = {}
-            data["bol_id"] = consignment.consignment_id
-            data["gl_code"] = consignment.gl_code or None
-            data["ship_from"] = {
-                "supplier_name" : consignment.supplier.name or None,
-                "address_line_1" : consignment.consignor_address.address_line_1 or None,
-                "address_line_2" : consignment.consignor_address.address_line_2 or None,
-                "city" : consignment.consignor_address.city or None,
-                "state" : consignment.consignor_address.state or None,
-                "zipcode" : consignment.consignor_address.zipcode or None,
-                "country" : consignment.consignor_address.country or None,
-            }
-
-            data["ship_to"] = {
-                "client_name" : consignment.client.name or None,
-                "address_line_1" : consignment.delivery_address.address_line_1 or None,
-                "address_line_2" : consignment.delivery_address.address_line_2 or None,
-                "city" : consignment.delivery_address.city or None,
-                "state" : consignment.delivery_address.state or None,
-                "zipcode" : consignment.delivery_address.zipcode or None,
-                "country" : consignment.delivery_address.country or None,
-            }
-            
-            po_lines = consignment.purchase_order_lines.all().select_related("purchase_order").distinct()
-            
-            # Subquery to sum allocated_qty per PO line for this consignment
-            allocated_qty_subquery = (
-                PackagingAllocation.objects
-                .filter(
-                    purchase_order_line_id=OuterRef("id"),
-                    consignment_packaging__consignment=consignment
-                )
-                .values("purchase_order_line_id")
-                .annotate(total_allocated=Sum("allocated_qty"))
-                .values("total_allocated")[:1]
-            )
-
-            # Query PO lines efficiently
-            po_line_values = (
-                po_lines
-                .annotate(allocated_qty=Subquery(allocated_qty_subquery))
-                .values(
-                    "reference_number",
-                    "customer_reference_number",
-                    "product_code",
-                    "description",
-                    "purchase_order__plant_id",
-                    "purchase_order__center_code",
-                    "allocated_qty",
-                )
-            )
-
-            # Compute cc_code in Python
-            po_line_data = []
-            for line in po_line_values:
-                cc_code = BOLServices.get_cc_code(
-                    line["purchase_order__plant_id"], 
-                    line["purchase_order__center_code"]
-                )
-                line["cc_code"] = cc_code
-                po_line_data.append(line)
-
-            data["po_lines"] = po_line_data
-            
-            representation.append(data)
-        return representation
+        documents = ConsignmentDocuments([consignment.pk for consignment in consignments])
+        return [documents.xml_bill_of_lading(consignment) for consignment in documents.consignments.values()]
     
 
     def get(self, request, console_id=None, *args, **kwargs):
@@ -378,12 +314,10 @@ class XMLGenerateAPI(APIView):
         # if console.console_status != ConsoleStatusChoices.DELIVERED:
         #     return StandardResponse(status=400, success=False, errors=["Console is not delivered hence, XML can't be generated"])
         
-        consignments = Consignment.objects.filter(console=console).select_related("supplier","client","consignor_address","delivery_address").prefetch_related("purchase_order_lines","console__freight_forwarder")
+        consignment_ids = list(Consignment.objects.filter(console=console).order_by("created_at").values_list("id", flat=True))
     
-        if not consignments.exists():
+        if not consignment_ids:
             return StandardResponse(status=404, success=False, errors=["No consignments found"])
-        
-        serialized_data = self.to_representation(consignments)
 
         
         # all_bols = BOL.objects.filter(console=console)
@@ -396,15 +330,13 @@ class XMLGenerateAPI(APIView):
         output_path = os.path.join(output_dir, filename)
         file_path = "/media/xml/"+filename
 
-        context = {
-            "bill_of_ladings": serialized_data
-        }
-        render_to_xml("xml_template.xml", context, output_path=output_path)
+        # Written a chunk of consignments at a time, never held whole in memory
+        write_xml(consignment_ids, output_path)
         
         # all_bols.update(is_bol_locked=True)
         xml = XML.objects.create(generated_by=request.this_user, file_path=file_path)
         
-        Consignment.objects.filter(console=console).update(xml=xml)
+        Consignment.objects.filter(console=console).update_without_audit(xml=xml)
         
         return StandardResponse(status=200, data=file_path)   
     
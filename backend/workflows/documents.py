@@ -0,0 +1,286 @@
+import base64
+import io
+import os
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from portal.models import CostCenterCode
+from operations.models import (
+    Consignment,
+    ConsignmentPOLine,
+    ConsignmentPackaging,
+    PackagingAllocation,
+)
+
+
+UNIT_MAP = {
+    "Millimeter": "mm",
+    "Centimeter": "cm",
+    "Inch": "In",
+    "Foot": "ft",
+    "Yard": "yd"
+}
+
+## Consignments loaded per round of queries when writing a console's XML
+XML_CHUNK_SIZE = 200
+
+
+@lru_cache(maxsize=None)
+def logo_base64():
+    """The BOL logo, read and encoded once per process."""
+    logo_path = os.path.join(settings.BASE_DIR, 'static', 'aramexlogo.png')
+    with open(logo_path, 'rb') as img_file:
+        return base64.b64encode(img_file.read()).decode('utf-8')
+
+
+def cost_center_codes(pairs):
+    """
+    {(plant_id, center_code): cc_code} for the given pairs in one query.
+    Several slocs can share a pair, the first one wins as in a .first() lookup.
+    """
+    pairs = {(plant_id, center_code) for plant_id, center_code in pairs if plant_id and center_code}
+    if not pairs:
+        return {}
+
+    codes = {}
+    rows = (
+        CostCenterCode.objects
+        .filter(plant_id__in={plant_id for plant_id, _ in pairs}, center_code__in={center_code for _, center_code in pairs})
+        .order_by("pk")
+        .values_list("plant_id", "center_code", "cc_code")
+    )
+    for plant_id, center_code, cc_code in rows:
+        if (plant_id, center_code) in pairs:
+            codes.setdefault((plant_id, center_code), cc_code)
+    return codes
+
+
+def _address(name, address):
+    return {
+        "name": name,
+        "address_name": address.address_name,
+        "address": address.address_line_1,
+        "address2": address.address_line_2,
+        "location": f"{address.city} / {address.state} / {address.zipcode}",
+        "lat_lon": f"{address.latitude} / {address.longitude}",
+    }
+
+
+def _dimensions(packaging_type):
+    unit = UNIT_MAP.get(packaging_type.dimension_unit, packaging_type.dimension_unit)
+    return f"{packaging_type.length} X {packaging_type.width} X {packaging_type.height} {unit}"
+
+
+class ConsignmentDocuments:
+    """
+    Everything the BOL and XML documents of a set of consignments read,
+    loaded in a fixed number of queries however many consignments, lines
+    and packages there are.
+    """
+
+    def __init__(self, consignment_ids):
+        consignment_ids = list(consignment_ids)
+
+        self.consignments = {
+            consignment.pk: consignment
+            for consignment in Consignment.objects.filter(pk__in=consignment_ids).select_related(
+                "supplier", "client", "consignor_address", "delivery_address", "console__freight_forwarder"
+            ).order_by("created_at")
+        }
+
+        self.po_lines = defaultdict(list)       ## consignment id -> [ConsignmentPOLine]
+        for consignment_line in (
+            ConsignmentPOLine.objects
+            .filter(consignment_id__in=consignment_ids)
+            .select_related("dg_class", "dg_category", "purchase_order_line__purchase_order")
+            .order_by("created_at")
+        ):
+            self.po_lines[consignment_line.consignment_id].append(consignment_line)
+
+        self.packages = defaultdict(list)       ## consignment id -> [ConsignmentPackaging]
+        for package in (
+            ConsignmentPackaging.objects
+            .filter(consignment_id__in=consignment_ids)
+            .select_related("packaging_type")
+            .order_by("package_id")
+        ):
+            self.packages[package.consignment_id].append(package)
+
+        self.allocations = defaultdict(list)    ## package id -> [(purchase_order_line_id, allocated_qty)]
+        for package_id, line_id, allocated_qty in (
+            PackagingAllocation.objects
+            .filter(consignment_packaging__consignment_id__in=consignment_ids)
+            .order_by("created_at")
+            .values_list("consignment_packaging_id", "purchase_order_line_id", "allocated_qty")
+        ):
+            self.allocations[package_id].append((line_id, allocated_qty))
+
+        self.cc_codes = cost_center_codes(
+            (line.purchase_order_line.purchase_order.plant_id, line.purchase_order_line.purchase_order.center_code)
+            for lines in self.po_lines.values() for line in lines
+        )
+
+    def cc_code(self, purchase_order):
+        return self.cc_codes.get((purchase_order.plant_id, purchase_order.center_code))
+
+    def bol_context(self, consignments, logo):
+        """
+        Context of one bill of lading covering `consignments` (grouped by
+        supplier and addresses), addresses and carrier from the first one.
+        """
+        from .services import BOLServices
+
+        consignments = [self.consignments[consignment.pk] for consignment in consignments]
+        consignment = consignments[0]
+
+        compliance_map = {}
+        for con in consignments:
+            for consignment_line in self.po_lines[con.pk]:
+                compliance_map[(con.pk, consignment_line.purchase_order_line_id)] = consignment_line
+
+        packages = []
+        for con in consignments:
+            for package in self.packages[con.pk]:
+                lines = []
+                for line_id, allocated_qty in self.allocations[package.pk]:
+                    compliance = compliance_map.get((con.pk, line_id))
+                    if not compliance:
+                        # Allocated to a line the consignment no longer carries
+                        continue
+                    line = compliance.purchase_order_line
+                    lines.append({
+                        "description": line.description,
+                        "sku_qty": allocated_qty,
+                        "dg_class": compliance.dg_class.name if compliance.dg_class else None,
+                        "dg_category": compliance.dg_category.name if compliance.dg_category else None,
+                        "cc_code": self.cc_code(line.purchase_order),
+                    })
+
+                packages.append({
+                    "summary": {
+                        "package_id": package.package_id,
+                        "package_type": package.packaging_type.package_type,
+                        "weight": package.weight,
+                        "weight_unit": package.weight_unit,
+                        "dimensions": _dimensions(package.packaging_type),
+                    },
+                    "lines": lines,
+                })
+
+        purchase_orders = sorted({
+            consignment_line.purchase_order_line.purchase_order.customer_reference_number
+            for con in consignments for consignment_line in self.po_lines[con.pk]
+        })
+        ff = consignment.console.freight_forwarder if consignment.console else None
+
+        return {
+            "logo_base64": logo,
+            "ship_from": _address(consignment.supplier.name, consignment.consignor_address),
+            "ship_to": _address(consignment.client.name, consignment.delivery_address),
+            "carrier_name": ff.name if ff else "-",
+            "scac": ff.scac if ff and ff.scac else "-",
+            "mc_dot": ff.mc_dot if ff and ff.mc_dot else "-",
+            "consignment_id": consignment.consignment_id,
+            "po_number": ", ".join(purchase_orders),
+            "gl_account": BOLServices.generate_gl_code(consignment),
+            "packages": packages,
+        }
+
+    def xml_bill_of_lading(self, consignment):
+        consignment = self.consignments[consignment.pk]
+
+        allocated = defaultdict(lambda: None)
+        for package in self.packages[consignment.pk]:
+            for line_id, allocated_qty in self.allocations[package.pk]:
+                allocated[line_id] = (allocated[line_id] or 0) + allocated_qty
+
+        po_lines = []
+        for consignment_line in self.po_lines[consignment.pk]:
+            line = consignment_line.purchase_order_line
+            po_lines.append({
+                "reference_number": line.reference_number,
+                "customer_reference_number": line.customer_reference_number,
+                "product_code": line.product_code,
+                "description": line.description,
+                "allocated_qty": allocated[line.pk],
+                "cc_code": self.cc_code(line.purchase_order),
+            })
+
+        consignor, delivery = consignment.consignor_address, consignment.delivery_address
+        return {
+            "bol_id": consignment.consignment_id,
+            "gl_code": consignment.gl_code or None,
+            "ship_from": {
+                "supplier_name": consignment.supplier.name or None,
+                "address_line_1": consignor.address_line_1 or None,
+                "address_line_2": consignor.address_line_2 or None,
+                "city": consignor.city or None,
+                "state": consignor.state or None,
+                "zipcode": consignor.zipcode or None,
+                "country": consignor.country or None,
+            },
+            "ship_to": {
+                "client_name": consignment.client.name or None,
+                "address_line_1": delivery.address_line_1 or None,
+                "address_line_2": delivery.address_line_2 or None,
+                "city": delivery.city or None,
+                "state": delivery.state or None,
+                "zipcode": delivery.zipcode or None,
+                "country": delivery.country or None,
+            },
+            "po_lines": po_lines,
+        }
+
+
+## -------- PDF --------
+
+def _render_pdf(template_src, context):
+    from xhtml2pdf import pisa
+
+    html = get_template(template_src).render(context)
+    output = io.BytesIO()
+    if pisa.CreatePDF(html, dest=output).err:
+        raise ValueError("Couldn't render the BOL PDF")
+    return output.getvalue()
+
+
+def render_bol_pdf(contexts, output_path, template_src="multi_pdf_template.html"):
+    """
+    Render each bill of lading of `contexts` as its own PDF and merge them
+    into `output_path` in order. Runs in the calling request: one document
+    at a time keeps xhtml2pdf's memory to a single bill of lading.
+    """
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for context in contexts:
+        writer.append(io.BytesIO(_render_pdf(template_src, {"context": [context]})))
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return output_path
+
+
+## -------- XML --------
+
+def write_xml(consignment_ids, output_path, template_src="xml_template.xml", bol_template_src="xml_bill_of_lading.xml"):
+    """
+    Write the inbound delivery XML of the consignments bill of lading by bill
+    of lading, loading XML_CHUNK_SIZE consignments at a time, so neither the
+    data nor the document is held in memory whole.
+    """
+    envelope = get_template(template_src).render({"bill_of_ladings": []})
+    head, tail = envelope.rsplit("</InboundDelivery>", 1)
+    bol_template = get_template(bol_template_src)
+    consignment_ids = list(consignment_ids)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(head)
+        for start in range(0, len(consignment_ids), XML_CHUNK_SIZE):
+            documents = ConsignmentDocuments(consignment_ids[start:start + XML_CHUNK_SIZE])
+            for consignment in documents.consignments.values():
+                f.write(bol_template.render({"bol": documents.xml_bill_of_lading(consignment)}))
+        f.write("</InboundDelivery>" + tail)
+    return output_path
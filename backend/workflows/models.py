@@ -2,6 +2,7 @@ from django.db import models
 from portal.base import BaseModel
 from portal.choices import ConsoleStatusChoices
 from django.core.files.storage import default_storage
+from portal.sequences import max_numeric_suffix, next_value
 
 
 class Console(BaseModel):
@@ -17,11 +18,9 @@ class Console(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.console_id:
-            console = Console.objects.all().order_by('-created_at')[:1].only('console_id')
-            if console.exists():
-                self.console_id = "CN{0:0=6d}".format(int(console.first().console_id[2:]) + 1) 
-            else:
-                self.console_id = "CN000001" 
+            self.console_id = "CN{0:0=6d}".format(
+                next_value('console', seed=lambda: max_numeric_suffix(Console.all_objects, 'console_id', 'CN'))
+            )
         return super().save(*args, **kwargs)
 
     class Meta:
@@ -91,11 +90,9 @@ class XML(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.xml_id:
-            xml = XML.objects.all().order_by('-created_at')[:1].only('xml_id')
-            if xml.exists():
-                self.xml_id = "XML{0:0=7d}".format(int(xml.first().xml_id[3:]) + 1) 
-            else:
-                self.xml_id = "XML0000001" 
+            self.xml_id = "XML{0:0=7d}".format(
+                next_value('xml', seed=lambda: max_numeric_suffix(XML.all_objects, 'xml_id', 'XML'))
+            )
         return super().save(*args, **kwargs)
 
     class Meta:
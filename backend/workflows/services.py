@@ -13,6 +13,7 @@ from portal.models import CostCenterCode
 from portal.choices import GLCodeChoices, PackageStatusChoices
 
 from workflows.models import Console
+from workflows.documents import ConsignmentDocuments
 from operations.models import (
     # PurchaseOrder,
     PurchaseOrderLine,
@@ -34,137 +35,7 @@ class BOLServices:
         Builds BOL context including both serialized BOL data (sku lines + packages)
         and consignment details like ship_from, ship_to, carrier info, etc.
         """
-        # --- Prefetch related data efficiently ---
-        po_lines = consignment.purchase_order_lines.select_related("purchase_order")
-        consignment_po_lines = (
-            ConsignmentPOLine.objects
-            .select_related("dg_class", "dg_category")
-            .filter(consignment=consignment)
-        )
-
-        package_qs = (
-            ConsignmentPackaging.objects
-            .filter(consignment=consignment)
-            .select_related("packaging_type", "consignment")
-        )
-
-        packaging_allocations = (
-            PackagingAllocation.objects
-            .filter(
-                consignment_packaging__consignment=consignment,
-                purchase_order_line__in=po_lines,
-            )
-            .select_related(
-                "consignment_packaging__packaging_type",
-                "purchase_order_line",
-            )
-            .distinct()
-        )
-
-        # --- Helper Maps ---
-        packaging_weight_map = {pkg.id: pkg.weight for pkg in package_qs}
-        compliance_map = {
-            (c.purchase_order_line.purchase_order.id, c.purchase_order_line.customer_reference_number): c
-            for c in consignment_po_lines
-        }
-
-        unit_map = {
-            "Millimeter": "mm",
-            "Centimeter": "cm",
-            "Inch": "In",
-            "Foot": "ft",
-            "Yard": "yd"
-        }
-
-        # --- SKU Data ---
-        package_line_map = defaultdict(list)
-
-        for pack in packaging_allocations:
-            line = pack.purchase_order_line
-            compliance = compliance_map.get(
-                (line.purchase_order.id, line.customer_reference_number)
-            )
-            packaging_type = pack.consignment_packaging.packaging_type
-            cc_code = BOLServices.get_cc_code(line.purchase_order.plant_id, line.purchase_order.center_code)
-
-            package_line_map[pack.consignment_packaging.package_id].append({
-                "description": line.description,
-                "sku_qty": pack.allocated_qty,
-                "dg_class": compliance.dg_class.name if compliance and compliance.dg_class else None,
-                "dg_category": compliance.dg_category.name if compliance and compliance.dg_category else None,
-                "cc_code": cc_code,
-            })
-
-        # --- Package Summary ---
-        dimension_summary = (
-            package_qs.values(
-                "packaging_type_id",
-                "packaging_type__package_type",
-                "packaging_type__length",
-                "packaging_type__width",
-                "packaging_type__height",
-                "packaging_type__dimension_unit",
-                "weight",
-                "weight_unit",
-                "package_id"
-            )
-            .annotate(count=Count("packaging_type_id"))
-        )
-
-        packages = []
-        for item in dimension_summary:
-            package_id = item["package_id"]
-            packages.append({
-                "summary": {
-                    "package_id": package_id,
-                    "package_type": item["packaging_type__package_type"],
-                    "weight": item["weight"],
-                    "weight_unit": item["weight_unit"],
-                    "dimensions": f"{item['packaging_type__length']} X {item['packaging_type__width']} X {item['packaging_type__height']} {unit_map.get(item['packaging_type__dimension_unit'], item['packaging_type__dimension_unit'])}",
-                },
-                "lines": package_line_map.get(package_id, []),
-            })
-
-
-
-        # --- Consignment Metadata ---
-        po_qs = po_lines.only("purchase_order").distinct()
-        purchase_orders = list(set([po.purchase_order.customer_reference_number for po in po_qs]))
-        ff = consignment.console.freight_forwarder
-
-        ship_from = {
-            "name": consignment.supplier.name,
-            "address_name": consignment.consignor_address.address_name,
-            "address": consignment.consignor_address.address_line_1,
-            "address2": consignment.consignor_address.address_line_2,
-            "location": f"{consignment.consignor_address.city} / {consignment.consignor_address.state} / {consignment.consignor_address.zipcode}",
-            "lat_lon": f"{consignment.consignor_address.latitude} / {consignment.consignor_address.longitude}",
-        }
-
-        ship_to = {
-            "name": consignment.client.name,
-            "address_name": consignment.delivery_address.address_name,
-            "address": consignment.delivery_address.address_line_1,
-            "address2": consignment.delivery_address.address_line_2,
-            "location": f"{consignment.delivery_address.city} / {consignment.delivery_address.state} / {consignment.delivery_address.zipcode}",
-            "lat_lon": f"{consignment.delivery_address.latitude} / {consignment.delivery_address.longitude}",
-        }
-
-        # --- Final Context ---
-        context = {
-            "logo_base64": logo_base64,
-            "ship_from": ship_from,
-            "ship_to": ship_to,
-            "carrier_name": ff.name if ff else "-",
-            "scac": ff.scac if ff and ff.scac else "-",
-            "mc_dot": ff.mc_dot if ff and ff.mc_dot else "-",
-            "consignment_id": consignment.consignment_id,
-            "po_number": ", ".join(purchase_orders) if purchase_orders else "",
-            "gl_account": BOLServices.generate_gl_code(consignment),
-            "packages": packages,
-        }
-
-        return context
+        return ConsignmentDocuments([consignment.pk]).bol_context([consignment], logo_base64)
 
 
 
@@ -388,147 +259,11 @@ class BOLServices:
 
     
     @classmethod
-    def console_bol_context_data(cls, consignments, logo_base64):
+    def console_bol_context_data(cls, consignments, logo_base64, documents=None):
         """
-        Builds BOL context including both serialized BOL data (sku lines + packages)
-        and consignment details like ship_from, ship_to, carrier info, etc.
+        Builds one BOL context for a group of consignments sharing supplier and
+        addresses. Pass `documents` preloaded for the whole console to render
+        all of its groups without querying per group.
         """
-
-        consignment_ids = [consignment.id for consignment in consignments]
-        consignment = consignments[0]
-
-        po_lines = (
-            PurchaseOrderLine.objects
-            .filter(consignments_po_lines__consignment_id__in=consignment_ids)
-            .distinct()
-        )
-
-        consignment_po_lines = (
-            ConsignmentPOLine.objects
-            .select_related("dg_class", "dg_category","purchase_order_line__purchase_order")
-            .filter(consignment_id__in=consignment_ids)
-        )
-
-        package_qs = (
-            ConsignmentPackaging.objects
-            .filter(consignment_id__in=consignment_ids)
-            .select_related("packaging_type", "consignment")
-        )
-
-        packaging_allocations = (
-            PackagingAllocation.objects
-            .filter(
-                consignment_packaging__consignment_id__in=consignment_ids,
-                purchase_order_line__in=po_lines,
-            )
-            .select_related(
-                "consignment_packaging__packaging_type",
-                "purchase_order_line",
-            )
-            .distinct()
-        )
-
-        # --- Helper Maps ---
-        packaging_weight_map = {pkg.id: pkg.weight for pkg in package_qs}
-        compliance_map = {
-            (c.purchase_order_line.purchase_order.id, c.purchase_order_line.customer_reference_number): c
-            for c in consignment_po_lines
-        }
-
-        unit_map = {
-            "Millimeter": "mm",
-            "Centimeter": "cm",
-            "Inch": "In",
-            "Foot": "ft",
-            "Yard": "yd"
-        }
-
-        # --- SKU Data ---
-        package_line_map = defaultdict(list)
-
-        for pack in packaging_allocations:
-            line = pack.purchase_order_line
-            compliance = compliance_map.get(
-                (line.purchase_order.id, line.customer_reference_number)
-            )
-            packaging_type = pack.consignment_packaging.packaging_type
-            cc_code = BOLServices.get_cc_code(line.purchase_order.plant_id, line.purchase_order.center_code)
-
-            package_line_map[pack.consignment_packaging.package_id].append({
-                "description": line.description,
-                "sku_qty": pack.allocated_qty,
-                "dg_class": compliance.dg_class.name if compliance and compliance.dg_class else None,
-                "dg_category": compliance.dg_category.name if compliance and compliance.dg_category else None,
-                "cc_code": cc_code,
-            })
-
-        # --- Package Summary ---
-        dimension_summary = (
-            package_qs.values(
-                "packaging_type_id",
-                "packaging_type__package_type",
-                "packaging_type__length",
-                "packaging_type__width",
-                "packaging_type__height",
-                "packaging_type__dimension_unit",
-                "weight",
-                "weight_unit",
-                "package_id"
-            )
-            .annotate(count=Count("packaging_type_id"))
-        )
-
-        packages = []
-        for item in dimension_summary:
-            package_id = item["package_id"]
-            packages.append({
-                "summary": {
-                    "package_id": package_id,
-                    "package_type": item["packaging_type__package_type"],
-                    "weight": item["weight"],
-                    "weight_unit": item["weight_unit"],
-                    "dimensions": f"{item['packaging_type__length']} X {item['packaging_type__width']} X {item['packaging_type__height']} {unit_map.get(item['packaging_type__dimension_unit'], item['packaging_type__dimension_unit'])}",
-                },
-                "lines": package_line_map.get(package_id, []),
-            })
-
-
-
-        # --- Consignment Metadata ---
-        po_qs = po_lines.only("purchase_order").distinct()
-        purchase_orders = list(set([po.purchase_order.customer_reference_number for po in po_qs]))
-        ff = consignment.console.freight_forwarder
-
-        ship_from = {
-            "name": consignment.supplier.name,
-            "address_name": consignment.consignor_address.address_name,
-            "address": consignment.consignor_address.address_line_1,
-            "address2": consignment.consignor_address.address_line_2,
-            "location": f"{consignment.consignor_address.city} / {consignment.consignor_address.state} / {consignment.consignor_address.zipcode}",
-            "lat_lon": f"{consignment.consignor_address.latitude} / {consignment.consignor_address.longitude}",
-        }
-
-        ship_to = {
-            "name": consignment.client.name,
-            "address_name": consignment.delivery_address.address_name,
-            "address": consignment.delivery_address.address_line_1,
-            "address2": consignment.delivery_address.address_line_2,
-            "location": f"{consignment.delivery_address.city} / {consignment.delivery_address.state} / {consignment.delivery_address.zipcode}",
-            "lat_lon": f"{consignment.delivery_address.latitude} / {consignment.delivery_address.longitude}",
-        }
-
-        # --- Final Context ---
-        context = {
-            "logo_base64": logo_base64,
-            "ship_from": ship_from,
-            "ship_to": ship_to,
-            "carrier_name": ff.name if ff else "-",
-            "scac": ff.scac if ff and ff.scac else "-",
-            "mc_dot": ff.mc_dot if ff and ff.mc_dot else "-",
-            "consignment_id": consignment.consignment_id,
-            "po_number": ", ".join(purchase_orders) if purchase_orders else "",
-            "gl_account": BOLServices.generate_gl_code(consignment),
-            "packages": packages,
-        }
-
-        return context
+        documents = documents or ConsignmentDocuments([consignment.pk for consignment in consignments])
+        return documents.bol_context(consignments, logo_base64)